@@ -2,4 +2,11 @@ from anatomizer.anatomizer_light import (fetch_gene_meta_data,
                                          fetch_canonical_sequence,
                                          fetch_gene_domains,
                                          get_interpro_entries,
-                                         get_uniprot_record)
+                                         get_uniprot_record,
+                                         set_cache,
+                                         get_cache,
+                                         set_rate_limit,
+                                         prefetch_gene_data,
+                                         discard_prefetched,
+                                         clear_prefetched)
+from anatomizer.cache import AnatomizerCache, CacheMissError
@@ -3,24 +3,183 @@ import os
 import json
 import requests
 import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib import request
 from urllib.error import HTTPError
 from time import sleep
 
-from anatomizer.utils import _merge_fragments, _nest_domains
+from anatomizer.utils import (_merge_fragments, _nest_domains,
+                              _overlapping_pairs)
 
 
+UNIPROT_BASE_URL = "https://www.uniprot.org/uniprot/{}.tab"
 INTERPRO_BASE_URL = "https://www.ebi.ac.uk:443/interpro/api/entry/InterPro/protein/UniProt/{}/?page_size=100"
 RESOURCES = os.path.join(os.path.dirname(__file__), 'resources')
 TYPES_SHORT_NAMES_FILE = "types_short_names.dat"
 
 
+DEFAULT_RATE_LIMIT = 10
+DEFAULT_PREFETCH_WORKERS = 8
+
+
+class RateLimiter(object):
+    """Limiter of the rate of requests shared by threads.
+
+    Attributes
+    ----------
+    rate : float
+        Maximal number of requests per second (if None, the rate
+        is not limited)
+    _next_slot : float
+        Time of the next request allowed by the limiter
+    _lock : threading.Lock
+    """
+
+    def __init__(self, rate=None):
+        """Initialize a rate limiter."""
+        self.rate = rate
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Wait until the next request is allowed."""
+        if self.rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        if slot > now:
+            sleep(slot - now)
+
+
+_cache = None
+_rate_limiter = RateLimiter(DEFAULT_RATE_LIMIT)
+_prefetched = dict()
+_prefetched_lock = threading.Lock()
+_PREFETCHED_RESOURCES = ["uniprot", "interpro"]
+
+
+def set_rate_limit(rate):
+    """Set the global limit of requests per second (None disables it)."""
+    _rate_limiter.rate = rate
+
+
+def set_cache(cache):
+    """Set the cache used by the fetchers (None disables caching).
+
+    Parameters
+    ----------
+    cache : anatomizer.cache.AnatomizerCache
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    """Get the cache used by the fetchers."""
+    return _cache
+
+
+def _cached(resource, key, fetcher):
+    """Get the prefetched or cached data, or fetch it."""
+    with _prefetched_lock:
+        if (resource, key) in _prefetched:
+            return _prefetched.pop((resource, key))
+    if _cache is None:
+        return fetcher()
+    return _cache.fetch(resource, key, fetcher)
+
+
+def prefetch_gene_data(uniprot_acs, workers=None):
+    """Fetch UniProt records and InterPro entries of genes concurrently.
+
+    The records are fetched by a pool of threads (the requests are
+    throttled by the global rate limiter, see `set_rate_limit`) and
+    are stored until they are consumed by `fetch_gene_meta_data` and
+    `fetch_gene_domains`, or discarded (see `discard_prefetched` and
+    `clear_prefetched`). Records that could not be fetched are not
+    stored (they are fetched again on consumption).
+
+    Parameters
+    ----------
+    uniprot_acs : iterable of str
+    workers : int, optional
+        Number of threads (by default, `DEFAULT_PREFETCH_WORKERS`)
+
+    Returns
+    -------
+    prefetched : set
+        Set of the UniProt ACs whose data was fetched
+    """
+    if workers is None:
+        workers = DEFAULT_PREFETCH_WORKERS
+    fetchers = {
+        "uniprot": get_uniprot_record,
+        "interpro": get_interpro_entries
+    }
+    with _prefetched_lock:
+        tasks = [
+            (resource, ac)
+            for ac in set(uniprot_acs) if ac is not None
+            for resource in _PREFETCHED_RESOURCES
+            if (resource, ac) not in _prefetched
+        ]
+    if len(tasks) == 0:
+        return set()
+
+    failed = set()
+    with ThreadPoolExecutor(min(workers, len(tasks))) as executor:
+        futures = {
+            executor.submit(fetchers[resource], ac): (resource, ac)
+            for resource, ac in tasks
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            if result is None:
+                failed.add(futures[future][1])
+                continue
+            with _prefetched_lock:
+                _prefetched[futures[future]] = result
+    return set(ac for _, ac in tasks if ac not in failed)
+
+
+def discard_prefetched(uniprot_acs):
+    """Remove the prefetched data of the genes that was not consumed."""
+    with _prefetched_lock:
+        for ac in uniprot_acs:
+            for resource in _PREFETCHED_RESOURCES:
+                _prefetched.pop((resource, ac), None)
+
+
+def clear_prefetched():
+    """Remove all the prefetched data that was not consumed."""
+    with _prefetched_lock:
+        _prefetched.clear()
+
+
 def get_uniprot_record(uniprot_ac, columns=None):
     """Get the raw UniProt record."""
-    url = 'https://www.uniprot.org/uniprot/' + uniprot_ac + '.tab'
+    key = uniprot_ac
+    if columns is not None:
+        key = "{}:{}".format(
+            uniprot_ac,
+            columns if isinstance(columns, str) else ",".join(columns))
+    return _cached(
+        "uniprot", key, lambda: _fetch_uniprot_record(uniprot_ac, columns))
+
+
+def _fetch_uniprot_record(uniprot_ac, columns=None):
+    url = UNIPROT_BASE_URL.format(uniprot_ac)
     params = None
     if columns is not None:
         params = {'columns': columns}
+    _rate_limiter.wait()
     data = requests.get(url, params=params)
     if data.status_code == 200:
         return data.text
@@ -30,6 +189,12 @@ def get_uniprot_record(uniprot_ac, columns=None):
 
 def get_interpro_entries(uniprot_ac):
     """Get the raw InterPro enties."""
+    return _cached(
+        "interpro", uniprot_ac,
+        lambda: _fetch_interpro_entries(uniprot_ac))
+
+
+def _fetch_interpro_entries(uniprot_ac):
     # disable SSL verification to avoid config issues
     context = ssl._create_unverified_context()
 
@@ -42,6 +207,7 @@ def get_interpro_entries(uniprot_ac):
         try:
             req = request.Request(
                 next_url, headers={"Accept": "application/json"})
+            _rate_limiter.wait()
             res = request.urlopen(req, context=context)
             # If the API times out due a long running query
             if res.status == 408:
@@ -128,12 +294,22 @@ def merge_raw_domains(raw_domains, overlap_threshold=0.8):
     }
     visited = set()
 
+    # Only overlapping domains can be merged (for a positive threshold)
+    adjacency = None
+    if overlap_threshold > 0:
+        adjacency = _overlapping_pairs(
+            [(d["start"], d["end"]) for d in raw_domains])
+
     for i, raw_domain1 in enumerate(raw_domains):
         if i not in visited:
             visited.add(i)
             start1 = raw_domain1["start"]
             end1 = raw_domain1["end"]
-            for j, raw_domain2 in enumerate(raw_domains):
+            candidates = range(len(raw_domains))
+            if adjacency is not None:
+                candidates = adjacency[i]
+            for j in candidates:
+                raw_domain2 = raw_domains[j]
                 if j not in visited:
                     start2 = raw_domain2["start"]
                     end2 = raw_domain2["end"]
@@ -0,0 +1,177 @@
+"""Persistent cache of the data fetched by the anatomizer.
+
+`AnatomizerCache`
+`CacheMissError`
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "kami", "anatomizer.sqlite")
+
+
+class CacheMissError(Exception):
+    """Error of a cache miss in the offline mode."""
+
+
+class AnatomizerCache(object):
+    """SQLite-backed cache of the data fetched from online resources.
+
+    Entries are keyed by the resource (e.g. 'uniprot' or 'interpro'),
+    the key of the entry (typically, the UniProt AC) and the version of
+    the resource. Entries older than the time-to-live are refetched and
+    the total size of the cached values is bounded by evicting the least
+    recently used entries.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite database (':memory:' for an in-memory cache)
+    ttl : float
+        Time-to-live of the entries in seconds (if None, the entries
+        never expire)
+    max_size : int
+        Maximal total size of the cached values in bytes (if None,
+        the size of the cache is not bounded)
+    offline : bool
+        If True, the data is served only from the cache (expired entries
+        included) and `CacheMissError` is raised on misses
+    versions : dict
+        Dictionary whose keys are the resources and whose values are
+        their versions (entries of other versions are not served)
+    _connection : sqlite3.Connection
+    _lock : threading.Lock
+    """
+
+    def __init__(self, path=None, ttl=None, max_size=None, offline=False,
+                 versions=None):
+        """Initialize an anatomizer cache."""
+        if path is None:
+            path = DEFAULT_CACHE_PATH
+        if path != ":memory:":
+            dirname = os.path.dirname(os.path.abspath(path))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        if versions is None:
+            versions = dict()
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.versions = versions
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "resource TEXT, key TEXT, version TEXT, value TEXT, "
+                "size INTEGER, created REAL, accessed REAL, "
+                "PRIMARY KEY (resource, key, version))")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed "
+                "ON entries (accessed)")
+
+    def _version(self, resource):
+        return str(self.versions.get(resource, ""))
+
+    def __len__(self):
+        """Get the number of the cached entries."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __contains__(self, resource_key):
+        """Test if a (resource, key) pair is cached and up-to-date."""
+        resource, key = resource_key
+        return self.get(resource, key) is not None
+
+    def get(self, resource, key):
+        """Get the cached value (None if not found or expired)."""
+        version = self._version(resource)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value, created FROM entries "
+                "WHERE resource = ? AND key = ? AND version = ?",
+                (resource, key, version)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if not self.offline and self.ttl is not None and\
+                    now - created > self.ttl:
+                return None
+            self._connection.execute(
+                "UPDATE entries SET accessed = ? "
+                "WHERE resource = ? AND key = ? AND version = ?",
+                (now, resource, key, version))
+        return json.loads(value)
+
+    def put(self, resource, key, value):
+        """Cache the value and evict the least recently used entries."""
+        data = json.dumps(value)
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (resource, key, self._version(resource), data, len(data),
+                 now, now))
+            if self.max_size is not None:
+                self._evict(self.max_size)
+
+    def _evict(self, max_size):
+        """Evict the least recently used entries exceeding the size."""
+        total_size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total_size <= max_size:
+            return
+        cursor = self._connection.execute(
+            "SELECT rowid, size FROM entries ORDER BY accessed")
+        to_remove = []
+        for rowid, size in cursor:
+            if total_size <= max_size:
+                break
+            to_remove.append((rowid,))
+            total_size -= size
+        self._connection.executemany(
+            "DELETE FROM entries WHERE rowid = ?", to_remove)
+
+    def fetch(self, resource, key, fetcher):
+        """Get the cached value or fetch (and cache) it.
+
+        Parameters
+        ----------
+        resource : str
+        key : str
+        fetcher : callable
+            Function without arguments fetching the value (values
+            fetched as None are not cached)
+
+        Raises
+        ------
+        CacheMissError
+            If the value is not cached and the cache is offline
+        """
+        value = self.get(resource, key)
+        if value is not None:
+            return value
+        if self.offline:
+            raise CacheMissError(
+                "Entry '{}' of '{}' is not cached (offline mode)".format(
+                    key, resource))
+        value = fetcher()
+        if value is not None:
+            self.put(resource, key, value)
+        return value
+
+    def clear(self):
+        """Remove all the cached entries."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+
+    def close(self):
+        """Close the connection to the database."""
+        self._connection.close()
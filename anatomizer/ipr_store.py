@@ -0,0 +1,255 @@
+"""Indexed on-disk store of the offline InterPro data of the anatomizer.
+
+The XML files of InterPro matches, InterPro signatures and HGNC mappings
+are imported once (by streaming, so that they are never held in memory)
+into an SQLite database whose indexed tables provide logarithmic-time
+lookups.
+
+`InterProStore`
+"""
+import gzip
+import os
+import sqlite3
+import threading
+
+from lxml import etree
+
+
+_SCHEMA = [
+    "CREATE TABLE proteins (id TEXT PRIMARY KEY, name TEXT)",
+    "CREATE INDEX proteins_name ON proteins (name)",
+    "CREATE TABLE matches ("
+    "protein TEXT, dbname TEXT, name TEXT, id TEXT, "
+    "ipr_id TEXT, ipr_parent_id TEXT, ipr_name TEXT, ipr_type TEXT, "
+    "start INTEGER, end INTEGER)",
+    "CREATE INDEX matches_protein ON matches (protein)",
+    "CREATE TABLE signatures ("
+    "id TEXT PRIMARY KEY, short_name TEXT, name TEXT, parent TEXT)",
+    "CREATE TABLE mappings ("
+    "entry INTEGER PRIMARY KEY, uniprot_ac TEXT, hgnc_symbol TEXT, "
+    "hgnc_id TEXT)",
+    "CREATE INDEX mappings_uniprot_ac ON mappings (uniprot_ac)",
+    "CREATE INDEX mappings_hgnc_symbol ON mappings (hgnc_symbol)",
+    "CREATE TABLE synonyms (entry INTEGER, synonym TEXT)",
+    "CREATE INDEX synonyms_entry ON synonyms (entry)",
+    "CREATE TABLE isoforms ("
+    "entry INTEGER, id TEXT, length INTEGER, type TEXT)",
+    "CREATE INDEX isoforms_entry ON isoforms (entry)"
+]
+
+
+def _iter_elements(filename, tag):
+    """Stream the top-level elements with the tag from a gzipped XML."""
+    with gzip.open(filename, "rb") as f:
+        for _, element in etree.iterparse(f, events=("end",), tag=tag):
+            yield element
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def _int_or_none(value):
+    return int(value) if value is not None else None
+
+
+class InterProStore(object):
+    """Indexed on-disk store of InterPro matches, signatures and mappings.
+
+    Attributes
+    ----------
+    path : str
+        Path to the SQLite database of the store
+    _connection : sqlite3.Connection
+    _lock : threading.Lock
+    """
+
+    def __init__(self, path):
+        """Open an existing store."""
+        if not os.path.isfile(path):
+            raise ValueError(
+                "InterPro store '{}' does not exist".format(path))
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+    @classmethod
+    def build(cls, path, matches_file, signatures_file, mappings_file):
+        """Import the gzipped XML files into a new store.
+
+        Parameters
+        ----------
+        path : str
+            Path to the database to create (the database is written to
+            a temporary file and moved to the path once complete)
+        matches_file : str
+            InterPro matches of the proteins (`protein` elements)
+        signatures_file : str
+            InterPro signatures (`interpro` elements)
+        mappings_file : str
+            Mapping of UniProt ACs to HGNC symbols (`entry` elements)
+        """
+        tmp_path = path + ".tmp"
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            with connection:
+                for statement in _SCHEMA:
+                    connection.execute(statement)
+
+                for protein in _iter_elements(matches_file, "protein"):
+                    protein_id = protein.get("id")
+                    connection.execute(
+                        "INSERT OR IGNORE INTO proteins VALUES (?, ?)",
+                        (protein_id, protein.get("name")))
+                    rows = []
+                    for match in protein.findall("match"):
+                        ipr = match.find("ipr")
+                        if ipr is None:
+                            ipr = dict()
+                        lcn = match.find("lcn")
+                        if lcn is None:
+                            lcn = dict()
+                        rows.append((
+                            protein_id, match.get("dbname"),
+                            match.get("name"), match.get("id"),
+                            ipr.get("id"), ipr.get("parent_id"),
+                            ipr.get("name"), ipr.get("type"),
+                            _int_or_none(lcn.get("start")),
+                            _int_or_none(lcn.get("end"))
+                        ))
+                    connection.executemany(
+                        "INSERT INTO matches VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+                for signature in _iter_elements(signatures_file, "interpro"):
+                    connection.execute(
+                        "INSERT OR IGNORE INTO signatures VALUES (?, ?, ?, ?)",
+                        (signature.get("id"), signature.get("short_name"),
+                         signature.get("name"), signature.get("parent")))
+
+                for i, entry in enumerate(
+                        _iter_elements(mappings_file, "entry")):
+                    connection.execute(
+                        "INSERT INTO mappings VALUES (?, ?, ?, ?)",
+                        (i, entry.get("uniprot_ac"),
+                         entry.get("hgnc_symbol"), entry.get("hgnc_id")))
+                    connection.executemany(
+                        "INSERT INTO synonyms VALUES (?, ?)",
+                        [(i, s.text) for s in entry.findall("synonym")])
+                    connection.executemany(
+                        "INSERT INTO isoforms VALUES (?, ?, ?, ?)",
+                        [
+                            (i, iso.find("id").text,
+                             int(iso.find("length").text),
+                             iso.find("type").text)
+                            for iso in entry.findall("isoform")
+                        ])
+        finally:
+            connection.close()
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def _query(self, statement, parameters):
+        with self._lock:
+            return self._connection.execute(
+                statement, parameters).fetchall()
+
+    def has_protein(self, protein_id):
+        """Test if the protein (UniProt AC or isoform) has matches."""
+        return len(self._query(
+            "SELECT 1 FROM proteins WHERE id = ?", (protein_id,))) > 0
+
+    def get_protein_name(self, protein_id):
+        """Get the UniProt ID of the protein (None if not found)."""
+        rows = self._query(
+            "SELECT name FROM proteins WHERE id = ?", (protein_id,))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_protein_by_name(self, name):
+        """Get the UniProt AC of the protein by its UniProt ID."""
+        rows = self._query(
+            "SELECT id FROM proteins WHERE name = ? ORDER BY rowid LIMIT 1",
+            (name,))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_matches(self, protein_id):
+        """Get the list of InterPro matches of the protein.
+
+        Returns
+        -------
+        matches : list of dict
+            Matches in the order of the source file, with the keys
+            'dbname', 'name', 'id', 'ipr_id', 'ipr_parent_id', 'ipr_name',
+            'ipr_type', 'start' and 'end' (`ipr_id` is None for the
+            matches not integrated in InterPro)
+        """
+        keys = [
+            "dbname", "name", "id", "ipr_id", "ipr_parent_id",
+            "ipr_name", "ipr_type", "start", "end"
+        ]
+        rows = self._query(
+            "SELECT {} FROM matches WHERE protein = ? ORDER BY rowid".format(
+                ", ".join(keys)),
+            (protein_id,))
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get_signature(self, ipr_id):
+        """Get the signature of the InterPro entry (None if not found).
+
+        Returns
+        -------
+        signature : dict
+            Dictionary with the keys 'short_name', 'name' and 'parent'
+        """
+        rows = self._query(
+            "SELECT short_name, name, parent FROM signatures WHERE id = ?",
+            (ipr_id,))
+        if len(rows) == 0:
+            return None
+        return dict(zip(["short_name", "name", "parent"], rows[0]))
+
+    def _get_mapping(self, column, value):
+        rows = self._query(
+            "SELECT entry, uniprot_ac, hgnc_symbol, hgnc_id FROM mappings "
+            "WHERE {} = ? ORDER BY entry LIMIT 1".format(column),
+            (value,))
+        if len(rows) == 0:
+            return None
+        entry, uniprot_ac, hgnc_symbol, hgnc_id = rows[0]
+        return {
+            "uniprot_ac": uniprot_ac,
+            "hgnc_symbol": hgnc_symbol,
+            "hgnc_id": hgnc_id,
+            "synonyms": [
+                s for s, in self._query(
+                    "SELECT synonym FROM synonyms WHERE entry = ? "
+                    "ORDER BY rowid", (entry,))
+            ],
+            "isoforms": [
+                dict(zip(["id", "length", "type"], row))
+                for row in self._query(
+                    "SELECT id, length, type FROM isoforms WHERE entry = ? "
+                    "ORDER BY rowid", (entry,))
+            ]
+        }
+
+    def get_mapping_by_uniprot(self, uniprot_ac):
+        """Get the HGNC mapping of the UniProt AC (None if not found).
+
+        Returns
+        -------
+        mapping : dict
+            Dictionary with the keys 'uniprot_ac', 'hgnc_symbol',
+            'hgnc_id', 'synonyms' and 'isoforms' (list of dictionaries
+            with the keys 'id', 'length' and 'type')
+        """
+        return self._get_mapping("uniprot_ac", uniprot_ac)
+
+    def get_mapping_by_hgnc_symbol(self, hgnc_symbol):
+        """Get the HGNC mapping of the HGNC symbol (None if not found)."""
+        return self._get_mapping("hgnc_symbol", hgnc_symbol)
+
+    def close(self):
+        """Close the connection to the database."""
+        self._connection.close()
@@ -11,12 +11,13 @@ import copy
 import json
 import requests
 import warnings
-import gzip
 import time
 import urllib.request
 from xml.dom import minidom
 import lxml.html
-from lxml import etree
+
+from anatomizer.ipr_store import InterProStore
+from anatomizer.utils import _group_fragments, _overlapping_pairs
 
 
 # Paths and filenames.
@@ -25,8 +26,9 @@ REMOTE_IPR_DIR = 'anatomizer_ipr_files'
 IPR_VERFILE = 'ipr_version.txt'
 # Database addresses.
 ENSEMBL_SERVER = 'http://rest.ensembl.org'
-# Global variable
+# Global variables
 ipr_loaded = False
+ipr_store = None
 
 
 class AnatomizerError(Exception):
@@ -322,10 +324,13 @@ def fetch_ipr_new_ver(remote_dir, version, local_dir=RESOURCES):
 
 
 def interpro_load(local_dir=RESOURCES):
-    """Load InterPro and mapping files as global variables."""
-    global ipr_matches_root
-    global ipr_signatures_root
-    global hgnc_symbols_root
+    """Load InterPro and mapping files as global variables.
+
+    The files are imported once into an indexed on-disk store
+    (see `anatomizer.ipr_store.InterProStore`), the subsequent
+    loads of the same version open the existing store.
+    """
+    global ipr_store
     global ipr_loaded
 
     ipr_version = check_local_ver(local_dir)
@@ -337,7 +342,13 @@ def interpro_load(local_dir=RESOURCES):
         # )
         ipr_loaded = False
     else:
-        print('Loading InterPro Data version %i' % ipr_version)
+        IPR_STORE = '%s/ipr_store-%i.sqlite' % (local_dir, ipr_version)
+        if os.path.isfile(IPR_STORE):
+            ipr_store = InterProStore(IPR_STORE)
+            ipr_loaded = True
+            return
+
+        print('Importing InterPro Data version %i' % ipr_version)
 
         IPR_MATCHES = '%s/ipr_reviewed_human_match-%i.xml.gz' % (local_dir,
                                                                  ipr_version)
@@ -346,15 +357,8 @@ def interpro_load(local_dir=RESOURCES):
         HGNC_SYMBOLS = '%s/refs_mapping-%i.xml.gz' % (local_dir,
                                                       ipr_version)
 
-        # Read InterPro matched (IPR_MATCHES) and keep them in memory.
-        ipr_matches = gzip.open(IPR_MATCHES, 'r').read()
-        ipr_matches_root = etree.fromstring(ipr_matches)
-        # Read InterPro signatures (IPR_SIGNATURES).
-        ipr_signatures = gzip.open(IPR_SIGNATURES, 'r').read()
-        ipr_signatures_root = etree.fromstring(ipr_signatures)
-        # Read HGNC Symbols and isoforms (HGNC_SYMBOLS).
-        hgnc_symbols = gzip.open(HGNC_SYMBOLS, 'r').read()
-        hgnc_symbols_root = etree.fromstring(hgnc_symbols)
+        ipr_store = InterProStore.build(
+            IPR_STORE, IPR_MATCHES, IPR_SIGNATURES, HGNC_SYMBOLS)
 
         ipr_loaded = True
 
@@ -644,44 +648,38 @@ def get_ipr_features(selected_ac, canon):
     else:
         search_ac = selected_ac
     if ipr_loaded:
-        entry = ipr_matches_root.find("protein[@id='%s']" % search_ac)
-        if entry is not None:
-            matchlist = entry.findall('match')
+        if ipr_store.has_protein(search_ac):
+            matchlist = ipr_store.get_matches(search_ac)
             for feature in matchlist:
-                if feature.get('dbname') not in ignorelist:
+                if feature['dbname'] not in ignorelist:
                     # Check if domain is intergrated in InterPro. Ignore otherwise.
-                    ipr = feature.find('ipr')
-                    try:
-                        interpro_id = ipr.get('id')
-                        integrated = True
-                    except:
-                        integrated = False
+                    interpro_id = feature['ipr_id']
+                    integrated = interpro_id is not None
+                    # Ignore matches without location.
+                    located = feature['start'] is not None and\
+                        feature['end'] is not None
 
                     # If domain has InterPro ID, add as feature.
-                    if integrated:
+                    if integrated and located:
 
                         feature_dict = {}
-                        feature_dict['xname'] = feature.get('name')
-                        feature_dict['xid'] = feature.get('id')
-                        feature_dict['xdatabase'] = feature.get('dbname')
+                        feature_dict['xname'] = feature['name']
+                        feature_dict['xid'] = feature['id']
+                        feature_dict['xdatabase'] = feature['dbname']
 
                         feature_dict['ipr_id'] = interpro_id
-                        try:
-                            ipr_parent = ipr.get('parent_id')
-                        except:
-                            ipr_parent = None
+                        ipr_parent = feature['ipr_parent_id']
                         feature_dict['ipr_parents'] = parent_chain(ipr_parent)
 
-                        feature_dict['ipr_name'] = ipr.get('name')
+                        feature_dict['ipr_name'] = feature['ipr_name']
 
                         # Get short name from file interpro.xml.
                         short_name = find_shortname(feature_dict['ipr_id'])
                         feature_dict['short_name'] = short_name
-                        feature_dict['feature_type'] = ipr.get('type')
+                        feature_dict['feature_type'] = feature['ipr_type']
 
-                        lcn = feature.find('lcn')
-                        start = int(lcn.get('start'))
-                        end = int(lcn.get('end'))
+                        start = feature['start']
+                        end = feature['end']
                         length = end - start
                         feature_dict['start'] = start
                         feature_dict['end'] = end
@@ -696,8 +694,8 @@ def get_ipr_features(selected_ac, canon):
 
 def find_shortname(ipr):
     """ Find the short name associated with an InterPro ID. """
-    ipr_entry = ipr_signatures_root.find("interpro[@id='%s']" % ipr)
-    shortname = ipr_entry.get('short_name')
+    ipr_entry = ipr_store.get_signature(ipr)
+    shortname = ipr_entry['short_name']
 
     return shortname
 
@@ -712,11 +710,11 @@ def parent_chain(parent):
         if parent != 'None':
             parchain.append(parent)
         # Find the entry of that parent
-        ipr_entry = ipr_signatures_root.find("interpro[@id='%s']" % parent)
+        ipr_entry = ipr_store.get_signature(parent)
         # Redefine parent as the parent of the previous parent.
-        try:
-            parent = ipr_entry.get('parent')
-        except:
+        if ipr_entry is not None:
+            parent = ipr_entry['parent']
+        else:
             parent = None
 
     return parchain
@@ -852,9 +850,9 @@ def propose_name_label(ipr_list):
     if custom_found is False:
         # Take the root of the InterPro branch.
         interpro_id = longest_branch[-1]
-        ipr_entry = ipr_signatures_root.find("interpro[@id='%s']" % interpro_id)
-        ipr_short_name = ipr_entry.get('short_name')
-        ipr_name = ipr_entry.get('name')
+        ipr_entry = ipr_store.get_signature(interpro_id)
+        ipr_short_name = ipr_entry['short_name']
+        ipr_name = ipr_entry['name']
         # List of strings to remove from names.
         name_rm_strings = [" domain", "-domain"]
         tmp_name = ipr_name
@@ -1173,32 +1171,20 @@ class GeneAnatomy:
     """Implements gene anatomy."""
 
     def _merge_fragments(self, fragments, overlap_threshold=0.7, shortest=False):
-        nfeatures = len(fragments)
         ipr_overlap_threshold = 0.0001
 
-        visited = set()
-        groups = []
-
-        for i in range(nfeatures):
-            feature1 = fragments[i]
-            if i not in visited:
-                group = [feature1]
-                visited.add(i)
-                # for j in range(i + 1, nfeatures):
-                j = 0
-                while j < nfeatures:
-                    if j not in visited:
-                        feature2 = fragments[j]
-                        for member in group:
-                            overlap = _merge_overlap(member, feature2)
-                            condition = are_parents(member, feature2)
-                            if condition is True and overlap >= ipr_overlap_threshold:
-                                group.append(feature2)
-                                visited.add(j)
-                                j = -1  # Restart from the beginning of fragments
-                                break
-                    j += 1
-                groups.append(group)
+        def _related(i, j):
+            return (
+                are_parents(fragments[i], fragments[j]) is True and
+                _merge_overlap(
+                    fragments[i], fragments[j]) >= ipr_overlap_threshold
+            )
+
+        groups = [
+            [fragments[i] for i in group]
+            for group in _group_fragments(
+                [(f.start, f.end) for f in fragments], _related)
+        ]
         domains = []
         # create domains from groups
         for group in groups:
@@ -1270,13 +1256,21 @@ class GeneAnatomy:
     def _nest_domains(self, nest_threshold=0.7, max_level=1):
 
         def _find_nests(elements, domains):
+            # Only overlapping domains can be nested (for a positive threshold)
+            adjacency = None
+            if nest_threshold > 0:
+                adjacency = _overlapping_pairs(
+                    [(domains[i].start, domains[i].end) for i in elements])
             visited = set()
             result_nest = dict()
-            for i in elements:
+            for k, i in enumerate(elements):
                 if i not in visited:
                     result_nest[i] = dict()
                     visited.add(i)
-                    for j in elements:
+                    candidates = elements
+                    if adjacency is not None:
+                        candidates = [elements[l] for l in adjacency[k]]
+                    for j in candidates:
                         if j not in visited:
                             overlap = _nest_overlap(
                                 domains[i],
@@ -1384,12 +1378,12 @@ class GeneAnatomy:
         elif ipr_loaded:
             # Find proper entry according to query,
             # which can be a UniProt AC or HGNC symbol.
-            entry = ipr_matches_root.find("protein[@id='%s']" % query)
+            entry = ipr_store.has_protein(query)
 
             # First case possible: query is directly found as UniProt AC.
             # That means query is either the generic AC or a specific
             # secondary isoform.
-            if entry is not None:
+            if entry:
                 try:  # If there is a dash, query is a secondary isoform.
                     dash = query.index('-')
                     self.uniprot_ac = query[:dash]
@@ -1404,9 +1398,7 @@ class GeneAnatomy:
                 try:
                     dash = query.index('-')
                     self.uniprot_ac = query[:dash]
-                    mod_entry = ipr_matches_root.find("protein[@id='%s']"
-                                                      % self.uniprot_ac)
-                    if mod_entry is not None:
+                    if ipr_store.has_protein(self.uniprot_ac):
                         self.selected_iso = 'canonical'
                         self.found = True
                 except:
@@ -1416,30 +1408,23 @@ class GeneAnatomy:
             # try to find corresponding HGNC symbol and ID.
             if self.found:
                 # print('Query "%s" found as UniProt accession.' % query)
-                try:
-                    mapping = hgnc_symbols_root.find("entry[@uniprot_ac='%s']"
-                                                     % self.uniprot_ac)
-                    self.hgnc_symbol = mapping.get("hgnc_symbol")
-                    self.hgnc_id = mapping.get("hgnc_id")
-                except:
+                mapping = ipr_store.get_mapping_by_uniprot(self.uniprot_ac)
+                if mapping is not None:
+                    self.hgnc_symbol = mapping["hgnc_symbol"]
+                    self.hgnc_id = mapping["hgnc_id"]
+                else:
                     self.hgnc_symbol = None
                     self.hgnc_id = None
                 # Also find the UniProt ID.
-                try:
-                    mod_entry2 = ipr_matches_root.find("protein[@id='%s']"
-                                                       % self.uniprot_ac)
-                    self.uniprot_id = mod_entry2.get("name")
-                except:
-                    self.uniprot_id = None
+                self.uniprot_id = ipr_store.get_protein_name(self.uniprot_ac)
 
             # Third case possible: query is a HGNC symbol.
-            if entry is None and not self.found:
+            if not entry and not self.found:
                 try:
-                    mapping = hgnc_symbols_root.find("entry[@hgnc_symbol='%s']"
-                                                     % query)
-                    self.uniprot_ac = mapping.get("uniprot_ac")
-                    self.hgnc_symbol = mapping.get("hgnc_symbol")
-                    self.hgnc_id = mapping.get("hgnc_id")
+                    mapping = ipr_store.get_mapping_by_hgnc_symbol(query)
+                    self.uniprot_ac = mapping["uniprot_ac"]
+                    self.hgnc_symbol = mapping["hgnc_symbol"]
+                    self.hgnc_id = mapping["hgnc_id"]
                     self.selected_iso = 'canonical'
                     # print('Query "%s" found as HGNC symbol.' % query)
                     # print('Corresponding UniProt accession "%s".' % self.uniprot_ac)
@@ -1453,16 +1438,14 @@ class GeneAnatomy:
                     self.found = None
 
             # Fourth case possible: query is a UniProt ID.
-            if entry is None and not self.found:
+            if not entry and not self.found:
                 try:
-                    entry2 = ipr_matches_root.find("protein[@name='%s']"
-                                                   % query)
-                    self.uniprot_ac = entry2.get("id")
+                    self.uniprot_ac = ipr_store.get_protein_by_name(query)
                     self.uniprot_id = query
-                    mapping = hgnc_symbols_root.find("entry[@uniprot_ac='%s']"
-                                                     % self.uniprot_ac)
-                    self.hgnc_symbol = mapping.get("hgnc_symbol")
-                    self.hgnc_id = mapping.get("hgnc_id")
+                    mapping = ipr_store.get_mapping_by_uniprot(
+                        self.uniprot_ac)
+                    self.hgnc_symbol = mapping["hgnc_symbol"]
+                    self.hgnc_id = mapping["hgnc_id"]
                     self.selected_iso = 'canonical'
                     self.found = True
                 except:
@@ -1492,18 +1475,10 @@ class GeneAnatomy:
             self.synonyms = []
             self.isoforms = []
             if self.found and self.uniprot_ac is not None:
-                mapping = hgnc_symbols_root.find("entry[@uniprot_ac='%s']"
-                                                 % self.uniprot_ac)
-                syns = mapping.findall("synonym")
-                for syn in syns:
-                    self.synonyms.append(syn.text)
+                mapping = ipr_store.get_mapping_by_uniprot(self.uniprot_ac)
+                self.synonyms.extend(mapping["synonyms"])
                 # Will need to incorporate that in ProteinAnatomy.
-                isos = mapping.findall("isoform")
-                for iso in isos:
-                    iso_dict = {}
-                    iso_dict["id"] = iso.find("id").text
-                    iso_dict["length"] = int(iso.find("length").text)
-                    iso_dict["type"] = iso.find("type").text
+                for iso_dict in mapping["isoforms"]:
                     self.isoforms.append(iso_dict)
                     if iso_dict["type"] == 'canonical':
                         self.canonical = iso_dict["id"]
@@ -1,4 +1,5 @@
 """Collection of utils for anatomizer."""
+import heapq
 
 
 def find_shortname(ipr_id, filepath):
@@ -14,6 +15,80 @@ def find_shortname(ipr_id, filepath):
     return result
 
 
+def _overlapping_pairs(intervals):
+    """Find the pairs of overlapping intervals by a sweep line.
+
+    Two intervals overlap if the highest of their starts is lower than
+    the lowest of their ends (as in `_merge_overlap`).
+
+    Parameters
+    ----------
+    intervals : list of (start, end)
+
+    Returns
+    -------
+    adjacency : list of lists
+        Sorted indices of the intervals overlapping every interval
+    """
+    adjacency = [[] for _ in intervals]
+    order = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    # Heap of the ends (and indices) of the intervals started so far
+    active = []
+    for i in order:
+        start, end = intervals[i]
+        while len(active) > 0 and active[0][0] <= start:
+            heapq.heappop(active)
+        if start < end:
+            for _, j in active:
+                adjacency[i].append(j)
+                adjacency[j].append(i)
+            heapq.heappush(active, (end, i))
+    for neighbours in adjacency:
+        neighbours.sort()
+    return adjacency
+
+
+def _group_fragments(intervals, related):
+    """Group overlapping fragments connected by the relation.
+
+    Groups are the connected components of the graph of the pairs of
+    overlapping related fragments. Every group is started from the first
+    fragment not grouped yet and is extended by the first fragment
+    related to one of its members (the order of the members is the same
+    as if the fragments were scanned from the beginning every time
+    a fragment joins the group).
+
+    Parameters
+    ----------
+    intervals : list of (start, end)
+        Locations of the fragments
+    related : callable
+        Symmetric relation on the indices of two overlapping fragments
+
+    Returns
+    -------
+    groups : list of lists
+        Indices of the fragments in the groups
+    """
+    adjacency = _overlapping_pairs(intervals)
+    visited = set()
+    groups = []
+    for i in range(len(intervals)):
+        if i not in visited:
+            group = []
+            frontier = [i]
+            while len(frontier) > 0:
+                member = heapq.heappop(frontier)
+                if member not in visited:
+                    visited.add(member)
+                    group.append(member)
+                    for j in adjacency[member]:
+                        if j not in visited and related(member, j):
+                            heapq.heappush(frontier, j)
+            groups.append(group)
+    return groups
+
+
 def _merge_overlap(f1, f2):
     """Calculate overlap ratio.
 
@@ -94,32 +169,20 @@ def are_parents(frag1, frag2):
 
 
 def _merge_fragments(fragments, overlap_threshold=0.7, shortest=False):
-        nfeatures = len(fragments)
         ipr_overlap_threshold = 0.0001
 
-        visited = set()
-        groups = []
+        def _related(i, j):
+            return (
+                are_parents(fragments[i], fragments[j]) is True and
+                _merge_overlap(
+                    fragments[i], fragments[j]) >= ipr_overlap_threshold
+            )
 
-        for i in range(nfeatures):
-            feature1 = fragments[i]
-            if i not in visited:
-                group = [feature1]
-                visited.add(i)
-                # for j in range(i + 1, nfeatures):
-                j = 0
-                while j < nfeatures:
-                    if j not in visited:
-                        feature2 = fragments[j]
-                        for member in group:
-                            overlap = _merge_overlap(member, feature2)
-                            condition = are_parents(member, feature2)
-                            if condition is True and overlap >= ipr_overlap_threshold:
-                                group.append(feature2)
-                                visited.add(j)
-                                j = -1  # Restart from the beginning of fragments
-                                break
-                    j += 1
-                groups.append(group)
+        groups = [
+            [fragments[i] for i in group]
+            for group in _group_fragments(
+                [(f["start"], f["end"]) for f in fragments], _related)
+        ]
         domains = []
         # create domains from groups
         for group in groups:
@@ -192,13 +255,21 @@ def _merge_fragments(fragments, overlap_threshold=0.7, shortest=False):
 def _nest_domains(domains, nest_threshold=0.7, max_level=1):
 
     def _find_nests(elements, domains):
+        # Only overlapping domains can be nested (for a positive threshold)
+        adjacency = None
+        if nest_threshold > 0:
+            adjacency = _overlapping_pairs(
+                [(domains[i]["start"], domains[i]["end"]) for i in elements])
         visited = set()
         result_nest = dict()
-        for i in elements:
+        for k, i in enumerate(elements):
             if i not in visited:
                 result_nest[i] = dict()
                 visited.add(i)
-                for j in elements:
+                candidates = elements
+                if adjacency is not None:
+                    candidates = [elements[l] for l in adjacency[k]]
+                for j in candidates:
                     if j not in visited:
                         overlap = _nest_overlap(
                             domains[i],
@@ -0,0 +1,104 @@
+"""Benchmark of merging and nesting of domains in the anatomizer.
+
+Synthetic dense-domain inputs (a titin-like protein covered by hundreds
+of overlapping InterPro matches) are merged and nested on sorted
+intervals, and the times are compared with the exhaustive pairwise
+scans that were used before (the scan of fragments restarting every
+time a fragment joins a group).
+
+Usage: python benchmarks/domain_merging_benchmark.py [n_matches ...]
+"""
+import copy
+import random
+import sys
+import time
+
+from anatomizer.anatomizer_light import merge_raw_domains
+from anatomizer.utils import (_merge_fragments, _nest_domains,
+                              _merge_overlap, are_parents)
+
+
+PROTEIN_LENGTH = 35000
+IPR_PARENTS = {
+    "IPR003599": [],
+    "IPR003598": ["IPR003599"],
+    "IPR013783": [],
+    "IPR007110": ["IPR013783"],
+    "IPR003961": []
+}
+
+
+def generate_fragments(n_matches, seed=0):
+    """Generate dense InterPro matches along a long protein."""
+    rng = random.Random(seed)
+    fragments = []
+    for i in range(n_matches):
+        # Matches are concentrated in repeated clusters
+        center = rng.randint(0, 80) * (PROTEIN_LENGTH // 80)
+        start = max(1, center + rng.randint(-150, 150))
+        end = start + rng.randint(40, 400)
+        ipr_id = rng.choice(sorted(IPR_PARENTS))
+        fragments.append({
+            "start": start,
+            "end": end,
+            "length": end - start,
+            "ipr_id": ipr_id,
+            "ipr_parents": IPR_PARENTS[ipr_id],
+            "ipr_name": ipr_id,
+            "short_name": ipr_id,
+            "feature_type": "Domain",
+            "interproid": ipr_id,
+            "name": ipr_id,
+            "subdomains": []
+        })
+    return fragments
+
+
+def exhaustive_groups(fragments):
+    """Group fragments by the exhaustive restarting scan."""
+    visited = set()
+    groups = []
+    for i in range(len(fragments)):
+        if i not in visited:
+            group = [fragments[i]]
+            visited.add(i)
+            j = 0
+            while j < len(fragments):
+                if j not in visited:
+                    for member in group:
+                        if are_parents(member, fragments[j]) and\
+                                _merge_overlap(member, fragments[j]) >= 0.0001:
+                            group.append(fragments[j])
+                            visited.add(j)
+                            j = -1
+                            break
+                j += 1
+            groups.append(group)
+    return groups
+
+
+def _time(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+
+def run(n_matches):
+    """Run the benchmark on the given number of matches."""
+    fragments = generate_fragments(n_matches)
+    print("{} matches".format(n_matches))
+    print("  merge_raw_domains:        {:.3f}s".format(
+        _time(merge_raw_domains, fragments, 0.1)))
+    print("  _merge_fragments:         {:.3f}s".format(
+        _time(_merge_fragments, copy.deepcopy(fragments))))
+    print("  _nest_domains:            {:.3f}s".format(
+        _time(_nest_domains, copy.deepcopy(fragments), 0.7, 2)))
+    if n_matches <= 1000:
+        print("  exhaustive grouping scan: {:.3f}s".format(
+            _time(exhaustive_groups, fragments)))
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [100, 300, 1000, 3000]
+    for n in sizes:
+        run(n)
@@ -0,0 +1,126 @@
+"""Benchmark of binary snapshots against JSON for KAMI corpora.
+
+A large corpus of binding nuggets between randomly chosen protoforms
+is generated, exported to JSON and to a binary snapshot, and the times
+of `KamiCorpus.load_json` and `KamiCorpus.load_snapshot` are compared.
+
+Usage: python benchmarks/snapshot_benchmark.py [n_protoforms] [n_nuggets]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from regraph import NXGraph
+from regraph.utils import relation_to_json
+
+from kami.data_structures.corpora import KamiCorpus
+
+
+def generate_corpus_json(n_protoforms, n_nuggets, seed=0):
+    """Generate json data of a corpus with binding nuggets."""
+    rng = random.Random(seed)
+    ag = NXGraph()
+    ag_typing = dict()
+    for i in range(n_protoforms):
+        protoform = "protoform_{}".format(i)
+        region = "region_{}".format(i)
+        ag.add_node(protoform, {"uniprotid": "P{:05d}".format(i)})
+        ag.add_node(region, {"name": "Region {}".format(i)})
+        ag.add_edge(region, protoform)
+        ag_typing[protoform] = "protoform"
+        ag_typing[region] = "region"
+
+    nuggets = []
+    for k in range(n_nuggets):
+        left, right = rng.sample(range(n_protoforms), 2)
+        bnd = "bnd_{}".format(k)
+        ag.add_node(bnd, {"type": "do"})
+        ag_typing[bnd] = "bnd"
+        ag.add_edge("region_{}".format(left), bnd)
+        ag.add_edge("region_{}".format(right), bnd)
+
+        nugget = NXGraph()
+        nugget.add_nodes_from([
+            ("left_partner", ag.get_node("protoform_{}".format(left))),
+            ("right_partner", ag.get_node("protoform_{}".format(right))),
+            ("left_partner_region",
+             ag.get_node("region_{}".format(left))),
+            ("right_partner_region",
+             ag.get_node("region_{}".format(right))),
+            ("bnd", ag.get_node(bnd))
+        ])
+        nugget.add_edges_from([
+            ("left_partner_region", "left_partner"),
+            ("right_partner_region", "right_partner"),
+            ("left_partner_region", "bnd"),
+            ("right_partner_region", "bnd")
+        ])
+        nuggets.append({
+            "id": "nugget_{}".format(k),
+            "graph": nugget.to_json(),
+            "desc": "",
+            "typing": {
+                "left_partner": "protoform_{}".format(left),
+                "right_partner": "protoform_{}".format(right),
+                "left_partner_region": "region_{}".format(left),
+                "right_partner_region": "region_{}".format(right),
+                "bnd": bnd
+            },
+            "attrs": {
+                "interaction_type": {"type": "FiniteSet", "data": ["bnd"]}
+            },
+            "template_rel": (
+                "bnd_template",
+                relation_to_json({n: {n} for n in nugget.nodes()})
+            ),
+            "semantic_rels": {}
+        })
+    return {
+        "corpus_id": "benchmark",
+        "action_graph": ag.to_json(),
+        "action_graph_typing": ag_typing,
+        "action_graph_semantics": {},
+        "nuggets": nuggets
+    }
+
+
+def _time(f, repeat=3):
+    """Get the best time of several runs of the function."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        f()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(n_protoforms=1000, n_nuggets=2000):
+    corpus = KamiCorpus.from_json(
+        "benchmark", generate_corpus_json(n_protoforms, n_nuggets))
+
+    tmp_dir = tempfile.mkdtemp()
+    json_file = os.path.join(tmp_dir, "corpus.json")
+    snapshot_file = os.path.join(tmp_dir, "corpus.snapshot")
+    corpus.export_json(json_file)
+    corpus.save_snapshot(snapshot_file)
+
+    json_time = _time(lambda: KamiCorpus.load_json("benchmark", json_file))
+    snapshot_time = _time(lambda: KamiCorpus.load_snapshot(snapshot_file))
+
+    print("Corpus: {} action graph nodes, {} nuggets".format(
+        len(corpus.action_graph.nodes()), len(corpus.nuggets())))
+    print("JSON:     {:10d} bytes, loaded in {:.3f}s".format(
+        os.path.getsize(json_file), json_time))
+    print("Snapshot: {:10d} bytes, loaded in {:.3f}s".format(
+        os.path.getsize(snapshot_file), snapshot_time))
+    print("Speed-up: {:.1f}x".format(json_time / snapshot_time))
+
+    os.remove(json_file)
+    os.remove(snapshot_file)
+    os.rmdir(tmp_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
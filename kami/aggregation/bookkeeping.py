@@ -3,100 +3,109 @@ import warnings
 
 import regraph
 
-from anatomizer import fetch_gene_meta_data, fetch_gene_domains
+from anatomizer import (fetch_gene_meta_data, fetch_gene_domains,
+                        discard_prefetched)
 from kami.data_structures.entities import Region
-from kami.aggregation.identifiers import find_fragment
+from kami.aggregation.identifiers import FragmentIndex, ResidueIndex
 from kami.exceptions import KamiHierarchyWarning
 from kami.utils.id_generators import generate_new_id
 
 
+def _invalidate_edge(identifier, source, target):
+    """Invalidate the cached indices after an in-place edge addition."""
+    if identifier.index is not None:
+        identifier.index.invalidate_attached_fragments(target)
+    if identifier.memo is not None:
+        identifier.memo.invalidate([source, target])
+
+
 def merge_residues(identifier, protoform):
     """Merge residues of the same location."""
-    residues = identifier.get_attached_residues(protoform)
-    locs = {}
     # group residues by their location
-    for res in residues:
-        loc = None
-        res_gene_edge = identifier.graph.get_edge(res, protoform)
-        if "loc" in res_gene_edge.keys():
-            loc = list(res_gene_edge["loc"])[0]
-        if loc is not None:
-            if loc in locs.keys():
-                locs[loc].append(res)
-            else:
-                locs[loc] = [res]
-
-    for k, v in locs.items():
-        if len(v) > 1:
-            # merges these residues
-            if identifier.hierarchy:
-                pattern = regraph.NXGraph()
-                pattern.add_nodes_from(v)
-                rule = regraph.Rule.from_transform(pattern)
-                rule.inject_merge_nodes(v)
-
-                protoform_attrs = identifier.graph.get_node(protoform)
-                uniprot = list(protoform_attrs["uniprotid"])[0]
-                message = (
-                    "Merged residues with the same location '{}' ".format(
-                        k) +
-                    "of the protoform with the UniProtAC '{}'".format(uniprot)
-                )
-
-                identifier.rewrite_graph(
-                    rule,
-                    message=message,
-                    update_type="auto")
-            else:
-                identifier.graph.merge_nodes(v)
+    if identifier.immediate:
+        residue_index = identifier.get_residue_index(protoform)
+    else:
+        residue_index = ResidueIndex({
+            res: ({}, identifier.graph.get_edge(res, protoform))
+            for res in identifier.get_attached_residues(protoform)
+        })
+
+    groups = residue_index.location_groups()
+    if len(groups) == 0:
+        return
+    if identifier.hierarchy:
+        # All the residues are merged in a single update
+        protoform_attrs = identifier.graph.get_node(protoform)
+        uniprot = list(protoform_attrs["uniprotid"])[0]
+        message = (
+            "Merged residues with the same location ({}) ".format(
+                ", ".join("'{}'".format(k) for k, _ in groups)) +
+            "of the protoform with the UniProtAC '{}'".format(uniprot)
+        )
+        with identifier.hierarchy.transaction(
+                message, update_type="auto") as transaction:
+            for _, v in groups:
+                transaction.merge_nodes(v)
+    else:
+        for _, v in groups:
+            identifier.graph.merge_nodes(v)
+        merged_nodes = [protoform] + [res for _, v in groups for res in v]
+        if identifier.index is not None:
+            identifier.index.invalidate_fragments(merged_nodes)
+        if identifier.memo is not None:
+            identifier.memo.invalidate(merged_nodes)
 
 
 def reconnect_residues(identifier, protoform, residues,
                        regions=None, sites=None):
     """Reconnect residues of a protoform to regions/sites of compatible range."""
+    region_dict = {}
+    if regions is not None:
+        for region in regions:
+            region_gene_edge = identifier.graph.get_edge(region, protoform)
+            if "start" in region_gene_edge and\
+               "end" in region_gene_edge:
+                start = min(
+                    region_gene_edge["start"])
+                end = max(
+                    region_gene_edge["end"])
+                region_dict[region] = (start, end)
+
+    site_dict = {}
+    if sites is not None:
+        for site in sites:
+            site_gene_edge = identifier.graph.get_edge(site, protoform)
+            if "start" in site_gene_edge and\
+               "end" in site_gene_edge:
+                start = min(
+                    site_gene_edge["start"])
+                end = max(
+                    site_gene_edge["end"])
+                site_dict[site] = (start, end)
+
+    if len(region_dict) == 0 and len(site_dict) == 0:
+        return
+
     for res in residues:
         loc = None
         res_gene_edge = identifier.graph.get_edge(res, protoform)
         if "loc" in res_gene_edge.keys():
             loc = list(res_gene_edge["loc"])[0]
         if loc is not None:
-            region_dict = {}
-            if regions is not None:
-                for region in regions:
-                    region_gene_edge = identifier.graph.get_edge(region, protoform)
-                    if "start" in region_gene_edge and\
-                       "end" in region_gene_edge:
-                        start = min(
-                            region_gene_edge["start"])
-                        end = max(
-                            region_gene_edge["end"])
-                        region_dict[region] = (start, end)
-
-            site_dict = {}
-            if sites is not None:
-                for site in sites:
-                    site_gene_edge = identifier.graph.get_edge(site, protoform)
-                    if "start" in site_gene_edge and\
-                       "end" in site_gene_edge:
-                        start = min(
-                            site_gene_edge["start"])
-                        end = max(
-                            site_gene_edge["end"])
-                        site_dict[site] = (start, end)
-
             for region, (start, end) in region_dict.items():
                 if int(loc) >= start and\
                    int(loc) <= end and\
-                   (res, region) not in identifier.graph.edges():
+                   not identifier.graph.exists_edge(res, region):
                     identifier.graph.add_edge(
                         res, region, {"loc": loc})
                     identifier.graph.add_edge_attrs(
                         res, protoform, {"type": "transitive"})
+                    _invalidate_edge(identifier, res, region)
 
             for site, (start, end) in site_dict.items():
                 if int(loc) >= start and\
                    int(loc) <= end and\
-                   (res, site) not in identifier.graph.edges():
+                   not identifier.graph.exists_edge(res, site):
                     for suc in identifier.graph.successors(res):
                         if identifier.meta_typing[suc] != "site":
                             if identifier.meta_typing[suc] == "region" and\
@@ -106,6 +115,7 @@ def reconnect_residues(identifier, protoform, residues,
                     identifier.graph.add_edge_attrs(
                         res, protoform, {"type": "transitive"})
                     identifier.graph.add_edge(res, site, {"loc": loc})
+                    _invalidate_edge(identifier, res, site)
 
 
 def reconnect_sites(identifier, protoform, sites, regions):
@@ -136,167 +146,211 @@ def reconnect_sites(identifier, protoform, sites, regions):
                             {"start": start, "end": end})
                         identifier.graph.add_edge_attrs(
                             site, protoform, {"type": "transitive"})
+                        _invalidate_edge(identifier, site, region)
+
+
+# Patterns of the form 'top<-middle<-bottom', for every pattern
+# the missing edges 'top<-bottom' are added
+TRANSITIVE_PATTERNS = [
+    ("protoform", "region", "site"),
+    ("region", "site", "residue"),
+    ("protoform", "region", "residue"),
+    ("protoform", "site", "residue")
+]
+
+
+class _EdgeBatch(object):
+    """Batch of edges to add to the wrapped graph in a single update.
+
+    The edges of the batch are visible (as if they were already
+    added) through the methods `exists_edge`, `get_edge`,
+    `successors` and `predecessors`.
+
+    Attributes
+    ----------
+    identifier : kami.aggregation.identifiers.EntityIdentifier
+    edges : dict
+        Dictionary whose keys are new edges and whose values
+        are their attributes
+    edge_attrs : dict
+        Dictionary whose keys are existing edges and whose values
+        are the attributes to add to them
+    """
+
+    def __init__(self, identifier):
+        """Initialize an empty batch."""
+        self.identifier = identifier
+        self.edges = dict()
+        self.edge_attrs = dict()
+        self._successors = dict()
+        self._predecessors = dict()
+
+    def exists_edge(self, s, t):
+        """Test if the edge exists in the graph or in the batch."""
+        return (s, t) in self.edges or\
+            self.identifier.graph.exists_edge(s, t)
+
+    def get_edge(self, s, t):
+        """Get attributes of the edge of the graph or of the batch."""
+        if (s, t) in self.edges:
+            return self.edges[(s, t)]
+        return self.identifier.graph.get_edge(s, t)
+
+    def successors(self, node_id):
+        """Get successors of the node in the graph and in the batch."""
+        return list(self.identifier.graph.successors(node_id)) +\
+            self._successors.get(node_id, [])
+
+    def predecessors(self, node_id):
+        """Get predecessors of the node in the graph and in the batch."""
+        return list(self.identifier.graph.predecessors(node_id)) +\
+            self._predecessors.get(node_id, [])
+
+    def add_edge(self, s, t, attrs):
+        """Add a new edge to the batch."""
+        self.edges[(s, t)] = attrs
+        self._successors.setdefault(s, []).append(t)
+        self._predecessors.setdefault(t, []).append(s)
+
+    def add_edge_attrs(self, s, t, attrs):
+        """Add attributes to an edge of the graph or of the batch."""
+        if (s, t) in self.edges:
+            self.edges[(s, t)].update(attrs)
+        else:
+            self.edge_attrs.setdefault((s, t), dict()).update(attrs)
+
+    def apply(self, message):
+        """Add the edges of the batch to the wrapped graph."""
+        if len(self.edges) == 0 and len(self.edge_attrs) == 0:
+            return
+        identifier = self.identifier
+        if identifier.hierarchy:
+            with identifier.hierarchy.transaction(
+                    message, update_type="auto") as transaction:
+                for (s, t), attrs in self.edges.items():
+                    transaction.add_edge(s, t, attrs)
+                for (s, t), attrs in self.edge_attrs.items():
+                    transaction.add_edge_attrs(s, t, attrs)
+        else:
+            for (s, t), attrs in self.edges.items():
+                identifier.graph.add_edge(s, t, attrs)
+                _invalidate_edge(identifier, s, t)
+            for (s, t), attrs in self.edge_attrs.items():
+                identifier.graph.add_edge_attrs(s, t, attrs)
 
 
-def connect_transitive_components(identifier, new_nodes):
-    """Add edges between components connected transitively."""
-    gene_region_site = regraph.NXGraph()
-    gene_region_site.add_nodes_from(["protoform", "region", "site"])
-    gene_region_site.add_edges_from([("region", "protoform"), ("site", "region")])
-    gene_region_site_rule = regraph.Rule.from_transform(gene_region_site)
-    gene_region_site_rule.inject_add_edge("site", "protoform")
-    lhs_typing = {
-        "protoform": "protoform", "region": "region", "site": "site"
-    }
-
-    instances = identifier.find_matching_in_graph(
-        gene_region_site_rule.lhs,
-        lhs_typing,
-        new_nodes)
-
-    for instance in instances:
-        if not identifier.graph.exists_edge(
-           instance["site"], instance["protoform"]):
-            edge_attrs = dict()
-            edge_attrs.update(identifier.graph.get_edge(
-                instance["site"],
-                instance["region"]))
-            edge_attrs["type"] = "transitive"
-            gene_region_site_rule.rhs.set_edge("site", "protoform", edge_attrs)
-
-            message = (
-                "Reconnected transitive components: pattern "
-                "'Protoform<-Region<-Site(ID '{}'), created Protoform<-Site".format(
-                    instance["site"])
-            )
-
-            identifier.rewrite_graph(
-                gene_region_site_rule, instance,
-                message=message, update_type="auto")
-
-    region_site_residue = regraph.NXGraph()
-    region_site_residue.add_nodes_from(["region", "site", "residue"])
-    region_site_residue.add_edges_from(
-        [("site", "region"), ("residue", "site")])
-    region_site_residue_rule = regraph.Rule.from_transform(region_site_residue)
-    region_site_residue_rule.inject_add_edge("residue", "region")
-    lhs_typing = {
-        "region": "region", "site": "site", "residue": "residue"
-    }
-
-    instances = identifier.find_matching_in_graph(
-        region_site_residue_rule.lhs,
-        lhs_typing,
-        new_nodes)
-
-    for instance in instances:
-        if not identifier.graph.exists_edge(
-                instance["residue"], instance["region"]):
-            edge_attrs = dict()
-            edge_attrs.update(identifier.graph.get_edge(
-                instance["residue"],
-                instance["site"]))
-            edge_attrs["type"] = "transitive"
-            region_site_residue_rule.rhs.set_edge(
-                "residue", "region", edge_attrs)
-
-            message = (
-                "Reconnected transitive components: pattern "
-                "'Region<-Site<-Residue(ID '{}'), created Region<-Residue".format(
-                    instance["residue"])
-            )
-            identifier.rewrite_graph(
-                region_site_residue_rule, instance,
-                message=message, update_type="auto")
-
-    gene_region_residue = regraph.NXGraph()
-    gene_region_residue.add_nodes_from(["protoform", "region", "residue"])
-    gene_region_residue.add_edges_from(
-        [("region", "protoform"), ("residue", "region")])
-    gene_region_residue_rule = regraph.Rule.from_transform(gene_region_residue)
-    gene_region_residue_rule.inject_add_edge(
-        "residue", "protoform")
-    lhs_typing = {
-        "protoform": "protoform", "region": "region", "residue": "residue"
-    }
-
-    instances = identifier.find_matching_in_graph(
-        gene_region_residue_rule.lhs,
-        lhs_typing,
-        new_nodes)
-
-    for instance in instances:
-        if not identifier.graph.exists_edge(
-                instance["residue"], instance["protoform"]):
-
-            edge_attrs = dict()
-            edge_attrs.update(identifier.graph.get_edge(
-                instance["residue"], instance["region"]))
-            edge_attrs["type"] = "transitive"
-            gene_region_residue_rule.rhs.set_edge("residue", "protoform", edge_attrs)
-            message = (
-                "Reconnected transitive components: pattern "
-                "'Protoform<-Region<-Residue(ID '{}'), created Protoform<-Residue".format(
-                    instance["residue"])
-            )
-            identifier.rewrite_graph(
-                gene_region_residue_rule, instance,
-                message=message, update_type="auto")
-
-    gene_site_residue = regraph.NXGraph()
-    gene_site_residue.add_nodes_from(["protoform", "site", "residue"])
-    gene_site_residue.add_edges_from([("site", "protoform"), ("residue", "site")])
-    gene_site_residue_rule = regraph.Rule.from_transform(gene_site_residue)
-    gene_site_residue_rule.inject_add_edge(
-        "residue", "protoform")
-    lhs_typing = {
-        "protoform": "protoform", "site": "site", "residue": "residue"
-    }
-
-    instances = identifier.find_matching_in_graph(
-        gene_site_residue_rule.lhs, lhs_typing, new_nodes)
-    for instance in instances:
-        if not identifier.graph.exists_edge(
-                instance["residue"], instance["protoform"]):
-
-            edge_attrs = dict()
-            edge_attrs.update(identifier.graph.get_edge(
-                instance["residue"], instance["site"]))
-            edge_attrs["type"] = "transitive"
-            gene_site_residue_rule.rhs.set_edge("residue", "protoform", edge_attrs)
+def _find_nested_fragments(batch, genes):
+    """Add to the batch the edges from sites to regions containing them."""
+    identifier = batch.identifier
+    n_edges = 0
+    for protoform in genes:
+        if identifier.immediate:
+            region_index = identifier.get_fragment_index(protoform, "region")
+        else:
+            region_index = FragmentIndex({
+                r: ({}, identifier.graph.get_edge(r, protoform))
+                for r in identifier.get_attached_regions(protoform)
+            })
+        for site in identifier.get_attached_sites(protoform):
+            site_gene_edge = identifier.graph.get_edge(site, protoform)
+            f = region_index.find({}, site_gene_edge)
+            if f is not None:
+                if identifier.meta_typing[f] == "region" and\
+                   not batch.exists_edge(site, f):
+                    batch.add_edge(site, f, dict(site_gene_edge))
+                    batch.add_edge_attrs(
+                        site, protoform, {"type": "transitive"})
+                    n_edges += 1
+    return n_edges
+
+
+def _find_transitive_edges(batch, new_nodes):
+    """Add to the batch the edges between components connected transitively.
+
+    Only the neighbourhoods of the new nodes are traversed: for every
+    pattern 'top<-middle<-bottom' of `TRANSITIVE_PATTERNS` (all the
+    nodes of an instance of the pattern being new nodes), the missing
+    edges 'top<-bottom' are added. The edges added for a pattern are
+    visible to the next patterns.
+
+    Returns
+    -------
+    counts : list of int
+        Numbers of edges added for every pattern
+    """
+    meta_typing = batch.identifier.meta_typing
+    nodes = dict()
+    for n in new_nodes:
+        if n in meta_typing:
+            nodes[n] = None
+
+    counts = []
+    for top, middle, bottom in TRANSITIVE_PATTERNS:
+        n_edges = 0
+        for m in nodes:
+            if meta_typing[m] != middle:
+                continue
+            tops = [
+                t for t in batch.successors(m)
+                if t in nodes and meta_typing[t] == top
+            ]
+            if len(tops) == 0:
+                continue
+            for b in batch.predecessors(m):
+                if b in nodes and meta_typing[b] == bottom:
+                    for t in tops:
+                        if not batch.exists_edge(b, t):
+                            edge_attrs = dict()
+                            edge_attrs.update(batch.get_edge(b, m))
+                            edge_attrs["type"] = "transitive"
+                            batch.add_edge(b, t, edge_attrs)
+                            n_edges += 1
+        counts.append(n_edges)
+    return counts
+
+
+def _bookkeeping_message(n_nested, counts):
+    """Generate the message of the bookkeeping update."""
+    updates = []
+    if n_nested > 0:
+        updates.append(
+            "connected {} site(s) to the regions containing them".format(
+                n_nested))
+    if sum(counts) > 0:
+        updates.append(
+            "reconnected transitive components ({})".format(", ".join(
+                "pattern '{}<-{}<-{}': {} edge(s)".format(
+                    top.capitalize(), middle.capitalize(),
+                    bottom.capitalize(), count)
+                for (top, middle, bottom), count in zip(
+                    TRANSITIVE_PATTERNS, counts)
+                if count > 0
+            )))
+    return "Bookkeeping: " + ", ".join(updates)
 
-            message = (
-                "Reconnected transitive components: pattern "
-                "'Protoform<-Site<-Residue(ID '{}'), created Protoform<-Residue".format(
-                    instance["residue"])
-            )
 
-            identifier.rewrite_graph(
-                gene_site_residue_rule, instance,
-                message=message, update_type="auto")
+def connect_transitive_components(identifier, new_nodes):
+    """Add edges between components connected transitively."""
+    batch = _EdgeBatch(identifier)
+    counts = _find_transitive_edges(batch, new_nodes)
+    batch.apply(_bookkeeping_message(0, counts))
 
 
 def connect_nested_fragments(identifier, genes):
     """Add edges between spacially nested framgents."""
-    for protoform in genes:
-        regions = identifier.get_attached_regions(protoform)
-        for site in identifier.get_attached_sites(protoform):
-            f = find_fragment(
-                {}, identifier.graph.get_edge(site, protoform),
-                {r: ({}, identifier.graph.get_edge(r, protoform)) for r in regions}
-            )
-            if f is not None:
-                if identifier.meta_typing[f] == "region" and\
-                   (site, f) not in identifier.graph.edges():
-                    identifier.graph.add_edge(
-                        site, f,
-                        identifier.graph.get_edge(site, protoform))
-                    identifier.graph.add_edge_attrs(
-                        site, protoform, {"type": "transitive"})
+    batch = _EdgeBatch(identifier)
+    n_nested = _find_nested_fragments(batch, genes)
+    batch.apply(_bookkeeping_message(n_nested, []))
 
 
 def anatomize_gene(model, protoform):
-    """Anatomize existing protoform node in the action graph."""
+    """Anatomize existing protoform node in the action graph.
+
+    The meta-data and the domains of the protoform are fetched with
+    the anatomizer (the data prefetched by
+    `anatomizer.prefetch_gene_data` is consumed, if available, and
+    discarded otherwise).
+    """
     new_regions = list()
 
     if protoform in model.action_graph.nodes() and\
@@ -315,6 +369,10 @@ def anatomize_gene(model, protoform):
             domains = fetch_gene_domains(uniprot_ac, merge_overlap=0.1)
         except:
             pass
+        finally:
+            # Data that was not consumed (if fetching of the meta-data
+            # failed) is not reused
+            discard_prefetched([uniprot_ac])
         if meta_data or domains:
             # Generate an update rule to add
             # entities fetched by the anatomizer
@@ -406,14 +464,19 @@ def anatomize_gene(model, protoform):
 
             existing_regions = model.get_attached_regions(protoform)
             merged_activities = {}
+            # The index of new regions is rebuilt only when
+            # a new region is merged with an existing one
+            new_region_index = None
             for existing_region in existing_regions:
-                matching_region = find_fragment(
+                if new_region_index is None:
+                    new_region_index = FragmentIndex({
+                        n: (
+                            anatomization_rule.rhs.get_node(n),
+                            anatomization_rule.rhs.get_edge(n, "protoform")
+                        ) for n in new_regions})
+                matching_region = new_region_index.find(
                     model.action_graph.get_node(existing_region),
-                    model.action_graph.get_edge(existing_region, protoform),
-                    {n: (
-                        anatomization_rule.rhs.get_node(n),
-                        anatomization_rule.rhs.get_edge(n, "protoform")
-                    ) for n in new_regions})
+                    model.action_graph.get_edge(existing_region, protoform))
                 if matching_region is not None:
                     anatomization_rule._add_node_lhs(existing_region)
                     anatomization_rule._add_edge_lhs(existing_region, "protoform")
@@ -453,6 +516,7 @@ def anatomize_gene(model, protoform):
                     semantic_relations[merged_rhs_id] = s
                     new_regions.remove(matching_region)
                     new_regions.append(merged_rhs_id)
+                    new_region_index = None
 
             message = (
                 "Anatomizated the protoform with the UniProtAC '{}'".format(
@@ -486,9 +550,13 @@ def anatomize_gene(model, protoform):
 
 
 def apply_bookkeeping(identifier, all_nodes, genes):
-    # Apply bookkeeping updates
-    connect_nested_fragments(identifier, genes)
-    connect_transitive_components(identifier, all_nodes)
+    # Apply bookkeeping updates, the edges between nested fragments
+    # and between transitively connected components are added
+    # in a single update
+    batch = _EdgeBatch(identifier)
+    n_nested = _find_nested_fragments(batch, genes)
+    counts = _find_transitive_edges(batch, all_nodes)
+    batch.apply(_bookkeeping_message(n_nested, counts))
     for g in genes:
         residues = identifier.get_attached_residues(g)
         sites = identifier.get_attached_sites(g)
@@ -1078,7 +1078,9 @@ def generate_nugget(corpus, interaction, readonly=False):
         corpus.get_action_graph_typing(),
         hierarchy=hierarchy,
         graph_id=graph_id,
-        meta_model_id=meta_model_id)
+        meta_model_id=meta_model_id,
+        index=corpus._ag_index,
+        memo=corpus._ag_index.traversal_memo)
     if isinstance(interaction, Modification):
         gen = ModGenerator(identifier)
     elif isinstance(interaction, SelfModification):
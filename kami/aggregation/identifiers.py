@@ -1,4 +1,5 @@
 """Collection of untils for identification of entities in a KAMI."""
+import bisect
 import networkx as nx
 import numpy as np
 import warnings
@@ -6,86 +7,321 @@ import warnings
 from regraph import Rule
 
 from kami.data_structures.entities import Region, Site, Residue, State
+from kami.data_structures.frozen import FrozenActionGraph
 from kami.exceptions import KamiHierarchyError
 
 
-def find_fragment(a_meta_data, a_location, dict_of_b, name=True):
-    """Find a protein fragment in a collection of other fragments."""
-    a_start = None
-    a_end = None
-    a_name = None
-    a_interpro = None
-    a_order = None
-    if "start" in a_location.keys():
-        a_start = int(min(a_location["start"]))
-    if "end" in a_location.keys():
-        a_end = int(max(a_location["end"]))
-    if "name" in a_meta_data.keys():
-        a_name = list(a_meta_data["name"])[0].lower()
-    if "interproid" in a_meta_data.keys():
-        a_interpro = a_meta_data["interproid"]
-    if "order" in a_location.keys():
-        a_order = list(a_location["order"])[0]
-
-    satisfying_fragments = []
-    for b_id, (b_meta_data, b_location) in dict_of_b.items():
-        b_start = None
-        b_end = None
-        b_name = None
-        b_interpro = None
-        if "start" in b_location.keys():
-            b_start = int(min(b_location["start"]))
-        if "end" in b_location.keys():
-            b_end = int(max(b_location["end"]))
-        if "name" in b_meta_data.keys():
-            b_name = list(b_meta_data["name"])[0].lower()
-        if "interproid" in b_meta_data.keys():
-            b_interpro = b_meta_data["interproid"]
-
-        if a_start is not None and a_end is not None and\
-           b_start is not None and b_end is not None:
-            if a_start >= b_start and a_end <= b_end:
-                return b_id
-            elif a_start <= b_start and a_end >= b_end:
-                return b_id
-        elif a_name is not None and b_name is not None:
-            if a_name in b_name or b_name in a_name:
-                satisfying_fragments.append(b_id)
-        elif a_interpro is not None and b_interpro is not None:
-            if len(a_interpro.intersection(b_interpro)) > 0:
-                satisfying_fragments.append(b_id)
-
-    if len(satisfying_fragments) == 1:
-        return satisfying_fragments[0]
-    elif len(satisfying_fragments) > 1:
-        # Try to find if there is a unique region in the list of
-        # satisfying regions with the same order number
-        if a_order is not None:
-            same_order_fragments = []
-            for b_id in satisfying_fragments:
-                if "order" in dict_of_b[b_id][1].keys():
-                    if a_order in dict_of_b[b_id][1]["order"]:
-                        same_order_fragments.append(b_id)
-            # if not explicit order number was found
-            if len(same_order_fragments) == 0:
-                try:
-                    start_orders = np.argsort([
-                        int(min(dict_of_b[b_id][1]["start"]))
-                        for b_id in satisfying_fragments
-                        if "start" in dict_of_b[b_id][1].keys()
-                    ])
-                    return satisfying_fragments[
-                        start_orders[a_order - 1]]
-                except:
-                    return None
-            elif len(same_order_fragments) == 1:
-                return same_order_fragments[0]
-            else:
-                return None
+def _fragment_location(location):
+    """Get the pair (start, end) of a fragment location."""
+    start = None
+    end = None
+    if "start" in location.keys():
+        start = int(min(location["start"]))
+    if "end" in location.keys():
+        end = int(max(location["end"]))
+    return start, end
+
+
+def _fragment_name(meta_data):
+    """Get the lowercased name of a fragment."""
+    if "name" in meta_data.keys():
+        return list(meta_data["name"])[0].lower()
+    return None
+
+
+def _interpro_ids(interpro):
+    """Get the set of InterPro ids of a fragment."""
+    if type(interpro) == str:
+        return {interpro}
+    return set(interpro)
+
+
+def _build_segment_tree(values, size, default, f):
+    tree = [default] * (2 * size)
+    tree[size:size + len(values)] = values
+    for i in range(size - 1, 0, -1):
+        tree[i] = f(tree[2 * i], tree[2 * i + 1])
+    return tree
+
+
+def _report_leaves(tree, size, lo, hi, accept):
+    """Find the leaves in the range [lo, hi) whose values are accepted."""
+    leaves = []
+    stack = [(1, 0, size)]
+    while len(stack) > 0:
+        node, left, right = stack.pop()
+        if right <= lo or hi <= left or not accept(tree[node]):
+            continue
+        if right - left == 1:
+            leaves.append(left)
+        else:
+            middle = (left + right) // 2
+            stack.append((2 * node, left, middle))
+            stack.append((2 * node + 1, middle, right))
+    return leaves
+
+
+def _resolve_by_order(a_order, satisfying_fragments, locations):
+    """Choose a fragment among the satisfying ones by the order number."""
+    # Try to find if there is a unique region in the list of
+    # satisfying regions with the same order number
+    same_order_fragments = []
+    for b_id in satisfying_fragments:
+        if "order" in locations[b_id].keys():
+            if a_order in locations[b_id]["order"]:
+                same_order_fragments.append(b_id)
+    # if not explicit order number was found
+    if len(same_order_fragments) == 0:
+        try:
+            start_orders = np.argsort([
+                int(min(locations[b_id]["start"]))
+                for b_id in satisfying_fragments
+                if "start" in locations[b_id].keys()
+            ])
+            return satisfying_fragments[
+                start_orders[a_order - 1]]
+        except:
+            return None
+    elif len(same_order_fragments) == 1:
+        return same_order_fragments[0]
     else:
         return None
 
 
+class FragmentIndex(object):
+    """Index of protein fragments (regions or sites).
+
+    Fragments with a location are sorted by their start and the ends of
+    the sorted fragments are stored in segment trees (of minimal and
+    maximal ends), so that the fragments containing a location (or
+    contained in it) are found in O(log n + k). Lowercased names and
+    InterPro ids of the fragments are precomputed for the fragments
+    identified without a location.
+
+    Attributes
+    ----------
+    _fragments : list
+        Ids of the indexed fragments (in the input order)
+    _locations : dict
+        Dictionary whose keys are ids of the fragments and whose
+        values are their locations
+    _names : list
+        Lowercased names of the fragments (None if not specified)
+    _located : list
+        Flags indicating if the fragments have both start and end
+    _interpro : dict
+        Dictionary whose keys are InterPro ids and whose values are
+        lists of positions of the fragments having them
+    _starts : list
+        Sorted starts of the fragments with a location (with start
+        not greater than end)
+    _positions : list
+        Positions of the fragments corresponding to the sorted starts
+    _min_ends : list
+    _max_ends : list
+        Segment trees of the ends of the fragments sorted by start
+    _inverted : list
+        Triples (position, start, end) of the fragments with a location
+        whose start is greater than the end
+    """
+
+    def __init__(self, dict_of_b):
+        """Build the index.
+
+        Parameters
+        ----------
+        dict_of_b : dict
+            Dictionary whose keys are ids of the fragments and whose
+            values are pairs (meta-data, location)
+        """
+        self._fragments = list(dict_of_b.keys())
+        self._locations = dict()
+        self._names = []
+        self._located = []
+        self._interpro = dict()
+        self._inverted = []
+        intervals = []
+        for i, (b_id, (b_meta_data, b_location)) in enumerate(
+                dict_of_b.items()):
+            self._locations[b_id] = b_location
+            b_start, b_end = _fragment_location(b_location)
+            self._names.append(_fragment_name(b_meta_data))
+            self._located.append(b_start is not None and b_end is not None)
+            if "interproid" in b_meta_data.keys():
+                for ipr_id in _interpro_ids(b_meta_data["interproid"]):
+                    self._interpro.setdefault(ipr_id, []).append(i)
+            if self._located[i]:
+                if b_start <= b_end:
+                    intervals.append((b_start, i, b_end))
+                else:
+                    self._inverted.append((i, b_start, b_end))
+        intervals.sort()
+        self._starts = [start for start, _, _ in intervals]
+        self._positions = [i for _, i, _ in intervals]
+        ends = [end for _, _, end in intervals]
+        self._size = 1
+        while self._size < len(ends):
+            self._size *= 2
+        self._min_ends = _build_segment_tree(
+            ends, self._size, float("inf"), min)
+        self._max_ends = _build_segment_tree(
+            ends, self._size, float("-inf"), max)
+
+    def fragments(self):
+        """Get ids of the indexed fragments."""
+        return list(self._fragments)
+
+    def _find_by_location(self, a_start, a_end):
+        """Find the first fragment containing (or contained in) a location."""
+        found = []
+        # Fragments contained in the location
+        if a_start <= a_end:
+            found += _report_leaves(
+                self._min_ends, self._size,
+                bisect.bisect_left(self._starts, a_start),
+                bisect.bisect_right(self._starts, a_end),
+                lambda end: end <= a_end)
+        # Fragments containing the location
+        found += _report_leaves(
+            self._max_ends, self._size,
+            0, bisect.bisect_right(self._starts, a_start),
+            lambda end: end >= a_end)
+        positions = [self._positions[leaf] for leaf in found]
+        for i, b_start, b_end in self._inverted:
+            if (a_start >= b_start and a_end <= b_end) or\
+               (a_start <= b_start and a_end >= b_end):
+                positions.append(i)
+        if len(positions) > 0:
+            return self._fragments[min(positions)]
+        return None
+
+    def find(self, a_meta_data, a_location):
+        """Find the fragment matching a fragment (see `find_fragment`)."""
+        a_start, a_end = _fragment_location(a_location)
+        a_name = _fragment_name(a_meta_data)
+        a_interpro = None
+        a_order = None
+        if "interproid" in a_meta_data.keys():
+            a_interpro = _interpro_ids(a_meta_data["interproid"])
+        if "order" in a_location.keys():
+            a_order = list(a_location["order"])[0]
+
+        a_located = a_start is not None and a_end is not None
+        if a_located:
+            b_id = self._find_by_location(a_start, a_end)
+            if b_id is not None:
+                return b_id
+
+        positions = set()
+        if a_name is not None:
+            for i, b_name in enumerate(self._names):
+                if b_name is not None and\
+                   not (a_located and self._located[i]) and\
+                   (a_name in b_name or b_name in a_name):
+                    positions.add(i)
+        if a_interpro is not None:
+            for ipr_id in a_interpro:
+                for i in self._interpro.get(ipr_id, []):
+                    if not (a_located and self._located[i]) and\
+                       (a_name is None or self._names[i] is None):
+                        positions.add(i)
+        satisfying_fragments = [
+            self._fragments[i] for i in sorted(positions)]
+
+        if len(satisfying_fragments) == 1:
+            return satisfying_fragments[0]
+        elif len(satisfying_fragments) > 1:
+            if a_order is not None:
+                return _resolve_by_order(
+                    a_order, satisfying_fragments, self._locations)
+        return None
+
+
+class ResidueIndex(object):
+    """Index of residues by location and amino acid.
+
+    Attributes
+    ----------
+    _residues : list
+        Ids of the indexed residues (in the input order)
+    _locations : dict
+        Dictionary whose keys are locations and whose values are
+        lists of residues with this location
+    _unlocated : list
+        Residues without a location
+    _unlocated_aa : dict
+        Dictionary whose keys are amino acids and whose values are
+        sets of positions (in `_unlocated`) of the residues without
+        a location having them
+    """
+
+    def __init__(self, dict_of_residues):
+        """Build the index.
+
+        Parameters
+        ----------
+        dict_of_residues : dict
+            Dictionary whose keys are ids of the residues and whose
+            values are pairs (meta-data, location)
+        """
+        self._residues = list(dict_of_residues.keys())
+        self._locations = dict()
+        self._unlocated = []
+        self._unlocated_aa = dict()
+        for res, (res_meta_data, res_location) in dict_of_residues.items():
+            if "loc" in res_location.keys() and\
+               len(list(res_location["loc"])) > 0:
+                loc = int(list(res_location["loc"])[0])
+                self._locations.setdefault(loc, []).append(res)
+            else:
+                if "aa" in res_meta_data.keys():
+                    for aa in res_meta_data["aa"]:
+                        self._unlocated_aa.setdefault(aa, set()).add(
+                            len(self._unlocated))
+                self._unlocated.append(res)
+
+    def fragments(self):
+        """Get ids of the indexed residues."""
+        return list(self._residues)
+
+    def residues_at(self, loc):
+        """Get residues with the location."""
+        return list(self._locations.get(int(loc), []))
+
+    def location_groups(self):
+        """Get pairs (location, residues) of locations with several residues."""
+        return [
+            (loc, list(residues))
+            for loc, residues in self._locations.items()
+            if len(residues) > 1
+        ]
+
+    def unlocated_residues(self):
+        """Get residues without a location."""
+        return list(self._unlocated)
+
+    def unlocated_residues_with_aa(self, aa):
+        """Get residues without a location having all the amino acids."""
+        positions = None
+        for value in aa:
+            found = self._unlocated_aa.get(value, set())
+            positions = found if positions is None else positions & found
+        if positions is None:
+            return list(self._unlocated)
+        return [self._unlocated[i] for i in sorted(positions)]
+
+
+def find_fragment(a_meta_data, a_location, dict_of_b, name=True):
+    """Find a protein fragment in a collection of other fragments.
+
+    Fragments are matched by their locations (containment of one in
+    the other), the fragments without a location are matched by their
+    names or InterPro ids. To identify multiple fragments in the same
+    collection, use `FragmentIndex`.
+    """
+    return FragmentIndex(dict_of_b).find(a_meta_data, a_location)
+
+
 def get_uniprot(data):
     """Get UniProt AC from data."""
     uniprotid = None
@@ -106,8 +342,11 @@ class EntityIdentifier:
 
     Attributes
     ----------
-    graph : regraph.Graph
-        Graph where the identification of entities is performed
+    graph : regraph.Graph or kami.data_structures.frozen.FrozenActionGraph
+        Graph where the identification of entities is performed. If the
+        graph is a frozen action graph, the traversals of the graph are
+        performed on its compact representation (and the graph cannot
+        be rewritten)
     meta_typing : dict
         Typing of the nodes in the wrapped graph by KAMI's meta-model
     immediate : bool, optional
@@ -122,10 +361,23 @@ class EntityIdentifier:
         Id of the wrapped graph in the hierarchy
     meta_model_id : hashable, optional
         Id of the meta-model in the hierarchy
+    index : kami.data_structures.indices.ActionGraphIndex, optional
+        Index of the wrapped graph maintained by its corpus (model).
+        If specified, nodes of a given type and protoforms are looked up
+        in the index instead of scanning the graph, and the indices
+        of fragments attached to the nodes are cached in it
+    memo : kami.data_structures.indices.TraversalMemo, optional
+        Memo of traversals of the wrapped graph. If specified, the
+        results of `ancestors_of_type`, `descendants_of_type`,
+        `subcomponents`, `get_protoform_of` and `get_attached_bnd`
+        (if not immediate) are memoized. The memo must be invalidated
+        on the modifications of the graph (the memo of an action graph
+        index is invalidated by its corpus or model)
     """
 
     def __init__(self, graph, meta_typing, immediate=True,
-                 hierarchy=None, graph_id=None, meta_model_id=None):
+                 hierarchy=None, graph_id=None, meta_model_id=None,
+                 index=None, memo=None):
         """Initialize entity identifier."""
         self.graph = graph
         self.meta_typing = meta_typing
@@ -133,6 +385,56 @@ class EntityIdentifier:
         self.hierarchy = hierarchy
         self.graph_id = graph_id
         self.meta_model_id = meta_model_id
+        self.index = index
+        self.memo = memo
+        self._frozen = isinstance(graph, FrozenActionGraph)
+        # Footprint of the memoized traversal being computed
+        self._footprint = None
+
+    def _predecessors(self, node_id):
+        """Get predecessors of the node (recorded in the footprint)."""
+        predecessors = self.graph.predecessors(node_id)
+        if self._footprint is not None:
+            predecessors = list(predecessors)
+            self._footprint.add(node_id)
+            self._footprint.update(predecessors)
+        return predecessors
+
+    def _successors(self, node_id):
+        """Get successors of the node (recorded in the footprint)."""
+        successors = self.graph.successors(node_id)
+        if self._footprint is not None:
+            successors = list(successors)
+            self._footprint.add(node_id)
+            self._footprint.update(successors)
+        return successors
+
+    def _memoized(self, key, node_id, traverse):
+        """Get the result of the traversal from the node using the memo."""
+        if self.memo is None:
+            return traverse()
+        entry = self.memo.lookup(key)
+        if entry is None:
+            outer_footprint = self._footprint
+            self._footprint = set([node_id])
+            try:
+                result = traverse()
+                footprint = self._footprint
+            finally:
+                self._footprint = outer_footprint
+            if isinstance(result, (list, set)):
+                result = tuple(result) if isinstance(result, list)\
+                    else frozenset(result)
+            self.memo.store(key, result, footprint)
+        else:
+            result, footprint = entry
+        if self._footprint is not None:
+            self._footprint.update(footprint)
+        if isinstance(result, tuple):
+            return list(result)
+        elif isinstance(result, frozenset):
+            return set(result)
+        return result
 
     def find_matching_in_graph(self, pattern, lhs_typing=None,
                                nodes=None):
@@ -173,6 +475,10 @@ class EntityIdentifier:
 
     def nodes_of_type(self, type_name):
         """Get action graph nodes of a specified type."""
+        if self._frozen:
+            return self.graph.nodes_of_type(type_name)
+        if self.index is not None:
+            return self.index.nodes_of_type(type_name)
         nodes = []
         for node in self.graph.nodes():
             if node in self.meta_typing:
@@ -190,26 +496,37 @@ class EntityIdentifier:
 
     def predecessors_of_type(self, node_id, meta_type):
         """Get all the predecessors of the node with the specified type."""
+        if self._frozen:
+            return self.graph.predecessors_of_type(node_id, meta_type)
         preds = []
-        for pred in self.graph.predecessors(node_id):
+        for pred in self._predecessors(node_id):
             if self.meta_typing[pred] == meta_type:
                 preds.append(pred)
         return preds
 
     def successors_of_type(self, node_id, meta_type):
         """Get all the successors of the node with the specified type."""
+        if self._frozen:
+            return self.graph.successors_of_type(node_id, meta_type)
         sucs = []
-        for suc in self.graph.successors(node_id):
+        for suc in self._successors(node_id):
             if self.meta_typing[suc] == meta_type:
                 sucs.append(suc)
         return sucs
 
     def ancestors_of_type(self, node_id, meta_type):
         """Get all the ancestors of the node with the specified type."""
+        if self._frozen:
+            return self.graph.ancestors_of_type(node_id, meta_type)
+        return self._memoized(
+            ("ancestors_of_type", node_id, meta_type), node_id,
+            lambda: self._ancestors_of_type(node_id, meta_type))
+
+    def _ancestors_of_type(self, node_id, meta_type):
         ancestors = self.predecessors_of_type(node_id, meta_type)
         visited = set()
         next_level_to_visit = set([
-            p for p in self.graph.predecessors(node_id)
+            p for p in self._predecessors(node_id)
             if meta_type == "mod" or meta_type == "bnd" or (
                 self.meta_typing[p] != "mod" and self.meta_typing[p] != "bnd")
         ])
@@ -221,7 +538,7 @@ class EntityIdentifier:
                     ancestors += self.predecessors_of_type(n, meta_type)
                 new_level_to_visit.update(
                     set([
-                        p for p in self.graph.predecessors(n)
+                        p for p in self._predecessors(n)
                         if meta_type == "mod" or meta_type == "bnd" or (
                             self.meta_typing[p] != "mod" and
                             self.meta_typing[p] != "bnd")
@@ -231,9 +548,16 @@ class EntityIdentifier:
 
     def descendants_of_type(self, node_id, meta_type):
         """Get all the descendants of the node with the specified type."""
+        if self._frozen:
+            return self.graph.descendants_of_type(node_id, meta_type)
+        return self._memoized(
+            ("descendants_of_type", node_id, meta_type), node_id,
+            lambda: self._descendants_of_type(node_id, meta_type))
+
+    def _descendants_of_type(self, node_id, meta_type):
         ancestors = self.successors_of_type(node_id, meta_type)
         visited = set()
-        next_level_to_visit = set(self.graph.successors(node_id))
+        next_level_to_visit = set(self._successors(node_id))
         while len(next_level_to_visit) > 0:
             new_level_to_visit = set()
             for n in next_level_to_visit:
@@ -241,18 +565,25 @@ class EntityIdentifier:
                     visited.add(n)
                     ancestors += self.successors_of_type(n, meta_type)
                 new_level_to_visit.update(
-                    set(self.graph.successors(n)))
+                    set(self._successors(n)))
             next_level_to_visit = new_level_to_visit
         return ancestors
 
     def get_protoform_of(self, node_id):
         """Get protoform of the node id."""
+        if self._frozen:
+            return self.graph.get_protoform_of(node_id)
+        return self._memoized(
+            ("get_protoform_of", node_id), node_id,
+            lambda: self._get_protoform_of(node_id))
+
+    def _get_protoform_of(self, node_id):
         if self.meta_typing[node_id] == "protoform":
             return node_id
         else:
             # bfs to find a protoform
             visited = set()
-            next_level_to_visit = set(self.graph.successors(node_id))
+            next_level_to_visit = set(self._successors(node_id))
             while len(next_level_to_visit) > 0:
                 new_level_to_visit = set()
                 for n in next_level_to_visit:
@@ -261,7 +592,7 @@ class EntityIdentifier:
                         if self.meta_typing[n] == "protoform":
                             return n
                     new_level_to_visit.update(
-                        set(self.graph.successors(n)))
+                        set(self._successors(n)))
                 next_level_to_visit = new_level_to_visit
         raise ValueError(
             "No protoform node is associated with an element '{}'".fromat(
@@ -298,6 +629,12 @@ class EntityIdentifier:
 
     def identify_protoform(self, protoform):
         """Find protoform using the input entity."""
+        if self.index is not None:
+            candidates = self.index.get_protoforms_by_uniprot(
+                protoform.uniprotid)
+            if len(candidates) > 0:
+                return candidates[0]
+            return None
         for node in self.get_protoforms():
             gene_attrs = self.graph.get_node(node)
             if "uniprotid" in gene_attrs.keys() and\
@@ -307,6 +644,16 @@ class EntityIdentifier:
 
     def identify_protein(self, protein):
         """Find protein using the input entity."""
+        if self.index is not None:
+            if protein.name:
+                candidates = self.index.get_protoforms_by_variant(
+                    protein.protoform.uniprotid, protein.name)
+            else:
+                candidates = self.index.get_protoforms_by_uniprot(
+                    protein.protoform.uniprotid)
+            if len(candidates) > 0:
+                return candidates[0]
+            return None
         for node in self.get_protoforms():
             gene_attrs = self.graph.get_node(node)
             if "uniprotid" in gene_attrs.keys() and\
@@ -319,44 +666,80 @@ class EntityIdentifier:
                     return node
         return None
 
+    def _get_component_index(self, node_id, component_type, index_cls):
+        def _build():
+            return index_cls({
+                c: (self.graph.get_node(c), self.graph.get_edge(c, node_id))
+                for c in self.predecessors_of_type(node_id, component_type)
+            })
+
+        if self.index is not None and not self._frozen:
+            return self.index.get_fragment_index(
+                node_id, component_type, _build)
+        return _build()
+
+    def get_fragment_index(self, node_id, fragment_type):
+        """Get the index of fragments immediately attached to the node.
+
+        If the identifier uses an action graph index, the fragment
+        index is cached in it until the node or its fragments are
+        rewritten.
+        """
+        return self._get_component_index(
+            node_id, fragment_type, FragmentIndex)
+
+    def get_ancestor_fragment_index(self, node_id, fragment_type):
+        """Get the index of all the fragments attached to the node.
+
+        If the identifier uses an action graph index, the fragment
+        index is cached in it until one of the nodes traversed to
+        find the fragments is rewritten.
+        """
+        footprint = set()
+
+        def _build():
+            outer_footprint = self._footprint
+            self._footprint = set([node_id])
+            try:
+                fragments = self.ancestors_of_type(node_id, fragment_type)
+                footprint.update(self._footprint)
+            finally:
+                self._footprint = outer_footprint
+            return FragmentIndex({
+                f: (self.graph.get_node(f), self.graph.get_edge(f, node_id))
+                for f in fragments
+            })
+
+        if self.index is not None and not self._frozen:
+            return self.index.get_fragment_index(
+                node_id, fragment_type, _build,
+                ancestors=True, footprint=footprint)
+        return _build()
+
+    def get_residue_index(self, node_id):
+        """Get the index of residues immediately attached to the node.
+
+        If the identifier uses an action graph index, the residue
+        index is cached in it until the node or its residues are
+        rewritten.
+        """
+        return self._get_component_index(node_id, "residue", ResidueIndex)
+
+    def _invalidate_residue_index(self, node_id):
+        """Invalidate the cached residue index after adding an aa."""
+        if self.index is not None:
+            self.index.invalidate_attached_fragments(node_id)
+
     def _identify_fragment(self, fragment,
                            ref_agent, fragment_type, name=True):
         """Identify fragment (region or site) using the entity."""
         if self.immediate:
-            fragment_candidates = self.predecessors_of_type(
-                ref_agent, fragment_type)
-            return find_fragment(
-                fragment.meta_data(), fragment.location(),
-                {
-                    f: (
-                        self.graph.get_node(f),
-                        self.graph.get_edge(f, ref_agent)
-                    )
-                    for f in fragment_candidates
-                },
-                name
-            )
+            return self.get_fragment_index(ref_agent, fragment_type).find(
+                fragment.meta_data(), fragment.location())
         else:
-            fragment_candidates = self.ancestors_of_type(
-                ref_agent, fragment_type)
-            candidates_data = dict()
-            for f in fragment_candidates:
-                node_data = self.graph.get_node(f)
-                for s in self.graph.successors(f):
-                    location_data = self.graph.get_edge(f, s)
-                    candidates_data[f] = (node_data, location_data)
-
-            return find_fragment(
-                fragment.meta_data(), fragment.location(),
-                {
-                    f: (
-                        self.graph.get_node(f),
-                        self.graph.get_edge(f, ref_agent)
-                    )
-                    for f in fragment_candidates
-                },
-                name
-            )
+            return self.get_ancestor_fragment_index(
+                ref_agent, fragment_type).find(
+                    fragment.meta_data(), fragment.location())
 
     def identify_region(self, region, ref_agent):
         """Find corresponding region in the graph."""
@@ -399,7 +782,17 @@ class EntityIdentifier:
         ref_gene = self.get_protoform_of(ref_agent)
         ref_uniprot = get_uniprot(self.graph.get_node(ref_gene))
 
-        residue_candidates = self.get_attached_residues(ref_gene)
+        if self.immediate and ref_agent == ref_gene:
+            residue_index = self.get_residue_index(ref_gene)
+            if residue.loc is not None:
+                residue_candidates = residue_index.residues_at(residue.loc)
+            elif add_aa is True:
+                residue_candidates = residue_index.unlocated_residues()
+            else:
+                residue_candidates =\
+                    residue_index.unlocated_residues_with_aa(residue.aa)
+        else:
+            residue_candidates = self.get_attached_residues(ref_gene)
 
         if residue.loc is not None:
             for res in residue_candidates:
@@ -441,6 +834,7 @@ class EntityIdentifier:
                                     self.graph.add_node_attrs(
                                         res,
                                         {"aa": res_node["aa"].union(residue.aa)})
+                                self._invalidate_residue_index(ref_gene)
                             return res
         else:
             for res in residue_candidates:
@@ -485,6 +879,7 @@ class EntityIdentifier:
                                 self.graph.add_node_attrs(
                                     res,
                                     {"aa": res_node["aa"].union(residue.aa)})
+                            self._invalidate_residue_index(ref_gene)
                             return res
         return None
 
@@ -515,7 +910,14 @@ class EntityIdentifier:
         For example, if the input node_id is a protoform, returns all the
         regions, sites, residues and states attached to the protoform.
         """
-        all_predecessors = list(self.graph.predecessors(node_id))
+        if self._frozen:
+            return self.graph.subcomponents(node_id)
+        return self._memoized(
+            ("subcomponents", node_id), node_id,
+            lambda: self._subcomponents(node_id))
+
+    def _subcomponents(self, node_id):
+        all_predecessors = list(self._predecessors(node_id))
         subcomponents = set([
             p for p in all_predecessors
             if self.meta_typing[p] != "mod" and self.meta_typing[p] != "bnd"
@@ -532,7 +934,7 @@ class EntityIdentifier:
                     visited.add(n)
                     new_anc = set([
                         p
-                        for p in self.graph.predecessors(n)
+                        for p in self._predecessors(n)
                         if self.meta_typing[p] != "mod" and
                         self.meta_typing[p] != "bnd"
                     ])
@@ -543,12 +945,18 @@ class EntityIdentifier:
 
     def get_attached_bnd(self, node):
         """Get BND nodes attached to the specified node."""
+        if self.immediate:
+            return list(set(self.successors_of_type(node, "bnd")))
+        return self._memoized(
+            ("get_attached_bnd", node), node,
+            lambda: self._get_attached_bnd(node))
+
+    def _get_attached_bnd(self, node):
         result = self.successors_of_type(node, "bnd")
-        if not self.immediate:
-            for r in self.get_attached_regions(node):
-                result += self.successors_of_type(r, "bnd")
-            for s in self.get_attached_sites(node):
-                result += self.successors_of_type(s, "bnd")
+        for r in self.get_attached_regions(node):
+            result += self.successors_of_type(r, "bnd")
+        for s in self.get_attached_sites(node):
+            result += self.successors_of_type(s, "bnd")
         return list(set(result))
 
     def identify_bnd_template(self, bnd_node):
@@ -702,7 +1110,11 @@ class EntityIdentifier:
 
     def get_protoform_by_uniprot(self, uniprotid):
         """Get a protoform by the UniProt AC."""
-        for protoform in self.get_protoforms():
+        if self.index is not None:
+            protoforms = self.index.get_protoforms_by_uniprot(uniprotid)
+        else:
+            protoforms = self.get_protoforms()
+        for protoform in protoforms:
             attrs = self.graph.get_node(protoform)
             u = list(attrs["uniprotid"])[0]
             if u == uniprotid:
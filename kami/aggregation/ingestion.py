@@ -0,0 +1,376 @@
+"""Parallel ingestion of interactions into KAMI corpora.
+
+Nuggets are generated in the read-only mode by a pool of worker
+processes against a frozen snapshot of the action graph, and are then
+committed to the corpus one by one in the order of the input
+interactions. Before being committed, the reference typing of every
+generated nugget is re-validated against the current action graph:
+if the action graph changed in a way that may affect the identification
+of its entities, the nugget is regenerated from the corpus. The snapshot
+is refreshed only after the commit stages that changed the action graph.
+
+`ActionGraphSnapshot`
+`add_interactions_in_parallel`
+"""
+import logging
+import math
+import multiprocessing
+import pickle
+import traceback
+
+from regraph import NXGraph
+
+from kami.aggregation.generators import generate_nugget
+from kami.aggregation.identifiers import EntityIdentifier, get_uniprot
+from kami.data_structures.indices import ActionGraphIndex
+from kami.exceptions import KamiHierarchyError
+
+
+class ActionGraphSnapshot(object):
+    """Frozen copy of the action graph of a corpus.
+
+    The snapshot provides the interface used by `generate_nugget`
+    in the read-only mode and can be sent to worker processes.
+
+    Attributes
+    ----------
+    action_graph : NXGraph
+        Copy of the action graph
+    _action_graph_typing : dict
+        Copy of the typing of the action graph by the meta-model
+    _ag_index : kami.data_structures.indices.ActionGraphIndex
+        Index of the copied action graph
+    """
+
+    def __init__(self, corpus):
+        """Initialize a snapshot of the action graph of the corpus."""
+        self._action_graph_id = corpus._action_graph_id
+        self.action_graph = NXGraph.copy(corpus.action_graph)
+        self._action_graph_typing = dict(corpus.get_action_graph_typing())
+        self._ag_index = ActionGraphIndex(
+            self.action_graph, self._action_graph_typing)
+
+    def get_action_graph_typing(self):
+        """Get typing of the action graph by meta model."""
+        return self._action_graph_typing
+
+
+# Default number of interactions generated from the same snapshot
+DEFAULT_CHUNK_SIZE = 100
+
+_FRAGMENT_TYPES = ["region", "site", "residue", "state"]
+
+_ACTION_TYPES = ["mod", "bnd"]
+
+logger = logging.getLogger(__name__)
+
+_worker_snapshot = None
+_worker_snapshot_version = None
+
+
+def _generate_nuggets_in_worker(task):
+    """Generate the nuggets of a batch of interactions in a worker.
+
+    The task is a tuple (version, data, interactions), where `data` is
+    the pickled snapshot of the action graph. The snapshot is unpickled
+    only if the worker does not hold this version of it yet.
+    """
+    global _worker_snapshot, _worker_snapshot_version
+    version, data, interactions = task
+    if version != _worker_snapshot_version:
+        _worker_snapshot = pickle.loads(data)
+        _worker_snapshot_version = version
+    return [
+        _generate_nugget_in_worker(interaction)
+        for interaction in interactions
+    ]
+
+
+def _generate_nugget_in_worker(interaction):
+    """Generate a nugget against the snapshot of the worker.
+
+    Returns
+    -------
+    (result, error)
+        Result of `generate_nugget` and None, or None and the
+        traceback of the error (the nugget is then regenerated, and
+        the error is raised, at the commit stage)
+    """
+    try:
+        return (
+            generate_nugget(_worker_snapshot, interaction, readonly=True),
+            None
+        )
+    except Exception:
+        return (None, traceback.format_exc())
+
+
+def _attrs_fingerprint(attrs, ignore=None):
+    return frozenset(
+        (k, frozenset(v)) for k, v in attrs.items()
+        if ignore is None or k not in ignore)
+
+
+def _fragments_fingerprint(identifier, protoform, meta_types):
+    """Get a fingerprint of the fragments of the protoform.
+
+    The fingerprint contains the attributes used for the
+    identification of the fragments of the specified types: their
+    node attributes and the attributes of the edges to their
+    successors (except for the flags of transitive edges set
+    by the bookkeeping).
+    """
+    graph = identifier.graph
+    meta_typing = identifier.meta_typing
+    fingerprint = dict()
+    for n in identifier.subcomponents(protoform):
+        if meta_typing[n] in meta_types:
+            edges = frozenset(
+                (t, _attrs_fingerprint(graph.get_edge(n, t), ["type"]))
+                for t in graph.successors(n)
+                if meta_typing[t] != "mod" and meta_typing[t] != "bnd")
+            fingerprint[n] = (
+                meta_typing[n], _attrs_fingerprint(graph.get_node(n)), edges)
+    return fingerprint
+
+
+def _invalidate_fingerprints(fingerprints, nodes):
+    """Remove the fingerprints of the protoforms from the nodes."""
+    for key in [k for k in fingerprints if k[0] in nodes]:
+        del fingerprints[key]
+
+
+def _entity_adjacency(graph, meta_typing, node):
+    """Get the attributes of the node and of its edges to entities."""
+    return (
+        _attrs_fingerprint(graph.get_node(node)),
+        frozenset(
+            (t, _attrs_fingerprint(graph.get_edge(node, t)))
+            for t in graph.successors(node)
+            if meta_typing[t] not in _ACTION_TYPES),
+        frozenset(
+            s for s in graph.predecessors(node)
+            if meta_typing[s] not in _ACTION_TYPES)
+    )
+
+
+def _action_graph_changed(corpus, snapshot, ag_nodes):
+    """Test if the entities of the action graph changed since the snapshot.
+
+    The numbers of nodes of each type (except for the action nodes,
+    not used by the identification of entities) and the attributes
+    and the adjacent edges of the specified entity nodes are compared
+    (changes missed by this test are still detected by `_is_up_to_date`).
+    """
+    def _entity_counts(index):
+        return {
+            t: n for t, n in index.type_counts().items()
+            if t not in _ACTION_TYPES
+        }
+
+    if _entity_counts(corpus._ag_index) !=\
+            _entity_counts(snapshot._ag_index):
+        return True
+    ag_typing = corpus.get_action_graph_typing()
+    old_typing = snapshot.get_action_graph_typing()
+    for node in ag_nodes:
+        if ag_typing[node] in _ACTION_TYPES:
+            continue
+        if node not in old_typing or\
+                _entity_adjacency(corpus.action_graph, ag_typing, node) !=\
+                _entity_adjacency(snapshot.action_graph, old_typing, node):
+            return True
+    return False
+
+
+def _is_up_to_date(corpus, snapshot, nugget_container,
+                   snapshot_fingerprints, fingerprints):
+    """Test if the nugget generated from the snapshot is still valid.
+
+    The nugget is valid if its identified nodes are still present in
+    the action graph with the same type and if the identification of
+    its entities cannot change: no protoform with its UniProt ACs was
+    added and the fragments of the types present in the nugget were
+    neither added to these protoforms nor modified.
+
+    The fingerprints of the fragments of the protoforms in the snapshot
+    and in the corpus are cached in `snapshot_fingerprints` and
+    `fingerprints` respectively.
+    """
+    ag_nodes = corpus.action_graph.nodes()
+    ag_typing = corpus.get_action_graph_typing()
+    for node, ag_node in nugget_container.reference_typing.items():
+        if ag_node not in ag_nodes or\
+           ag_typing[ag_node] != snapshot._action_graph_typing[ag_node]:
+            return False
+
+    meta_types = frozenset(
+        nugget_container.meta_typing[n] for n in nugget_container.nodes()
+        if nugget_container.meta_typing[n] in _FRAGMENT_TYPES)
+    identifier = corpus.get_entity_identifier()
+    snapshot_identifier = None
+    for node in nugget_container.nodes():
+        if nugget_container.meta_typing[node] == "protoform":
+            uniprotid = get_uniprot(nugget_container.graph.get_node(node))
+            old_protoforms = snapshot._ag_index.get_protoforms_by_uniprot(
+                uniprotid)
+            new_protoforms = corpus._ag_index.get_protoforms_by_uniprot(
+                uniprotid)
+            if set(old_protoforms) != set(new_protoforms):
+                return False
+            for protoform in new_protoforms:
+                old_variants = snapshot.action_graph.get_node(
+                    protoform).get("variant_name", set())
+                new_variants = corpus.action_graph.get_node(
+                    protoform).get("variant_name", set())
+                if set(old_variants) != set(new_variants):
+                    return False
+                if len(meta_types) == 0:
+                    continue
+                key = (protoform, meta_types)
+                if key not in snapshot_fingerprints:
+                    if snapshot_identifier is None:
+                        snapshot_identifier = EntityIdentifier(
+                            snapshot.action_graph,
+                            snapshot.get_action_graph_typing())
+                    snapshot_fingerprints[key] = _fragments_fingerprint(
+                        snapshot_identifier, protoform, meta_types)
+                if key not in fingerprints:
+                    fingerprints[key] = _fragments_fingerprint(
+                        identifier, protoform, meta_types)
+                if fingerprints[key] != snapshot_fingerprints[key]:
+                    return False
+    return True
+
+
+def _commit_nuggets(corpus, snapshot, interactions, results,
+                    snapshot_fingerprints, report, add_agents,
+                    anatomize, apply_semantics):
+    """Commit the nuggets generated from the snapshot to the corpus."""
+    # Fingerprints of the protoforms of the corpus, removed when
+    # the nuggets containing the protoforms are committed
+    fingerprints = dict()
+    nugget_ids = []
+    for interaction, (result, error) in zip(interactions, results):
+        if result is None:
+            report["failed"] += 1
+            logger.warning(
+                "Nugget generation failed in a worker process "
+                "(the nugget is regenerated from the corpus):\n%s",
+                error)
+            result = generate_nugget(corpus, interaction)
+        elif _is_up_to_date(
+                corpus, snapshot, result[0], snapshot_fingerprints,
+                fingerprints):
+            report["generated"] += 1
+        else:
+            report["regenerated"] += 1
+            result = generate_nugget(corpus, interaction)
+        (
+            nugget_container,
+            nugget_type,
+            template_rels,
+            desc
+        ) = result
+        nugget_id = corpus.add_nugget(
+            nugget_container=nugget_container,
+            nugget_type=nugget_type,
+            template_rels=template_rels,
+            desc=desc,
+            add_agents=add_agents,
+            anatomize=anatomize,
+            apply_semantics=apply_semantics)
+        nugget_ids.append(nugget_id)
+        _invalidate_fingerprints(
+            fingerprints, corpus._typing_index.nodes_of_nugget(nugget_id))
+    return nugget_ids
+
+
+def add_interactions_in_parallel(corpus, interactions, processes=None,
+                                 chunk_size=None, add_agents=True,
+                                 anatomize=True, apply_semantics=True,
+                                 report=None):
+    """Add interactions to the corpus generating nuggets in parallel.
+
+    Parameters
+    ----------
+    corpus : kami.data_structures.corpora.KamiCorpus
+        NetworkX-based corpus where the interactions are added
+    interactions : iterable of kami.data_structures.interactions.Interaction
+    processes : int, optional
+        Number of worker processes (by default, the number of CPUs)
+    chunk_size : int, optional
+        Number of interactions generated before their nuggets are
+        committed (by default, `DEFAULT_CHUNK_SIZE`), the snapshot of
+        the action graph is refreshed after the commit stages that
+        changed the action graph. Smaller chunks reduce the number
+        of nuggets regenerated at the commit stage
+    add_agents : bool, optional
+    anatomize : bool, optional
+    apply_semantics : bool, optional
+    report : dict, optional
+        Dictionary to fill with the statistics of the ingestion: the
+        number of nuggets generated in parallel ('generated'), the
+        number of nuggets regenerated at the commit stage because the
+        action graph changed since their snapshot ('regenerated') and
+        the number of nuggets whose generation failed in the worker
+        processes ('failed') and the number of snapshots of the action
+        graph taken ('snapshots')
+
+    Returns
+    -------
+    nugget_ids : list
+        Ids of the added nuggets (in the order of the input interactions)
+    """
+    if corpus._backend != "networkx":
+        raise KamiHierarchyError(
+            "Parallel generation of nuggets is available only " +
+            "for networkx-based corpora")
+    if corpus.action_graph is None:
+        corpus.create_empty_action_graph()
+
+    interactions = list(interactions)
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    if report is None:
+        report = dict()
+    report.update(
+        {"generated": 0, "regenerated": 0, "failed": 0, "snapshots": 0})
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    nugget_ids = []
+    snapshot = None
+    pool = multiprocessing.Pool(processes)
+    try:
+        for i in range(0, len(interactions), chunk_size):
+            chunk = interactions[i:i + chunk_size]
+            if snapshot is None:
+                snapshot = ActionGraphSnapshot(corpus)
+                report["snapshots"] += 1
+                data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+                snapshot_fingerprints = dict()
+            # The chunk is split into one batch per worker process
+            batch_size = int(math.ceil(len(chunk) / processes))
+            batches = pool.map(_generate_nuggets_in_worker, [
+                (report["snapshots"], data, chunk[j:j + batch_size])
+                for j in range(0, len(chunk), batch_size)
+            ])
+            results = [result for batch in batches for result in batch]
+
+            chunk_ids = _commit_nuggets(
+                corpus, snapshot, chunk, results, snapshot_fingerprints,
+                report, add_agents, anatomize, apply_semantics)
+            nugget_ids += chunk_ids
+
+            ag_nodes = set()
+            for nugget_id in chunk_ids:
+                ag_nodes.update(
+                    corpus._typing_index.nodes_of_nugget(nugget_id))
+            if _action_graph_changed(corpus, snapshot, ag_nodes):
+                snapshot = None
+    finally:
+        pool.close()
+        pool.join()
+    return nugget_ids
@@ -3,8 +3,11 @@
 Corpora in KAMI are decontextualised signalling knowledge bases.
 """
 import datetime
+import gzip
 import json
 import os
+import time
+from contextlib import contextmanager
 
 from kami.resources import default_components
 
@@ -12,28 +15,84 @@ from regraph import (Rule, Neo4jHierarchy, NXHierarchy, NXGraph)
 from regraph.audit import VersionedHierarchy
 from regraph.utils import relation_to_json, attrs_to_json, attrs_from_json
 
-from anatomizer.anatomizer_light import fetch_canonical_sequence
+from anatomizer.anatomizer_light import (fetch_canonical_sequence,
+                                         prefetch_gene_data,
+                                         discard_prefetched)
 
 from kami.utils.generic import (normalize_to_set,
-                                nodes_of_type,
                                 _init_from_data,
+                                _check_nugget_json,
+                                _nugget_attrs_from_json,
+                                _add_nugget_graph_from_json,
+                                _unshare_graphs,
                                 _generate_ref_agent_str)
 from kami.utils.id_generators import generate_new_id
+from kami.utils.json_streams import (iter_json_records, iter_chunks,
+                                     iter_json_object, read_json_value,
+                                     open_json_file)
+from kami.utils.snapshots import write_snapshot, read_snapshot
 from kami.aggregation.bookkeeping import (anatomize_gene,
                                           apply_bookkeeping,
                                           reconnect_residues,
                                           reconnect_sites)
 from kami.aggregation.generators import generate_nugget
+from kami.aggregation.ingestion import add_interactions_in_parallel
 from kami.aggregation.semantics import (apply_mod_semantics,
                                         apply_bnd_semantics)
 from kami.aggregation.identifiers import EntityIdentifier
 from kami.data_structures.annotations import CorpusAnnotation, ModelAnnotation
+from kami.data_structures.definitions import compose_instantiation_rules
+from kami.data_structures.frozen import FrozenActionGraph
+from kami.data_structures.revisions import RevisionRecorder
+from kami.data_structures.transactions import (Transaction,
+                                               hierarchy_elements,
+                                               discard_added_elements)
+from kami.data_structures.indices import (ActionGraphIndex, NuggetRegistry,
+                                          InteractionIndex, TypingIndex,
+                                          affected_nodes)
 from kami.data_structures.models import KamiModel
 from kami.data_structures.interactions import Interaction
 
 from kami.exceptions import KamiHierarchyError, KamiException
 
 
+# Nodes of the templates of nuggets typing the source
+# and the target of the interaction of a nugget
+_INTERACTION_ROLES = {
+    "mod_template": ("enzyme", "substrate"),
+    "bnd_template": ("left_partner", "right_partner")
+}
+
+
+def _interaction_from_json(template_rel, typing):
+    """Get the AG nodes typing the ends of the interaction of a nugget.
+
+    Parameters
+    ----------
+    template_rel : (str, dict)
+        Json repr of the relation of the nugget to its template
+    typing : dict
+        Json repr of the typing of the nugget by the action graph
+
+    Returns
+    -------
+    (source, target)
+        Nodes of the action graph typing the source and the target
+        of the interaction, or None if the nugget has no interaction
+    """
+    template, rel = template_rel
+    if template not in _INTERACTION_ROLES:
+        return None
+    ends = []
+    for role in _INTERACTION_ROLES[template]:
+        nodes = [n for n, template_nodes in rel.items()
+                 if role in template_nodes]
+        if len(nodes) == 0:
+            return None
+        ends.append(typing[nodes[0]])
+    return tuple(ends)
+
+
 class KamiCorpus(object):
     """Class for KAMI knowledge corpora.
 
@@ -46,6 +105,22 @@ class KamiCorpus(object):
         Graph hierarchy object containg the corpus
     _action_graph_id : hashable
         Id of the action graph in the graph hierarchy
+    _ag_index : kami.data_structures.indices.ActionGraphIndex
+        Index of the action graph nodes maintained by the rewrites
+        of the corpus
+    _nugget_registry : kami.data_structures.indices.NuggetRegistry
+        Registry of the nuggets, semantic nuggets and templates
+        of the corpus
+    _shared_graphs : set
+        Set of ids of the nugget graphs shared with the models
+        instantiated in the copy-on-write mode (see `instantiate`)
+    _lazy_nuggets : dict
+        Dictionary whose keys are the ids of the lazily loaded nuggets
+        (see `load_json`) and whose values are tuples (filename, start,
+        end, ag_nodes, interaction): the location of the json record of
+        the nugget, the action graph nodes typing the nugget and the
+        action graph nodes typing the source and the target of its
+        interaction (or None)
 
 
     annotation: kami.data_structures.annotations.CorpusAnnotation
@@ -65,7 +140,7 @@ class KamiCorpus(object):
                  creation_time=None, last_modified=None,
                  backend="networkx",
                  uri=None, user=None, password=None, driver=None,
-                 data=None):
+                 data=None, revision_policy=None):
         """Initialize a KAMI corpus.
 
         By default action graph is empty, typed by `meta_model` (meta-model)
@@ -74,6 +149,9 @@ class KamiCorpus(object):
         the action graph nodes by the meta-model.
         `self.mod_template` and `self.bnd_template` -- direct access to
         the nugget template graphs.
+        `revision_policy` -- kami.data_structures.revisions.RevisionPolicy
+        defining how the updates of the corpus are recorded in its
+        revision history.
         """
         self._id = corpus_id
         self._action_graph_id = self._id + "_action_graph"
@@ -84,6 +162,7 @@ class KamiCorpus(object):
             self._hierarchy = Neo4jHierarchy(
                 uri=uri, user=user, password=password, driver=driver)
         self._versioning = VersionedHierarchy(self._hierarchy)
+        self._revisions = RevisionRecorder(revision_policy)
 
         if creation_time is None:
             creation_time = datetime.datetime.now().strftime(
@@ -119,11 +198,17 @@ class KamiCorpus(object):
             if (u, v) not in self._hierarchy.relations():
                 self._hierarchy.add_relation(u, v, rel, attrs)
 
+        self._lazy_nuggets = dict()
+        self._nugget_registry = None
+        self._init_nugget_registry()
+        self._shared_graphs = set()
+
         # Initialization of knowledge-related components
         # Action graph related init
         _init_from_data(self, data)
 
         self._init_shortcuts()
+        self._init_indices()
         return
 
     def _init_shortcuts(self):
@@ -140,20 +225,156 @@ class KamiCorpus(object):
             "bnd_template")
         self.semantic_action_graph = self._hierarchy.get_graph(
             "semantic_action_graph")
-        self._nugget_count = len(self.nuggets())
+        self._nugget_count = self._nugget_registry.count_nuggets()
+
+    def _init_nugget_registry(self):
+        """Build the registry of nuggets from the hierarchy graphs.
+
+        Lazily loaded nuggets (whose graphs are not yet in the
+        hierarchy) remain registered.
+        """
+        registry = NuggetRegistry()
+        registry.rebuild(self._hierarchy, self.is_nugget_graph)
+        if self._nugget_registry is not None:
+            registry.copy_nuggets(self._nugget_registry, self._lazy_nuggets)
+        self._nugget_registry = registry
+
+    def _init_indices(self):
+        """Build the indices of the action graph from scratch."""
+        self._ag_index = ActionGraphIndex(
+            self.action_graph, self.get_action_graph_typing())
+        self._init_typing_index()
+        # Built on demand (see `_get_interaction_index`)
+        self._interaction_index = None
+
+    def _init_typing_index(self):
+        """Build the reverse index of the typing of nuggets by the AG."""
+        self._typing_index = None
+        if self._backend == "networkx":
+            self._typing_index = TypingIndex()
+            for nugget_id in self.nuggets():
+                self._index_nugget_typing(nugget_id)
+
+    def _update_indices(self, ag_nodes, graph_id=None):
+        """Re-index the specified nodes of the action graph.
+
+        If `graph_id` is specified, the nuggets affected by the rewrite
+        of this graph are re-indexed.
+        """
+        if self.action_graph is not None:
+            self._ag_index.update(
+                self.action_graph, self.get_action_graph_typing(), ag_nodes)
+        if self._typing_index is not None:
+            # Nuggets typed by the rewritten nodes are still indexed
+            # by the nodes of the action graph preceding the rewrite
+            nuggets = self._typing_index.nuggets_of_nodes(ag_nodes)
+            if graph_id is not None and\
+                    self._nugget_registry.is_nugget(graph_id):
+                nuggets.add(graph_id)
+            for nugget_id in nuggets:
+                self._index_nugget_typing(nugget_id)
+        if self._interaction_index is not None:
+            nuggets = self._interaction_index.nuggets_of_nodes(ag_nodes)
+            if graph_id is not None and\
+                    self._nugget_registry.is_nugget(graph_id):
+                nuggets.add(graph_id)
+            for nugget_id in nuggets:
+                self._index_nugget_interaction(nugget_id)
+
+    def _get_interaction_index(self):
+        """Get the index of pairwise interactions (build it if needed)."""
+        if self._interaction_index is None:
+            self._interaction_index = InteractionIndex()
+            for nugget_id in self.nuggets():
+                self._index_nugget_interaction(nugget_id)
+        return self._interaction_index
+
+    def _index_nugget_typing(self, nugget_id):
+        """Re-index the typing of the nugget by the action graph."""
+        if self._typing_index is None:
+            return
+        if not self._nugget_registry.is_nugget(nugget_id):
+            self._typing_index.remove_nugget(nugget_id)
+        elif nugget_id in self._lazy_nuggets:
+            # Lazily loaded nuggets are indexed by their json typing
+            self._typing_index.add_nugget(
+                nugget_id, self._lazy_nuggets[nugget_id][3])
+        else:
+            self._typing_index.add_nugget(
+                nugget_id, self._hierarchy.get_typing(
+                    nugget_id, self._action_graph_id).values())
+
+    def _get_nuggets_typed_by(self, ag_node):
+        """Get the nuggets typed by the node of the action graph."""
+        if self._typing_index is not None:
+            return self._typing_index.nuggets_of_node(ag_node)
+        return self._hierarchy.graphs_typed_by_node(
+            self._action_graph_id, ag_node)
+
+    def _index_nugget_interaction(self, nugget_id):
+        """Re-index the interaction of the nugget (if the index is built)."""
+        if self._interaction_index is None:
+            return
+        self._interaction_index.remove_nugget(nugget_id)
+        if not self._nugget_registry.is_nugget(nugget_id):
+            return
+        if nugget_id in self._lazy_nuggets:
+            # Lazily loaded nuggets are indexed by their json records
+            interaction = self._lazy_nuggets[nugget_id][4]
+            if interaction is not None:
+                self._interaction_index.add_nugget(
+                    nugget_id, interaction[0], interaction[1],
+                    self.get_nugget_type(nugget_id),
+                    self.get_nugget_desc(nugget_id))
+            return
+        if self.is_mod_nugget(nugget_id):
+            ag_typing = self.get_nugget_typing(nugget_id)
+            source = self.get_enzyme(nugget_id)
+            target = self.get_substrate(nugget_id)
+        elif self.is_bnd_nugget(nugget_id):
+            ag_typing = self.get_nugget_typing(nugget_id)
+            source = self.get_left_partner(nugget_id)
+            target = self.get_right_partner(nugget_id)
+        else:
+            return
+        if source is not None and target is not None:
+            self._interaction_index.add_nugget(
+                nugget_id, ag_typing[source], ag_typing[target],
+                self.get_nugget_type(nugget_id),
+                self.get_nugget_desc(nugget_id))
+
+    def _materialize_nugget(self, nugget_id):
+        """Load the graph of a lazily loaded nugget into the hierarchy."""
+        if nugget_id in self._lazy_nuggets:
+            filename, start, end, _, _ = self._lazy_nuggets[nugget_id]
+            nugget_data = read_json_value(filename, start, end)
+            _add_nugget_graph_from_json(self, nugget_data)
+            del self._lazy_nuggets[nugget_id]
+
+    def _materialize_nuggets(self):
+        """Load the graphs of all the lazily loaded nuggets."""
+        for nugget_id in list(self._lazy_nuggets):
+            self._materialize_nugget(nugget_id)
 
     def get_nugget(self, nugget_id):
         """Get a nugget by ID."""
-        for node_id in self._hierarchy.graphs():
-            if self.is_nugget_graph(node_id):
-                return self._hierarchy.get_graph(nugget_id)
+        if self._nugget_registry.is_nugget(nugget_id):
+            self._materialize_nugget(nugget_id)
+            return self._hierarchy.get_graph(nugget_id)
         raise KamiException("Nugget '{}' is not found".format(nugget_id))
 
     def clear(self):
         """Clear data elements of corpus."""
         for n in self.nuggets():
-            self._hierarchy.remove_graph(n)
+            if n in self._lazy_nuggets:
+                del self._lazy_nuggets[n]
+            else:
+                self._hierarchy.remove_graph(n)
+            self._nugget_registry.remove_nugget(n)
         self._hierarchy.remove_graph(self._action_graph_id)
+        self._shared_graphs = set()
+        self._init_typing_index()
+        self._interaction_index = None
 
     def create_empty_action_graph(self):
         """Creat an empty action graph in the hierarchy."""
@@ -180,16 +401,121 @@ class KamiCorpus(object):
                 rhs_typing=None, strict=False,
                 message="Corpus update", update_type="manual"):
         """Overloading of the rewrite method."""
-        r_g_prime, _ = self._versioning.rewrite(
-            graph_id, rule=rule, instance=instance,
+        if instance is None:
+            lhs_nodes = rule.lhs.nodes()
+        else:
+            lhs_nodes = instance.values()
+        if graph_id == self._action_graph_id and\
+                self._typing_index is not None:
+            # Only the nuggets typed by the rewritten nodes are affected
+            typed_nuggets = self._typing_index.nuggets_of_nodes(lhs_nodes)
+            for nugget_id in typed_nuggets:
+                self._materialize_nugget(nugget_id)
+            _unshare_graphs(self, typed_nuggets)
+        elif rule.is_restrictive() and\
+                not self._nugget_registry.is_nugget(graph_id):
+            # Removals and clones are propagated to the nuggets
+            self._materialize_nuggets()
+            _unshare_graphs(self, list(self._shared_graphs))
+        else:
+            self._materialize_nugget(graph_id)
+            _unshare_graphs(self, [graph_id])
+        touched_nodes = affected_nodes(
+            self._hierarchy, graph_id, self._action_graph_id, lhs_nodes)
+        r_g_prime = self._revisions.rewrite(
+            self._versioning, graph_id, rule=rule, instance=instance,
             rhs_typing=rhs_typing, strict=strict,
             message=message, update_type=update_type)
         self._init_shortcuts()
+        touched_nodes.update(affected_nodes(
+            self._hierarchy, graph_id, self._action_graph_id,
+            r_g_prime.values()))
+        self._update_indices(touched_nodes, graph_id)
         return r_g_prime
 
+    def operation(self, message, update_type="manual"):
+        """Get the context of a logical operation on the corpus.
+
+        If revision coalescing is enabled by the revision policy,
+        all the rewrites performed in the context are recorded as
+        a single revision::
+
+            with corpus.operation("Added the interactions"):
+                corpus.add_interaction(interaction1)
+                corpus.add_interaction(interaction2)
+        """
+        return self._revisions.operation(
+            self._versioning, message, update_type)
+
+    @contextmanager
+    def transaction(self, message, update_type="manual"):
+        """Get the context of a transaction on the action graph.
+
+        The edits collected by the transaction (see
+        `kami.data_structures.transactions.Transaction`) are applied
+        as a single rewrite of the action graph on exit, and all the
+        rewrites performed in the context are recorded as a single
+        revision. If an error occurs, the collected edits are discarded,
+        the rewrites performed in the context are reverted and the
+        graphs (for example, nuggets), typings and relations added in
+        the context are removed::
+
+            with corpus.transaction("Merged residues") as t:
+                t.add_edge(residue, site, {"loc": 100})
+                t.merge_nodes([residue, other_residue])
+        """
+        if self.action_graph is None:
+            self.create_empty_action_graph()
+        transaction = Transaction(self.action_graph)
+        elements = hierarchy_elements(self._hierarchy)
+        lazy_nuggets = set(self._lazy_nuggets)
+        try:
+            with self._revisions.transaction(
+                    self._versioning, message, update_type):
+                yield transaction
+                transaction.commit(
+                    self, self._action_graph_id, message, update_type)
+        except BaseException:
+            # Nuggets materialized in the context are kept
+            removed_graphs = discard_added_elements(
+                self._hierarchy, elements, keep=lazy_nuggets)
+            self._shared_graphs.difference_update(removed_graphs)
+            self._init_nugget_registry()
+            self._init_shortcuts()
+            self._init_indices()
+            raise
+
+    def set_revision_policy(self, policy):
+        """Set the policy of recording revisions of the corpus."""
+        if self._revisions.in_operation():
+            raise KamiHierarchyError(
+                "Revision policy cannot be changed during an operation")
+        self._revisions = RevisionRecorder(policy)
+
+    def checkpoint(self):
+        """Mark the current revision as a checkpoint.
+
+        If the revision policy defines a retention window,
+        the revisions preceding it are pruned.
+        """
+        self._revisions.checkpoint(self._versioning)
+
+    def rollback(self, revision_id, message=None):
+        """Rollback the current branch to the (retained) revision."""
+        if self._revisions.in_operation():
+            raise KamiHierarchyError(
+                "Corpus cannot be rolled back during an operation")
+        self._materialize_nuggets()
+        _unshare_graphs(self, list(self._shared_graphs))
+        self._versioning.rollback(revision_id, message=message)
+        self._init_nugget_registry()
+        self._init_shortcuts()
+        self._init_indices()
+
     def find_matching(self, graph_id, pattern,
                       pattern_typing=None, nodes=None):
         """Overloading of the find matching method."""
+        self._materialize_nugget(graph_id)
         return self._hierarchy.find_matching(
             graph_id, pattern,
             pattern_typing, nodes)
@@ -201,12 +527,15 @@ class KamiCorpus(object):
         model = cls(corpus_id, annotation=annotation,
                     creation_time=creation_time, last_modified=last_modified)
         model._hierarchy = hierarchy
+        model._init_nugget_registry()
         model._init_shortcuts()
+        model._init_indices()
         return model
 
     @classmethod
     def copy(cls, corpus_id, corpus):
         """Create a copy of the corpus."""
+        corpus._materialize_nuggets()
         if corpus._backend == "networkx":
             hierarchy_copy = NXHierarchy.copy(corpus._hierarchy)
         elif corpus._backend == "neo4j":
@@ -250,24 +579,15 @@ class KamiCorpus(object):
 
     def nuggets(self):
         """Get a list of nuggets in the hierarchy."""
-        nuggets = []
-        for node_id in self._hierarchy.graphs():
-            if self.is_nugget_graph(node_id):
-                nuggets.append(node_id)
-        return nuggets
+        return self._nugget_registry.nuggets()
 
     def semantic_nuggets(self):
         """Get a list of semantic nuggets in the hierarchy."""
-        nuggets = []
-        for node_id in self._hierarchy.graphs():
-            attrs = self._hierarchy.get_graph_attrs(
-                node_id)
-            if "type" in attrs and "semantic_nugget" in attrs["type"]:
-                nuggets.append(node_id)
-        return nuggets
+        return self._nugget_registry.semantic_nuggets()
 
     def nugget_relations(self):
         """Get all relations of nuggets."""
+        self._materialize_nuggets()
         nugget_rels = list()
         for u, v in self._hierarchy.relations():
             if self.is_nugget_graph(u):
@@ -276,14 +596,11 @@ class KamiCorpus(object):
 
     def templates(self):
         """Get a list of templates in the hierarchy."""
-        templates = []
-        for node_id in self._hierarchy.graphs():
-            if "template" in self._hierarchy.get_graph_attrs(node_id)["type"]:
-                templates.append(node_id)
-        return templates
+        return self._nugget_registry.templates()
 
     def get_nugget_semantic_rels(self, nugget_id):
         """Get nugget semantic relations."""
+        self._materialize_nugget(nugget_id)
         all_rels = self._hierarchy.adjacent_relations(nugget_id)
         semantic_nuggets = self.semantic_nuggets()
         result = {}
@@ -294,25 +611,11 @@ class KamiCorpus(object):
 
     def mod_semantic_nuggets(self):
         """Get a list of semantic nuggets related to mod interactions."""
-        nuggets = []
-        for node_id in self._hierarchy.graphs():
-            if "semantic_nugget" in self._hierarchy.get_graph_attrs(
-                    node_id)["type"] and\
-               "mod" in self._hierarchy.get_graph_attrs(
-                    node_id)["interaction_type"]:
-                nuggets.append(node_id)
-        return nuggets
+        return self._nugget_registry.semantic_nuggets("mod")
 
     def bnd_semantic_nuggets(self):
         """Get a list of semantic nuggets related to bnd interactions."""
-        nuggets = []
-        for node_id in self._hierarchy.graphs():
-            if "semantic_nugget" in self._hierarchy.get_graph_attrs(
-                    node_id)["type"] and\
-               "bnd" in self._hierarchy.get_graph_attrs(
-                    node_id)["interaction_type"]:
-                nuggets.append(node_id)
-        return nuggets
+        return self._nugget_registry.semantic_nuggets("bnd")
 
     def empty(self):
         """Test if hierarchy is empty."""
@@ -350,12 +653,15 @@ class KamiCorpus(object):
 
     def protoforms(self):
         """Get a list of agent nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "protoform")
+        return self._ag_index.nodes_of_type("protoform")
+
+    def ag_type_counts(self):
+        """Get the number of action graph nodes of every meta-type."""
+        return self._ag_index.type_counts()
 
     def get_protoform_by_uniprot(self, uniprotid):
         """Get a protoform by the UniProt AC."""
-        for protoform in self.protoforms():
+        for protoform in self._ag_index.get_protoforms_by_uniprot(uniprotid):
             attrs = self.action_graph.get_node(protoform)
             u = list(attrs["uniprotid"])[0]
             if u == uniprotid:
@@ -414,23 +720,19 @@ class KamiCorpus(object):
 
     def regions(self):
         """Get a list of region nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "region")
+        return self._ag_index.nodes_of_type("region")
 
     def sites(self):
         """Get a list of site nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "site")
+        return self._ag_index.nodes_of_type("site")
 
     def bindings(self):
         """Get a list of bnd nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "bnd")
+        return self._ag_index.nodes_of_type("bnd")
 
     def modifications(self):
         """Get a list of bnd nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "mod")
+        return self._ag_index.nodes_of_type("mod")
 
     def ag_successors_of_type(self, node_id, meta_type):
         """Get successors of a node of a specific type."""
@@ -531,6 +833,7 @@ class KamiCorpus(object):
         ag_typing[node_id] = meta_type
         self._hierarchy._update_mapping(
             self._action_graph_id, "meta_model", ag_typing)
+        self._update_indices([node_id])
 
     def add_ag_node_semantics(self, node_id, semantic_node):
         """Add relation of `node_id` with `semantic_node`."""
@@ -632,15 +935,17 @@ class KamiCorpus(object):
         rule = Rule.from_transform(NXGraph())
         rule.inject_add_node(gene_id, protoform.meta_data())
         rhs_typing = {"meta_model": {gene_id: "protoform"}}
-        rhs_instance = self.rewrite(
-            self._action_graph_id, rule, instance={},
-            rhs_typing=rhs_typing,
-            message="Added the protoform with the UniProtAC '{}'".format(
-                gene_id),
-            update_type="manual")
+        message = "Added the protoform with the UniProtAC '{}'".format(
+            gene_id)
+        with self.operation(message):
+            rhs_instance = self.rewrite(
+                self._action_graph_id, rule, instance={},
+                rhs_typing=rhs_typing,
+                message=message,
+                update_type="manual")
 
-        if anatomize is True:
-            anatomize_gene(self, rhs_instance[gene_id])
+            if anatomize is True:
+                anatomize_gene(self, rhs_instance[gene_id])
 
         return rhs_instance[gene_id]
 
@@ -922,13 +1227,13 @@ class KamiCorpus(object):
     def _generate_next_nugget_id(self, name=None):
         """Generate id for a new nugget."""
         if self._nugget_count is None:
-            self._nugget_count = len(self.nuggets())
+            self._nugget_count = self._nugget_registry.count_nuggets()
         self._nugget_count += 1
         if name is None:
             name = "nugget"
 
         generated_id = name + "_" + str(self._nugget_count)
-        while self._id + "_" + generated_id in self.nuggets():
+        while self._nugget_registry.is_nugget(self._id + "_" + generated_id):
             self._nugget_count += 1
             generated_id = name + "_" + str(self._nugget_count)
 
@@ -936,8 +1241,7 @@ class KamiCorpus(object):
 
     def get_nugget_type(self, nugget_id):
         """Get type of the nugget specified by id."""
-        return list(self._hierarchy.get_graph_attrs(
-            nugget_id)["interaction_type"])[0]
+        return self._nugget_registry.get_nugget_type(nugget_id)
 
     def is_mod_nugget(self, nugget_id):
         """Test if the nugget represents MOD."""
@@ -1010,6 +1314,7 @@ class KamiCorpus(object):
     def get_nugget_template_rel(self, nugget_id):
         """Get relation of a nugget to a template."""
         nugget_type = self.get_nugget_type(nugget_id)
+        self._materialize_nugget(nugget_id)
         return self._hierarchy.get_relation(
             nugget_id, nugget_type + "_template")
 
@@ -1020,14 +1325,73 @@ class KamiCorpus(object):
             self.get_action_graph_typing(),
             hierarchy=self,
             graph_id=self._action_graph_id,
-            meta_model_id="meta_model")
+            meta_model_id="meta_model",
+            index=self._ag_index,
+            memo=self._ag_index.traversal_memo)
         return identifier
 
+    def freeze(self):
+        """Get an immutable compact view of the action graph.
+
+        The view is not updated when the corpus is modified. It can be
+        wrapped by `EntityIdentifier` for read-only identification::
+
+            frozen_ag = corpus.freeze()
+            identifier = EntityIdentifier(frozen_ag, frozen_ag.meta_typing)
+
+        Returns
+        -------
+        kami.data_structures.frozen.FrozenActionGraph
+        """
+        if self.action_graph is None:
+            raise KamiException("The corpus has no action graph")
+        return FrozenActionGraph(
+            self.action_graph, self.get_action_graph_typing())
+
     def add_nugget(self, nugget_container, nugget_type,
                    template_rels=None, desc=None,
                    add_agents=True, anatomize=True,
                    apply_semantics=True):
         """Add nugget to the hierarchy."""
+        with self.operation("Added a nugget", "auto"):
+            nugget_graph_id, new_gene_nodes = self._attach_nugget(
+                nugget_container, nugget_type, template_rels, desc,
+                add_agents)
+
+            # Check if all new protoforms agents from the nugget should be
+            # distinct in the action grap
+            new_gene_nodes = self._merge_protoforms_by_uniprot(
+                new_gene_nodes)
+
+            # 5. Anatomize new protoforms added as the result of
+            # nugget creation
+            new_ag_regions = []
+            if anatomize is True:
+                new_ag_regions = self._anatomize_protoforms(new_gene_nodes)
+
+            # Apply bookkeeping updates
+            self._apply_nuggets_bookkeeping(
+                [nugget_graph_id], new_ag_regions)
+
+            # 6. Apply semantics to the nugget
+            if apply_semantics is True:
+                self._apply_nugget_semantics(nugget_graph_id)
+
+        self._index_nugget_interaction(nugget_graph_id)
+        return nugget_graph_id
+
+    def _attach_nugget(self, nugget_container, nugget_type,
+                       template_rels=None, desc=None, add_agents=True):
+        """Add nugget graph to the hierarchy and type it by the AG.
+
+        Returns
+        -------
+        nugget_graph_id : str
+            Id of the new nugget graph
+        new_gene_nodes : set
+            Set of protoform nodes added to the action graph
+            by the nugget
+        """
         if self._action_graph_id not in self._hierarchy.graphs():
             self.create_empty_action_graph()
 
@@ -1052,6 +1416,7 @@ class KamiCorpus(object):
         if desc is not None:
             attrs["desc"] = desc
         self._hierarchy.add_empty_graph(nugget_graph_id, attrs=attrs)
+        self._nugget_registry.add_nugget(nugget_graph_id, attrs)
 
         self._hierarchy.add_typing(
             nugget_graph_id, self._action_graph_id, dict())
@@ -1103,10 +1468,14 @@ class KamiCorpus(object):
                         new_gene_nodes.add(ag_node)
                 except:
                     pass
+        return nugget_graph_id, new_gene_nodes
 
-        # Check if all new protoforms agents from the nugget should be
-        # distinct in the action grap
+    def _merge_protoforms_by_uniprot(self, new_gene_nodes):
+        """Merge new protoforms of the AG with the same UniProt AC.
 
+        Returns the set of new protoform nodes after the merge.
+        """
+        new_gene_nodes = set(new_gene_nodes)
         protoforms_to_merge = {
             list(self.action_graph.get_node(protoform)["uniprotid"])[0]:
                 set() for protoform in new_gene_nodes
@@ -1138,48 +1507,64 @@ class KamiCorpus(object):
                     if vv in new_gene_nodes:
                         new_gene_nodes.remove(vv)
                 new_gene_nodes.add(merge_result)
+        return new_gene_nodes
 
-        # 5. Anatomize new protoforms added as the result of nugget creation
-        new_ag_regions = []
-        if anatomize is True:
-            if len(new_gene_nodes) > 0:
-                for protoform in new_gene_nodes:
-                    added_regions = anatomize_gene(self, protoform)
-                    new_ag_regions += added_regions
+    def _anatomize_protoforms(self, protoforms):
+        """Anatomize protoforms of the AG, return the added regions.
 
+        The data of all the protoforms is prefetched concurrently
+        before the protoforms are anatomized one by one (the data
+        that was not consumed is discarded).
+        """
+        protoforms = list(protoforms)
+        uniprot_acs = []
+        if len(protoforms) > 1:
+            uniprot_acs = [
+                self.get_uniprot(p) for p in protoforms
+                if p in self.action_graph.nodes()
+            ]
+            prefetch_gene_data(uniprot_acs)
+        new_ag_regions = []
+        try:
+            for protoform in protoforms:
+                added_regions = anatomize_gene(self, protoform)
+                new_ag_regions += added_regions
+        finally:
+            discard_prefetched(uniprot_acs)
+        return new_ag_regions
+
+    def _apply_nuggets_bookkeeping(self, nugget_ids, new_ag_regions=None):
+        """Apply bookkeeping updates to the AG nodes typing the nuggets."""
+        if new_ag_regions is None:
+            new_ag_regions = []
         ag_typing = self.get_action_graph_typing()
-        nugget_typing = self._hierarchy.get_typing(
-            nugget_graph_id, self._action_graph_id)
 
         all_protoforms = []
-
-        for node in self.get_nugget(nugget_graph_id).nodes():
-            ag_node = nugget_typing[node]
-            if ag_typing[ag_node] == "protoform":
-                all_protoforms.append(ag_node)
-
-        # Apply bookkeeping updates
-        target_nodes = [
-            self._hierarchy.get_typing(
-                nugget_graph_id, self._action_graph_id)[n]
-            for n in self.get_nugget(nugget_graph_id).nodes()
-        ] + new_ag_regions
+        target_nodes = []
+        for nugget_id in nugget_ids:
+            nugget_typing = self._hierarchy.get_typing(
+                nugget_id, self._action_graph_id)
+            for node in self.get_nugget(nugget_id).nodes():
+                ag_node = nugget_typing[node]
+                target_nodes.append(ag_node)
+                if ag_typing[ag_node] == "protoform" and\
+                        ag_node not in all_protoforms:
+                    all_protoforms.append(ag_node)
+        target_nodes += new_ag_regions
 
         identifier = self.get_entity_identifier()
 
         apply_bookkeeping(identifier, target_nodes, all_protoforms)
 
-        # 6. Apply semantics to the nugget
-        if apply_semantics is True:
-            if "mod" in self._hierarchy.get_graph_attrs(
-               nugget_graph_id)["interaction_type"]:
-                apply_mod_semantics(self, nugget_graph_id)
-
-            elif "bnd" in self._hierarchy.get_graph_attrs(
-                    nugget_graph_id)["interaction_type"]:
-                apply_bnd_semantics(self, nugget_graph_id)
+    def _apply_nugget_semantics(self, nugget_id):
+        """Apply mod or bnd semantics to the nugget."""
+        if "mod" in self._hierarchy.get_graph_attrs(
+           nugget_id)["interaction_type"]:
+            apply_mod_semantics(self, nugget_id)
 
-        return nugget_graph_id
+        elif "bnd" in self._hierarchy.get_graph_attrs(
+                nugget_id)["interaction_type"]:
+            apply_bnd_semantics(self, nugget_id)
 
     def add_interaction(self, interaction, add_agents=True,
                         anatomize=True, apply_semantics=True):
@@ -1207,8 +1592,54 @@ class KamiCorpus(object):
         return nugget_id
 
     def add_interactions(self, interactions, add_agents=True,
-                         anatomize=True, apply_semantics=True):
-        """Add a collection of interactions to the model."""
+                         anatomize=True, apply_semantics=True,
+                         bulk=False, report=None, processes=None,
+                         chunk_size=None):
+        """Add a collection of interactions to the model.
+
+        Parameters
+        ----------
+        interactions : iterable of kami.data_structures.interactions.Interaction
+        add_agents : bool, optional
+        anatomize : bool, optional
+        apply_semantics : bool, optional
+        bulk : bool, optional
+            If True, the interactions are ingested in the bulk mode: nuggets
+            for all the interactions are first generated and added to the
+            corpus, then the merge of protoforms with the same UniProt AC,
+            anatomization, bookkeeping and semantic updates are performed
+            once for all the nodes touched by the new nuggets
+        report : dict, optional
+            Dictionary to fill with the statistics of the bulk ingestion:
+            its keys are phase names and its values are dictionaries
+            with the number of processed items, elapsed time (in seconds)
+            and throughput (items per second). In the parallel mode, it
+            is filled with the numbers of generated, regenerated and
+            failed nuggets and of snapshots of the action graph taken
+            (see `add_interactions_in_parallel`)
+        processes : int, optional
+            If specified, nuggets are generated in parallel by the given
+            number of worker processes and then added to the corpus
+            one by one (see `kami.aggregation.ingestion`), cannot be
+            combined with the bulk mode
+        chunk_size : int, optional
+            Number of interactions generated in parallel before their
+            nuggets are added to the corpus (used if `processes` is
+            specified, by default `DEFAULT_CHUNK_SIZE`)
+        """
+        if processes is not None:
+            if bulk is True:
+                raise KamiException(
+                    "Parallel nugget generation cannot be combined "
+                    "with the bulk mode!")
+            return add_interactions_in_parallel(
+                self, interactions, processes=processes,
+                chunk_size=chunk_size, add_agents=add_agents,
+                anatomize=anatomize, apply_semantics=apply_semantics,
+                report=report)
+        if bulk is True:
+            return self._add_interactions_bulk(
+                interactions, add_agents, anatomize, apply_semantics, report)
         nugget_ids = []
         for i in interactions:
             nugget_id = self.add_interaction(
@@ -1216,10 +1647,84 @@ class KamiCorpus(object):
             nugget_ids.append(nugget_id)
         return nugget_ids
 
+    def _add_interactions_bulk(self, interactions, add_agents=True,
+                               anatomize=True, apply_semantics=True,
+                               report=None):
+        """Add a collection of interactions deferring the AG updates."""
+        if report is None:
+            report = dict()
+
+        def _record_phase(phase, n_items, start):
+            elapsed = time.time() - start
+            report[phase] = {
+                "items": n_items,
+                "time": elapsed,
+                "throughput": n_items / elapsed if elapsed > 0 else None
+            }
+
+        if self._action_graph_id not in self._hierarchy.graphs():
+            self.create_empty_action_graph()
+
+        # Every phase is recorded as a single revision
+        # (if revision coalescing is enabled)
+
+        # Generate and attach the nuggets
+        start = time.time()
+        nugget_ids = []
+        new_gene_nodes = set()
+        with self.operation("Bulk ingestion: added nuggets", "auto"):
+            for interaction in interactions:
+                (
+                    nugget_container,
+                    nugget_type,
+                    template_rels,
+                    desc
+                ) = generate_nugget(self, interaction)
+                nugget_id, nugget_genes = self._attach_nugget(
+                    nugget_container, nugget_type, template_rels, desc,
+                    add_agents)
+                nugget_ids.append(nugget_id)
+                new_gene_nodes.update(nugget_genes)
+        _record_phase("nuggets", len(nugget_ids), start)
+
+        # Merge new protoforms with the same UniProt AC
+        start = time.time()
+        with self.operation("Bulk ingestion: merged protoforms", "auto"):
+            new_gene_nodes = self._merge_protoforms_by_uniprot(
+                new_gene_nodes)
+        _record_phase("protoforms", len(new_gene_nodes), start)
+
+        new_ag_regions = []
+        if anatomize is True:
+            start = time.time()
+            with self.operation(
+                    "Bulk ingestion: anatomized protoforms", "auto"):
+                new_ag_regions = self._anatomize_protoforms(new_gene_nodes)
+            _record_phase("anatomization", len(new_gene_nodes), start)
+
+        start = time.time()
+        new_ag_regions = [
+            r for r in new_ag_regions if r in self.action_graph.nodes()]
+        with self.operation("Bulk ingestion: bookkeeping", "auto"):
+            self._apply_nuggets_bookkeeping(nugget_ids, new_ag_regions)
+        _record_phase("bookkeeping", len(nugget_ids), start)
+
+        if apply_semantics is True:
+            start = time.time()
+            with self.operation("Bulk ingestion: semantics", "auto"):
+                for nugget_id in nugget_ids:
+                    self._apply_nugget_semantics(nugget_id)
+            _record_phase("semantics", len(nugget_ids), start)
+
+        for nugget_id in nugget_ids:
+            self._index_nugget_interaction(nugget_id)
+        return nugget_ids
+
     def type_nugget_by_ag(self, nugget_id, typing):
         """Type nugget by the action graph."""
         self._hierarchy.add_typing(
             nugget_id, self._action_graph_id, typing)
+        self._index_nugget_typing(nugget_id)
         return
 
     def type_nugget_by_meta(self, nugget_id, typing):
@@ -1232,6 +1737,7 @@ class KamiCorpus(object):
         """Relate nugget to mod template."""
         self._hierarchy.add_relation(
             nugget_id, template_id, rel)
+        self._nugget_registry.set_nugget_template(nugget_id, template_id)
         return
 
     def add_semantic_nugget_rel(self, nugget_id, semantic_nugget_id, rel):
@@ -1266,23 +1772,19 @@ class KamiCorpus(object):
 
     def get_nugget_desc(self, nugget_id):
         """Get nugget description string."""
-        nugget_attrs = self._hierarchy.get_graph_attrs(nugget_id)
-        if 'desc' in nugget_attrs.keys():
-            if type(nugget_attrs['desc']) == str:
-                nugget_desc = nugget_attrs['desc']
-            else:
-                nugget_desc = list(nugget_attrs['desc'])[0]
-        else:
-            nugget_desc = ""
-        return nugget_desc
+        return self._nugget_registry.get_nugget_desc(nugget_id)
 
     def set_nugget_desc(self, nugget_id, new_desc):
         """Get nugget description string."""
+        self._materialize_nugget(nugget_id)
         self._hierarchy.set_graph_attrs(
             nugget_id, {"desc": new_desc})
+        self._nugget_registry.set_nugget_desc(nugget_id, new_desc)
+        self._index_nugget_interaction(nugget_id)
 
     def get_nugget_typing(self, nugget_id):
         """Get typing of the nugget by the action graph."""
+        self._materialize_nugget(nugget_id)
         return self._hierarchy.get_typing(
             nugget_id, self._action_graph_id)
 
@@ -1315,36 +1817,87 @@ class KamiCorpus(object):
             self._hierarchy.get_relation(
                 self._action_graph_id, "semantic_action_graph"))
 
-        json_data["nuggets"] = []
-        for nugget in self.nuggets():
-            template = self.get_nugget_type(nugget) + "_template"
-            nugget_json = {
-                "id": nugget,
-                "graph": self.get_nugget(nugget).to_json(),
-                "desc": self.get_nugget_desc(nugget),
-                "typing": self.get_nugget_typing(nugget),
-                "attrs": attrs_to_json(self._hierarchy.get_graph_attrs(
-                    nugget)),
-                "template_rel": (
-                    template,
-                    relation_to_json(self.get_nugget_template_rel(nugget))
-                ),
-                "semantic_rels": {
-                    s: relation_to_json(self._hierarchy.get_relation(
-                        nugget, s))
-                    for s in self._hierarchy.adjacent_relations(nugget)
-                    if s != template
-                }
+        json_data["nuggets"] = [
+            self._nugget_to_json(nugget) for nugget in self.nuggets()
+        ]
+        return json_data
+
+    def _nugget_to_json(self, nugget):
+        """Return json repr of the nugget."""
+        if nugget in self._lazy_nuggets:
+            # The record is read from the file, the nugget stays lazy
+            filename, start, end, _, _ = self._lazy_nuggets[nugget]
+            nugget_json = read_json_value(filename, start, end)
+            nugget_json["id"] = nugget
+            nugget_json["desc"] = self.get_nugget_desc(nugget)
+            return nugget_json
+        template = self.get_nugget_type(nugget) + "_template"
+        nugget_json = {
+            "id": nugget,
+            "graph": self.get_nugget(nugget).to_json(),
+            "desc": self.get_nugget_desc(nugget),
+            "typing": self.get_nugget_typing(nugget),
+            "attrs": attrs_to_json(self._hierarchy.get_graph_attrs(
+                nugget)),
+            "template_rel": (
+                template,
+                relation_to_json(self.get_nugget_template_rel(nugget))
+            ),
+            "semantic_rels": {
+                s: relation_to_json(self._hierarchy.get_relation(
+                    nugget, s))
+                for s in self._hierarchy.adjacent_relations(nugget)
+                if s != template
             }
+        }
+        return nugget_json
 
-            json_data["nuggets"].append(nugget_json)
-        return json_data
+    def export_json(self, filename, compress=False):
+        """Export corpus to json.
 
-    def export_json(self, filename):
-        """Export corpus to json."""
-        with open(filename, 'w') as f:
-            j_data = self.to_json()
-            json.dump(j_data, f)
+        The json representation of the corpus is written to the file
+        incrementally: the corpus meta-data and the action graph are
+        written first, followed by the nugget records (one per line)
+        written one at a time. The records of lazily loaded nuggets
+        are copied from their file without loading the nuggets.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the output file
+        compress : bool, optional
+            If True, the output is gzip-compressed
+        """
+        if compress:
+            f = gzip.open(filename, "wt")
+        else:
+            f = open(filename, "w")
+        with f:
+            f.write("{")
+            header = [
+                ("corpus_id", lambda: self._id),
+                ("annotation", lambda: self.annotation.to_json()),
+                ("creation_time", lambda: self.creation_time),
+                ("last_modified", lambda: self.last_modified),
+                ("versioning", lambda: self._versioning.to_json()),
+                ("action_graph", lambda: self.action_graph.to_json()),
+                ("action_graph_typing",
+                 lambda: self.get_action_graph_typing()),
+                ("action_graph_semantics", lambda: relation_to_json(
+                    self._hierarchy.get_relation(
+                        self._action_graph_id, "semantic_action_graph")))
+            ]
+            for key, get_value in header:
+                f.write(json.dumps(key) + ": ")
+                json.dump(get_value(), f)
+                f.write(",\n")
+            f.write(json.dumps("nuggets") + ": [")
+            for i, nugget in enumerate(self.nuggets()):
+                if i > 0:
+                    f.write(",")
+                f.write("\n")
+                json.dump(self._nugget_to_json(nugget), f)
+            f.write("\n]}\n")
 
     @classmethod
     def from_json(cls, corpus_id, json_data, annotation=None,
@@ -1363,11 +1916,30 @@ class KamiCorpus(object):
     def load_json(cls, corpus_id, filename, annotation=None,
                   creation_time=None, last_modified=None,
                   backend="networkx",
-                  uri=None, user=None, password=None, driver=None):
-        """Load a KamiCorpus from its json representation."""
+                  uri=None, user=None, password=None, driver=None,
+                  lazy=False):
+        """Load a KamiCorpus from its json representation.
+
+        Parameters
+        ----------
+        lazy : bool, optional
+            If True, only the offsets of the nugget records in the file
+            are stored on loading and the nugget graphs are loaded
+            when first accessed. Lazy loading is available for
+            uncompressed files and networkx-based corpora only
+            (the file should not be modified while the corpus is used)
+        """
         if os.path.isfile(filename):
-            with open(filename, "r+") as f:
-                json_data = json.loads(f.read())
+            if lazy and backend == "networkx":
+                with open(filename, "rb") as f:
+                    compressed = f.read(2) == b"\x1f\x8b"
+                if not compressed:
+                    return cls._load_json_lazily(
+                        corpus_id, filename, annotation=annotation,
+                        creation_time=creation_time,
+                        last_modified=last_modified)
+            with open_json_file(filename) as f:
+                json_data = json.load(f)
                 corpus = cls.from_json(
                     corpus_id, json_data, annotation=annotation,
                     creation_time=creation_time, last_modified=last_modified,
@@ -1377,9 +1949,100 @@ class KamiCorpus(object):
         else:
             raise KamiHierarchyError("File '{}' does not exist!".format(filename))
 
+    def save_snapshot(self, filename, compress=False):
+        """Save the corpus to a binary snapshot.
+
+        The snapshot contains the graph hierarchy (graphs, typings and
+        relations), the revision graph and the indices of the corpus.
+        It can be restored with `KamiCorpus.load_snapshot`.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the snapshot file
+        compress : bool, optional
+            If True, the snapshot is compressed
+        """
+        if self._backend != "networkx":
+            raise KamiHierarchyError(
+                "Snapshots are available only for networkx-based corpora")
+        self._materialize_nuggets()
+        state = {
+            "corpus_id": self._id,
+            "annotation": self.annotation,
+            "creation_time": self.creation_time,
+            "last_modified": self.last_modified,
+            "hierarchy": self._hierarchy,
+            "versioning": self._versioning,
+            "nugget_registry": self._nugget_registry,
+            "ag_index": self._ag_index
+        }
+        write_snapshot(filename, "corpus", state, compress=compress)
+
+    @classmethod
+    def load_snapshot(cls, filename):
+        """Load a KamiCorpus from a binary snapshot."""
+        if not os.path.isfile(filename):
+            raise KamiHierarchyError(
+                "File '{}' does not exist!".format(filename))
+        state = read_snapshot(filename, "corpus")
+        corpus = cls(
+            state["corpus_id"], annotation=state["annotation"],
+            creation_time=state["creation_time"],
+            last_modified=state["last_modified"])
+        corpus._hierarchy = state["hierarchy"]
+        corpus._versioning = state["versioning"]
+        corpus._nugget_registry = state["nugget_registry"]
+        corpus._ag_index = state["ag_index"]
+        corpus._init_shortcuts()
+        corpus._init_typing_index()
+        return corpus
+
+    @classmethod
+    def _load_json_lazily(cls, corpus_id, filename, annotation=None,
+                          creation_time=None, last_modified=None):
+        """Load a KamiCorpus indexing the nugget records of the file."""
+        json_data = dict()
+        nugget_records = []
+        # Nugget records are only scanned, the fields required
+        # to register and index the nuggets are decoded
+        for key, value, start, end in iter_json_object(
+                filename, array_keys=["nuggets"],
+                members=["id", "attrs", "typing", "template_rel"]):
+            if key == "nuggets":
+                if "typing" not in value or "template_rel" not in value:
+                    # Raises the error on the missing fields
+                    _check_nugget_json(value)
+                record = {
+                    k: v for k, v in value.items() if k in ["id", "attrs"]
+                }
+                nugget_records.append((
+                    record, value["template_rel"][0], start, end,
+                    set(value["typing"].values()),
+                    _interaction_from_json(
+                        value["template_rel"], value["typing"])
+                ))
+            else:
+                json_data[key] = value
+        corpus = cls.from_json(
+            corpus_id, json_data, annotation=annotation,
+            creation_time=creation_time, last_modified=last_modified)
+        for (record, template, start, end,
+             ag_nodes, interaction) in nugget_records:
+            nugget_graph_id = corpus._id + "_" + record["id"]
+            attrs = _nugget_attrs_from_json(corpus, record)
+            corpus._nugget_registry.add_nugget(
+                nugget_graph_id, attrs, template)
+            corpus._lazy_nuggets[nugget_graph_id] = (
+                filename, start, end, ag_nodes, interaction)
+            corpus._index_nugget_typing(nugget_graph_id)
+        corpus._init_shortcuts()
+        return corpus
+
     def instantiate(self, model_id, definitions=None, seed_genes=None,
                     annotation=None, default_bnd_rate=None,
-                    default_brk_rate=None, default_mod_rate=None):
+                    default_brk_rate=None, default_mod_rate=None,
+                    copy_on_write=False, processes=None):
         """Instantiate a signalling model from a corpus.
 
         Parameters
@@ -1394,11 +2057,21 @@ class KamiCorpus(object):
             are filtered (and not included in the instantiated model).
         annotation : kami.data_structures.annotations.CorpusAnnotation
             Model annotations
+        copy_on_write : bool, optional
+            If True (and the backend is networkx), the nugget graphs of
+            the model are shared with the corpus and copied only when
+            either the corpus or the model modifies them
+        processes : int, optional
+            Number of worker processes analysing the nuggets invalidated
+            by instantiation. By default, the nuggets are analysed in
+            the current process
         """
 
         if annotation is None:
             annotation = ModelAnnotation()
 
+        self._materialize_nuggets()
+
         if self._backend == "neo4j":
             # To create a model we duplicate subgraph of the Neo4jHierarchy
             graph_dict = {
@@ -1443,23 +2116,36 @@ class KamiCorpus(object):
                 default_bnd_rate=default_bnd_rate,
                 default_brk_rate=default_brk_rate,
                 default_mod_rate=default_mod_rate)
-            model._copy_knowledge_from_corpus(self)
+            model._copy_knowledge_from_corpus(
+                self, copy_on_write=copy_on_write)
 
         if definitions is not None:
-            # We then apply an instantiation rule generated for
-            # every provided definition and clean-up invalidated nuggets
-            for d in definitions:
-                instantiation_rule, instance = d.generate_rule(
+            # We then apply the composition of the instantiation rules
+            # generated for the provided definitions and clean-up the
+            # nuggets typed by the instantiated components
+            rules = [
+                d.generate_rule(
                     self.action_graph, self.get_action_graph_typing())
-                rhs_g = model.rewrite(
-                    model._action_graph_id,
-                    instantiation_rule,
-                    instance,
-                    message="Instantiation update",
-                    update_type="auto")
-                model._add_component_equivalence(
-                    instantiation_rule, instance, rhs_g)
-                model._clean_up_nuggets()
+                for d in definitions
+            ]
+            nuggets = None
+            if model._typing_index is not None:
+                nuggets = set()
+            with model.operation("Instantiation update", "auto"):
+                for instantiation_rule, instance in\
+                        compose_instantiation_rules(rules):
+                    if nuggets is not None:
+                        nuggets.update(model._typing_index.nuggets_of_nodes(
+                            instance.values()))
+                    rhs_g = model.rewrite(
+                        model._action_graph_id,
+                        instantiation_rule,
+                        instance,
+                        message="Instantiation update",
+                        update_type="auto")
+                    model._add_component_equivalence(
+                        instantiation_rule, instance, rhs_g)
+                model._clean_up_nuggets(nuggets, processes=processes)
         return model
 
     def get_uniprot(self, gene_id):
@@ -1497,8 +2183,7 @@ class KamiCorpus(object):
             synonyms = list(attrs["synonyms"])
         nuggets = None
         if get_nuggets:
-            nuggets = self._hierarchy.graphs_typed_by_node(
-                self._action_graph_id, gene_id)
+            nuggets = self._get_nuggets_typed_by(gene_id)
         return (uniprotid, hgnc_symbol, synonyms, nuggets)
 
     def get_modification_data(self, mod_id):
@@ -1510,8 +2195,7 @@ class KamiCorpus(object):
 
         enzyme_protoforms = identifier.ancestors_of_type(mod_id, "protoform")
         substrate_protoforms = identifier.descendants_of_type(mod_id, "protoform")
-        nuggets = self._hierarchy.graphs_typed_by_node(
-            self._action_graph_id, mod_id)
+        nuggets = self._get_nuggets_typed_by(mod_id)
         return (nuggets, enzyme_protoforms, substrate_protoforms)
 
     def get_binding_data(self, bnd_id):
@@ -1522,8 +2206,7 @@ class KamiCorpus(object):
             hierarchy=self, graph_id=self._action_graph_id)
 
         all_protoforms = identifier.ancestors_of_type(bnd_id, "protoform")
-        nuggets = self._hierarchy.graphs_typed_by_node(
-            self._action_graph_id, bnd_id)
+        nuggets = self._get_nuggets_typed_by(bnd_id)
         return (nuggets, all_protoforms)
 
     def get_bindings(self, left_ac, right_ac):
@@ -1531,7 +2214,8 @@ class KamiCorpus(object):
         identifier = EntityIdentifier(
             self.action_graph,
             self.get_action_graph_typing(),
-            immediate=False)
+            immediate=False, index=self._ag_index,
+            memo=self._ag_index.traversal_memo)
         return identifier.get_bindings(left_ac, right_ac)
 
     def get_modifications(self, enzyme_ac, substrate_ac):
@@ -1539,42 +2223,23 @@ class KamiCorpus(object):
         identifier = EntityIdentifier(
             self.action_graph,
             self.get_action_graph_typing(),
-            immediate=False)
+            immediate=False, index=self._ag_index,
+            memo=self._ag_index.traversal_memo)
         return identifier.get_modifications(
             enzyme_ac, substrate_ac)
 
     def get_protoform_pairwise_interactions(self):
-        """Get pairwise interactions between protoforms."""
-        interactions = {}
-
-        def _add_to_interactions(s, t, n, n_type, n_desc):
-            if s in interactions:
-                if t in interactions[s]:
-                    interactions[s][t].add((n, n_type, n_desc))
-                else:
-                    interactions[s][t] = {(n, n_type, n_desc)}
-            else:
-                interactions[s] = {
-                    t: {(n, n_type, n_desc)}
-                }
-
-        for n in self.nuggets():
-            ag_typing = self._hierarchy.get_typing(n, self._action_graph_id)
-            if self.is_mod_nugget(n):
-                enzyme = self.get_enzyme(n)
-                substrate = self.get_substrate(n)
-                if enzyme is not None and substrate is not None:
-                    _add_to_interactions(
-                        ag_typing[enzyme], ag_typing[substrate],
-                        n, "mod", self.get_nugget_desc(n))
-            elif self.is_bnd_nugget(n):
-                left = self.get_left_partner(n)
-                right = self.get_right_partner(n)
-                if left is not None and right is not None:
-                    _add_to_interactions(
-                        ag_typing[left], ag_typing[right],
-                        n, "bnd", self.get_nugget_desc(n))
-        return interactions
+        """Get pairwise interactions between protoforms.
+
+        Returns
+        -------
+        interactions : dict
+            Dictionary whose keys are source protoforms (enzymes or left
+            partners) and whose values are dictionaries whose keys are
+            target protoforms (substrates or right partners) and whose
+            values are sets of triples (nugget id, type, description)
+        """
+        return self._get_interaction_index().interactions()
 
     def update_nugget_node_attr(self, nugget_id, node_id, node_attrs):
         lhs = NXGraph()
@@ -1635,14 +2300,55 @@ class KamiCorpus(object):
             nugget_id, source, target, attrs_from_json(json_node_attrs))
 
     def load_interactions_from_json(self, jsonfile, add_agents=True,
-                                    anatomize=True, apply_semantics=True):
-        with open(jsonfile, "r") as f:
-            raw = json.load(f)
-            for el in raw:
-                i = Interaction.from_json(el)
+                                    anatomize=True, apply_semantics=True,
+                                    chunk_size=None, offset=0,
+                                    checkpoint=None):
+        """Load interactions from a JSON file.
+
+        Interactions are streamed from the file, which can contain either
+        JSON Lines or a top-level JSON array of interactions.
+
+        Parameters
+        ----------
+        jsonfile : str
+            Path to the file with interactions
+        add_agents : bool, optional
+        anatomize : bool, optional
+        apply_semantics : bool, optional
+        chunk_size : int, optional
+            If specified, interactions are added in the bulk mode
+            (see `add_interactions`) by chunks of the given size,
+            otherwise they are added one by one
+        offset : int, optional
+            Byte offset in the file from which the loading is resumed
+        checkpoint : callable, optional
+            Function called with the byte offset right after the last
+            added interaction (every time an interaction or a chunk of
+            interactions is added), can be used to resume the loading
+
+        Returns
+        -------
+        offset : int
+            Byte offset right after the last added interaction
+        """
+        records = iter_json_records(jsonfile, offset)
+        if chunk_size is None:
+            for record, offset in records:
                 self.add_interaction(
-                    i, add_agents=add_agents,
+                    Interaction.from_json(record), add_agents=add_agents,
                     anatomize=anatomize, apply_semantics=apply_semantics)
+                if checkpoint is not None:
+                    checkpoint(offset)
+        else:
+            for chunk in iter_chunks(records, chunk_size):
+                self.add_interactions(
+                    [Interaction.from_json(record) for record, _ in chunk],
+                    add_agents=add_agents, anatomize=anatomize,
+                    apply_semantics=apply_semantics, bulk=True)
+                offset = chunk[-1][1]
+                if checkpoint is not None:
+                    checkpoint(offset)
+        return offset
 
     def subcomponent_nodes(self, node_id):
         """Get all the subcomponent nodes."""
@@ -1710,18 +2416,25 @@ class KamiCorpus(object):
         return loc
 
     def interaction_edges(self):
-        interactions = self.get_protoform_pairwise_interactions()
-        edges = []
-        for protoform, (partners, nuggets) in interactions.items():
-            for i, partner in enumerate(partners):
-                if (protoform, partner) not in edges and (partner, protoform) not in edges:
-                    edges.append({"source": protoform, "target": partner})
-        return edges
+        """Get edges between interacting protoforms."""
+        return [
+            {"source": s, "target": t}
+            for s, t in self._get_interaction_index().pairs()
+        ]
 
     def remove_nugget(self, nugget_id):
         """Remove nugget from a corpus."""
-        if nugget_id in self.nuggets():
-            self._hierarchy.remove_graph(nugget_id)
+        if self._nugget_registry.is_nugget(nugget_id):
+            if nugget_id in self._lazy_nuggets:
+                del self._lazy_nuggets[nugget_id]
+            else:
+                self._hierarchy.remove_graph(nugget_id)
+            self._nugget_registry.remove_nugget(nugget_id)
+            self._shared_graphs.discard(nugget_id)
+            if self._typing_index is not None:
+                self._typing_index.remove_nugget(nugget_id)
+            if self._interaction_index is not None:
+                self._interaction_index.remove_nugget(nugget_id)
 
     def get_mechanism_nuggets(self, mechanism_id):
         """Get nuggets associated with the interaction mechanism."""
@@ -1734,8 +2447,7 @@ class KamiCorpus(object):
             result = self._hierarchy.execute(cypher)
             return result.single()["nuggets"]
         else:
-            raise KamiException(
-                "This method is not implemented for NetworkX-based hierarchies!")
+            return self._typing_index.nuggets_of_node(mechanism_id)
 
     def new_branch(self, branch_name):
         """Create a new branch of the corpus."""
@@ -1743,7 +2455,12 @@ class KamiCorpus(object):
 
     def switch_branch(self, branch_name):
         """Switch to the branch of the corpus."""
+        self._materialize_nuggets()
+        _unshare_graphs(self, list(self._shared_graphs))
         self._versioning.switch_branch(branch_name)
+        self._init_nugget_registry()
+        self._init_shortcuts()
+        self._init_indices()
 
     def print_revision_history(self):
         """Print revision history of the corpus."""
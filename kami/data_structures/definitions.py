@@ -2,10 +2,11 @@
 import warnings
 
 import regraph.primitives as primitives
-from regraph import Rule, get_node, get_edge, set_node_attrs
+from regraph import Rule, NXGraph, get_node, get_edge, set_node_attrs
 
 from kami.aggregation.generators import KamiGraph
 from kami.aggregation.identifiers import EntityIdentifier
+from kami.utils.id_generators import generate_new_element_id
 
 from kami.data_structures.entities import (Protoform, Region, Site,
                                            Residue, State)
@@ -228,6 +229,77 @@ class Definition:
         return cls(Protoform(json_dict["protoform"]), products)
 
 
+def _add_disjoint_copy(graph, node_ids, subgraph):
+    """Add a copy of the subgraph with fresh node ids to the graph."""
+    new_ids = dict()
+    for n in subgraph.nodes():
+        new_ids[n] = generate_new_element_id(node_ids, n)
+        node_ids.add(new_ids[n])
+        graph.add_node(new_ids[n], get_node(subgraph, n))
+    for s, t in subgraph.edges():
+        graph.add_edge(new_ids[s], new_ids[t], get_edge(subgraph, s, t))
+    return new_ids
+
+
+def _disjoint_union(rules):
+    """Compose rules with disjoint instances by a disjoint union."""
+    if len(rules) == 1:
+        return rules[0]
+    lhs = NXGraph()
+    p = NXGraph()
+    rhs = NXGraph()
+    lhs_ids = set()
+    p_ids = set()
+    rhs_ids = set()
+    p_lhs = dict()
+    p_rhs = dict()
+    instance = dict()
+    for rule, rule_instance in rules:
+        lhs_map = _add_disjoint_copy(lhs, lhs_ids, rule.lhs)
+        p_map = _add_disjoint_copy(p, p_ids, rule.p)
+        rhs_map = _add_disjoint_copy(rhs, rhs_ids, rule.rhs)
+        for k, v in rule.p_lhs.items():
+            p_lhs[p_map[k]] = lhs_map[v]
+        for k, v in rule.p_rhs.items():
+            p_rhs[p_map[k]] = rhs_map[v]
+        for k, v in rule_instance.items():
+            instance[lhs_map[k]] = v
+    return Rule(p=p, lhs=lhs, rhs=rhs, p_lhs=p_lhs, p_rhs=p_rhs), instance
+
+
+def compose_instantiation_rules(rules):
+    """Compose instantiation rules to apply them in a single pass.
+
+    Consecutive rules with disjoint instances are composed into
+    a single rule (their disjoint union). A rule whose instance
+    intersects the instances of the rules composed before it starts
+    a new composed rule, so that applying the composed rules in order
+    is equivalent to applying the input rules in order (typically,
+    definitions of distinct protoforms result in a single rule).
+
+    Parameters
+    ----------
+    rules : iterable of (regraph.Rule, dict)
+        Instantiation rules and their instances (e.g. generated by
+        `Definition.generate_rule`)
+
+    Returns
+    -------
+    composed_rules : list of (regraph.Rule, dict)
+        Composed rules and their instances
+    """
+    batches = []
+    matched_nodes = set()
+    for rule, instance in rules:
+        if len(batches) == 0 or\
+                not matched_nodes.isdisjoint(instance.values()):
+            batches.append([])
+            matched_nodes = set()
+        batches[-1].append((rule, instance))
+        matched_nodes.update(instance.values())
+    return [_disjoint_union(batch) for batch in batches]
+
+
 
 # class Definition:
 #     """Class for protein product definitions.
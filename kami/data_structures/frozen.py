@@ -0,0 +1,348 @@
+"""Immutable compact views of action graphs.
+
+`FrozenActionGraph`
+"""
+import array
+import collections.abc
+import sys
+
+import numpy as np
+
+from kami.exceptions import KamiException
+
+
+def _attrs_key(attrs):
+    """Get a hashable key of a dictionary of attributes."""
+    return frozenset(
+        (k, frozenset(v)) for k, v in attrs.items())
+
+
+def _build_csr(n_nodes, sources, targets):
+    """Build CSR arrays of the adjacency given by the lists of edges.
+
+    Returns
+    -------
+    (indptr, indices, order)
+        Arrays of the CSR representation and the permutation of
+        the input edges sorting them by their sources
+    """
+    sources = np.asarray(sources, dtype=np.int32)
+    targets = np.asarray(targets, dtype=np.int32)
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_nodes), out=indptr[1:])
+    return (
+        array.array("q", indptr.tobytes()),
+        array.array("i", targets[order].tobytes()),
+        order
+    )
+
+
+def _view(a):
+    """Get a numpy view of a typed array."""
+    return np.frombuffer(a, dtype=a.typecode)
+
+
+class _FrozenTyping(collections.abc.Mapping):
+    """Read-only mapping from nodes of a frozen graph to their types."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node):
+        type_code = self._graph._node_types[self._graph._index[node]]
+        if type_code < 0:
+            raise KeyError(node)
+        return self._graph._type_names[type_code]
+
+    def __iter__(self):
+        for n, type_code in zip(
+                self._graph._node_ids, self._graph._node_types):
+            if type_code >= 0:
+                yield n
+
+    def __len__(self):
+        return len(self._graph._node_types) - self._graph._node_types.count(-1)
+
+
+class FrozenActionGraph(object):
+    """Immutable array-backed view of an action graph.
+
+    Nodes of the graph are assigned consecutive integer ids, the
+    adjacency is stored in the CSR format (for successors and for
+    predecessors) in typed arrays, meta-model types of the nodes are
+    stored in an array of type codes and identical attribute dictionaries
+    of nodes (edges) are shared in an interned table. The view provides
+    the read-only part of the graph interface used by `EntityIdentifier`
+    and implements its traversals on the integer arrays.
+
+    Attributes
+    ----------
+    meta_typing : collections.abc.Mapping
+        Read-only typing of the nodes by the meta-model
+    _node_ids : list
+        List of the original ids of the nodes (indexed by integer ids)
+    _index : dict
+        Dictionary whose keys are the original node ids and whose
+        values are their integer ids
+    _type_names : list
+        List of meta-model types (indexed by type codes)
+    _node_types : array.array
+        Type codes of the nodes (-1 for untyped nodes)
+    _succ_indptr, _succ_indices : array.array
+        CSR representation of the successors of the nodes
+    _pred_indptr, _pred_indices : array.array
+        CSR representation of the predecessors of the nodes
+    _attrs_table : list
+        Interned attribute dictionaries of the nodes and the edges
+    _node_attrs : array.array
+        Indices of the attributes of the nodes in the table
+    _edge_attrs : array.array
+        Indices of the attributes of the edges (in the order of
+        the successors CSR) in the table
+    """
+
+    def __init__(self, graph, meta_typing):
+        """Initialize a frozen view of the graph typed by the meta-model."""
+        self._node_ids = list(graph.nodes())
+        self._index = {
+            n: i for i, n in enumerate(self._node_ids)
+        }
+        n_nodes = len(self._node_ids)
+
+        self._type_names = []
+        type_codes = dict()
+        self._node_types = array.array("b", [-1]) * n_nodes
+        for i, n in enumerate(self._node_ids):
+            if n in meta_typing:
+                meta_type = meta_typing[n]
+                if meta_type not in type_codes:
+                    type_codes[meta_type] = len(self._type_names)
+                    self._type_names.append(sys.intern(meta_type))
+                self._node_types[i] = type_codes[meta_type]
+
+        self._attrs_table = []
+        attrs_codes = dict()
+
+        def _intern(attrs):
+            try:
+                key = _attrs_key(attrs)
+            except TypeError:
+                # Unhashable attribute values are not interned
+                self._attrs_table.append(attrs)
+                return len(self._attrs_table) - 1
+            if key not in attrs_codes:
+                attrs_codes[key] = len(self._attrs_table)
+                self._attrs_table.append(attrs)
+            return attrs_codes[key]
+
+        self._node_attrs = array.array(
+            "i", [_intern(graph.get_node(n)) for n in self._node_ids])
+
+        sources = []
+        targets = []
+        edge_attrs = []
+        for s, t in graph.edges():
+            sources.append(self._index[s])
+            targets.append(self._index[t])
+            edge_attrs.append(_intern(graph.get_edge(s, t)))
+        (
+            self._succ_indptr, self._succ_indices, order
+        ) = _build_csr(n_nodes, sources, targets)
+        self._edge_attrs = array.array("i", [edge_attrs[i] for i in order])
+        (
+            self._pred_indptr, self._pred_indices, _
+        ) = _build_csr(n_nodes, targets, sources)
+
+        self.meta_typing = _FrozenTyping(self)
+
+    def _node_index(self, node_id):
+        try:
+            return self._index[node_id]
+        except KeyError:
+            raise KamiException(
+                "Node '{}' is not found in the graph".format(node_id))
+
+    def _ids(self, nodes):
+        return [self._node_ids[i] for i in nodes]
+
+    def _type_code(self, meta_type):
+        if meta_type in self._type_names:
+            return self._type_names.index(meta_type)
+        return -2
+
+    def _neighbours_of_type(self, node_id, indptr, indices, meta_type):
+        i = self._node_index(node_id)
+        type_code = self._type_code(meta_type)
+        return [
+            self._node_ids[j]
+            for j in indices[indptr[i]:indptr[i + 1]]
+            if self._node_types[j] == type_code
+        ]
+
+    def nodes(self, data=False):
+        """Get nodes of the graph."""
+        if data:
+            return [
+                (n, self._attrs_table[a])
+                for n, a in zip(self._node_ids, self._node_attrs)
+            ]
+        return list(self._node_ids)
+
+    def edges(self, data=False):
+        """Get edges of the graph."""
+        sources = np.repeat(
+            np.arange(len(self._node_ids)), np.diff(_view(self._succ_indptr)))
+        edges = zip(sources.tolist(), self._succ_indices)
+        if data:
+            return [
+                (self._node_ids[s], self._node_ids[t], self._attrs_table[a])
+                for (s, t), a in zip(edges, self._edge_attrs)
+            ]
+        return [
+            (self._node_ids[s], self._node_ids[t]) for s, t in edges
+        ]
+
+    def number_of_nodes(self):
+        """Get the number of nodes of the graph."""
+        return len(self._node_ids)
+
+    def number_of_edges(self):
+        """Get the number of edges of the graph."""
+        return len(self._succ_indices)
+
+    def successors(self, node_id):
+        """Get successors of the node."""
+        i = self._node_index(node_id)
+        return self._ids(
+            self._succ_indices[self._succ_indptr[i]:self._succ_indptr[i + 1]])
+
+    def predecessors(self, node_id):
+        """Get predecessors of the node."""
+        i = self._node_index(node_id)
+        return self._ids(
+            self._pred_indices[self._pred_indptr[i]:self._pred_indptr[i + 1]])
+
+    def get_node(self, node_id):
+        """Get attributes of the node (shared, should not be modified)."""
+        return self._attrs_table[self._node_attrs[self._node_index(node_id)]]
+
+    def get_edge(self, s, t):
+        """Get attributes of the edge (shared, should not be modified)."""
+        i = self._node_index(s)
+        j = self._node_index(t)
+        for position in range(self._succ_indptr[i], self._succ_indptr[i + 1]):
+            if self._succ_indices[position] == j:
+                return self._attrs_table[self._edge_attrs[position]]
+        raise KamiException(
+            "Edge '{}'->'{}' is not found in the graph".format(s, t))
+
+    def nodes_of_type(self, meta_type):
+        """Get nodes of the specified meta-model type."""
+        return self._ids(np.flatnonzero(
+            _view(self._node_types) == self._type_code(meta_type)).tolist())
+
+    def predecessors_of_type(self, node_id, meta_type):
+        """Get all the predecessors of the node with the specified type."""
+        return self._neighbours_of_type(
+            node_id, self._pred_indptr, self._pred_indices, meta_type)
+
+    def successors_of_type(self, node_id, meta_type):
+        """Get all the successors of the node with the specified type."""
+        return self._neighbours_of_type(
+            node_id, self._succ_indptr, self._succ_indices, meta_type)
+
+    def _traverse(self, node, indptr, indices, type_code, passable=None):
+        """Traverse the graph by levels collecting nodes of the type.
+
+        Parameters
+        ----------
+        node : int
+            Integer id of the source node
+        indptr, indices : array.array
+            CSR representation of the adjacency to follow
+        type_code : int
+            Code of the type of the collected nodes
+        passable : list, optional
+            List indexed by type codes indicating if the nodes of
+            the type can be traversed (by default, all the nodes)
+
+        Returns
+        -------
+        (collected, visited)
+            List of the collected neighbours of the visited nodes
+            (neighbours of several visited nodes are collected several
+            times) and the set of the visited nodes
+        """
+        node_types = self._node_types
+        collected = []
+        visited = set()
+        frontier = [node]
+        while len(frontier) > 0:
+            next_level = set()
+            for n in frontier:
+                for m in indices[indptr[n]:indptr[n + 1]]:
+                    t = node_types[m]
+                    if t == type_code:
+                        collected.append(m)
+                    if passable is None or passable[t]:
+                        next_level.add(m)
+            frontier = next_level.difference(visited)
+            visited.update(frontier)
+        return collected, visited
+
+    def _component_passable(self, meta_type=None):
+        """Get types traversable in the component hierarchy."""
+        # The last element corresponds to untyped nodes (code -1)
+        passable = [True] * (len(self._type_names) + 1)
+        if meta_type not in ["mod", "bnd"]:
+            for t in ["mod", "bnd"]:
+                if t in self._type_names:
+                    passable[self._type_names.index(t)] = False
+        return passable
+
+    def ancestors_of_type(self, node_id, meta_type):
+        """Get all the ancestors of the node with the specified type."""
+        collected, _ = self._traverse(
+            self._node_index(node_id), self._pred_indptr, self._pred_indices,
+            self._type_code(meta_type), self._component_passable(meta_type))
+        return self._ids(collected)
+
+    def descendants_of_type(self, node_id, meta_type):
+        """Get all the descendants of the node with the specified type."""
+        collected, _ = self._traverse(
+            self._node_index(node_id), self._succ_indptr, self._succ_indices,
+            self._type_code(meta_type))
+        return self._ids(collected)
+
+    def subcomponents(self, node_id):
+        """Get all the subcomponent nodes (including the node itself)."""
+        _, visited = self._traverse(
+            self._node_index(node_id), self._pred_indptr, self._pred_indices,
+            -2, self._component_passable())
+        result = set(self._ids(visited))
+        result.add(node_id)
+        return result
+
+    def get_protoform_of(self, node_id):
+        """Get protoform of the node."""
+        i = self._node_index(node_id)
+        protoform_code = self._type_code("protoform")
+        if self._node_types[i] == protoform_code:
+            return node_id
+        indptr = self._succ_indptr
+        indices = self._succ_indices
+        visited = set()
+        frontier = [i]
+        while len(frontier) > 0:
+            next_level = set()
+            for n in frontier:
+                next_level.update(indices[indptr[n]:indptr[n + 1]])
+            frontier = next_level.difference(visited)
+            for n in frontier:
+                if self._node_types[n] == protoform_code:
+                    return self._node_ids[n]
+            visited.update(frontier)
+        raise ValueError(
+            "No protoform node is associated with an element '{}'".format(
+                node_id))
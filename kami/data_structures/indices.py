@@ -0,0 +1,653 @@
+"""Collection of indices maintained by KAMI corpora and models.
+
+`ActionGraphIndex`
+`NuggetRegistry`
+`InteractionIndex`
+`TypingIndex`
+`TraversalMemo`
+"""
+
+
+def _attr_values(attrs, key):
+    """Get the set of values of an attribute."""
+    if key in attrs.keys():
+        return set(attrs[key])
+    return set()
+
+
+def _first_value(value):
+    """Get the first value of a (set-valued) graph attribute."""
+    if type(value) == str:
+        return value
+    return list(value)[0]
+
+
+def _add_to_index(index, key, value):
+    if key in index:
+        index[key][value] = None
+    else:
+        index[key] = {value: None}
+
+
+def _remove_from_index(index, key, value):
+    if key in index:
+        if value in index[key]:
+            del index[key][value]
+        if len(index[key]) == 0:
+            del index[key]
+
+
+def affected_nodes(hierarchy, graph_id, reference_id, nodes):
+    """Get the nodes of the reference graph affected by a rewrite.
+
+    Parameters
+    ----------
+    hierarchy : regraph.Hierarchy
+    graph_id : hashable
+        Id of the rewritten graph
+    reference_id : hashable
+        Id of the reference graph (e.g. the action graph)
+    nodes : iterable
+        Nodes of the rewritten graph (images of the lhs or
+        of the rhs of the rule)
+
+    Returns
+    -------
+    result : set
+        Set of nodes of the reference graph corresponding to the
+        input nodes, if `graph_id` is the reference graph, these are
+        the input nodes themselves, otherwise the nodes typing them.
+    """
+    if graph_id == reference_id:
+        return set(nodes)
+    result = set()
+    if reference_id in hierarchy.successors(graph_id):
+        typing = hierarchy.get_typing(graph_id, reference_id)
+        for n in nodes:
+            if n in typing:
+                result.add(typing[n])
+    return result
+
+
+class ActionGraphIndex(object):
+    """Index of the action graph nodes.
+
+    The index is maintained incrementally by the corpus (model) owning
+    the action graph: every rewrite re-indexes the nodes it touched,
+    so that lookups do not require scanning the action graph.
+
+    Attributes
+    ----------
+    _type_index : dict
+        Dictionary whose keys are meta-model types and whose values
+        are (ordered) collections of nodes of this type
+    _node_types : dict
+        Dictionary whose keys are indexed nodes and whose values
+        are their meta-model types
+    _uniprot_index : dict
+        Dictionary whose keys are UniProt ACs and whose values
+        are (ordered) collections of protoform nodes with this AC
+    _variant_index : dict
+        Dictionary whose keys are pairs (UniProt AC, variant name)
+        and whose values are collections of protoform nodes
+    _protoform_keys : dict
+        Dictionary whose keys are indexed protoform nodes and whose
+        values are pairs (set of UniProt ACs, set of variant names)
+    _fragment_indices : dict
+        Dictionary whose keys are triples (node, fragment type, flag
+        indicating if all the ancestor fragments are indexed) and whose
+        values are pairs (fragment index of the fragments attached to
+        the node, set of the nodes whose rewrite invalidates the index),
+        see `kami.aggregation.identifiers.FragmentIndex`
+    _fragment_index_keys : dict
+        Dictionary whose keys are nodes and whose values are collections
+        of keys of the cached fragment indices involving them
+    traversal_memo : TraversalMemo
+        Memo of traversals of the action graph, the traversals are
+        invalidated when their nodes are re-indexed
+    """
+
+    def __init__(self, graph=None, meta_typing=None):
+        """Initialize the index (and build it if the graph is specified)."""
+        self._type_index = dict()
+        self._node_types = dict()
+        self._uniprot_index = dict()
+        self._variant_index = dict()
+        self._protoform_keys = dict()
+        self._fragment_indices = dict()
+        self._fragment_index_keys = dict()
+        self.traversal_memo = TraversalMemo()
+        if graph is not None:
+            self.rebuild(graph, meta_typing)
+
+    def clear(self):
+        """Clear the index."""
+        self._type_index = dict()
+        self._node_types = dict()
+        self._uniprot_index = dict()
+        self._variant_index = dict()
+        self._protoform_keys = dict()
+        self._fragment_indices = dict()
+        self._fragment_index_keys = dict()
+        self.traversal_memo.clear()
+
+    def rebuild(self, graph, meta_typing):
+        """Rebuild the index from scratch."""
+        self.clear()
+        if graph is not None and meta_typing is not None:
+            for node in graph.nodes():
+                self._add_node(graph, meta_typing, node)
+
+    def update(self, graph, meta_typing, nodes):
+        """Re-index the specified nodes of the graph.
+
+        Nodes that are no longer present in the graph are
+        removed from the index, cached fragment indices and traversals
+        involving the nodes are invalidated.
+        """
+        self.invalidate_fragments(nodes)
+        self.traversal_memo.invalidate(nodes)
+        graph_nodes = graph.nodes()
+        for node in nodes:
+            self._remove_node(node)
+            if node in graph_nodes:
+                self._add_node(graph, meta_typing, node)
+
+    def _add_node(self, graph, meta_typing, node):
+        if node not in meta_typing:
+            return
+        meta_type = meta_typing[node]
+        self._node_types[node] = meta_type
+        _add_to_index(self._type_index, meta_type, node)
+        if meta_type == "protoform":
+            attrs = graph.get_node(node)
+            uniprotids = _attr_values(attrs, "uniprotid")
+            variant_names = _attr_values(attrs, "variant_name")
+            self._protoform_keys[node] = (uniprotids, variant_names)
+            for uniprotid in uniprotids:
+                _add_to_index(self._uniprot_index, uniprotid, node)
+                for name in variant_names:
+                    _add_to_index(
+                        self._variant_index, (uniprotid, name), node)
+
+    def _remove_node(self, node):
+        if node in self._node_types:
+            _remove_from_index(
+                self._type_index, self._node_types[node], node)
+            del self._node_types[node]
+        if node in self._protoform_keys:
+            uniprotids, variant_names = self._protoform_keys[node]
+            for uniprotid in uniprotids:
+                _remove_from_index(self._uniprot_index, uniprotid, node)
+                for name in variant_names:
+                    _remove_from_index(
+                        self._variant_index, (uniprotid, name), node)
+            del self._protoform_keys[node]
+
+    def nodes_of_type(self, meta_type):
+        """Get nodes of the specified meta-model type."""
+        if meta_type in self._type_index:
+            return list(self._type_index[meta_type])
+        return []
+
+    def count_nodes_of_type(self, meta_type):
+        """Get the number of nodes of the specified meta-model type."""
+        if meta_type in self._type_index:
+            return len(self._type_index[meta_type])
+        return 0
+
+    def type_counts(self):
+        """Get a dictionary with the number of nodes of every type."""
+        return {
+            meta_type: len(nodes)
+            for meta_type, nodes in self._type_index.items()
+        }
+
+    def get_protoforms_by_uniprot(self, uniprotid):
+        """Get protoform nodes with the specified UniProt AC."""
+        if uniprotid in self._uniprot_index:
+            return list(self._uniprot_index[uniprotid])
+        return []
+
+    def get_protoforms_by_variant(self, uniprotid, variant_name):
+        """Get protoform nodes with the specified UniProt AC and variant."""
+        if (uniprotid, variant_name) in self._variant_index:
+            return list(self._variant_index[(uniprotid, variant_name)])
+        return []
+
+    def get_fragment_index(self, node, fragment_type, build,
+                           ancestors=False, footprint=None):
+        """Get the cached index of fragments attached to the node.
+
+        Parameters
+        ----------
+        node : hashable
+            Protoform (or region) the fragments are attached to
+        fragment_type : str
+            Meta-model type of the fragments (region, site or residue)
+        build : callable
+            Function building the fragment index if it is not cached
+        ancestors : bool, optional
+            Flag indicating if the index contains all the ancestor
+            fragments of the node (and not only the immediate ones)
+        footprint : set, optional
+            Set of the nodes examined by `build` (filled by the build),
+            the index is invalidated when one of them is rewritten
+        """
+        key = (node, fragment_type, ancestors)
+        if key not in self._fragment_indices:
+            fragment_index = build()
+            nodes = set(fragment_index.fragments())
+            nodes.add(node)
+            if footprint is not None:
+                nodes.update(footprint)
+            self._fragment_indices[key] = (fragment_index, nodes)
+            for n in nodes:
+                _add_to_index(self._fragment_index_keys, n, key)
+        return self._fragment_indices[key][0]
+
+    def _remove_fragment_index(self, key):
+        _, indexed_nodes = self._fragment_indices[key]
+        for n in indexed_nodes:
+            _remove_from_index(self._fragment_index_keys, n, key)
+        del self._fragment_indices[key]
+
+    def invalidate_fragments(self, nodes):
+        """Remove the cached fragment indices involving the nodes."""
+        for node in nodes:
+            if node in self._fragment_index_keys:
+                for key in list(self._fragment_index_keys[node]):
+                    self._remove_fragment_index(key)
+
+    def invalidate_attached_fragments(self, node):
+        """Remove the cached indices of fragments attached to the node.
+
+        Used when fragments are attached to the node without
+        rewriting (the indices of fragments attached to other
+        nodes are kept).
+        """
+        if node in self._fragment_index_keys:
+            for key in list(self._fragment_index_keys[node]):
+                if key[0] == node:
+                    self._remove_fragment_index(key)
+
+
+class NuggetRegistry(object):
+    """Registry of nuggets, semantic nuggets and templates.
+
+    The registry is maintained by the knowledge base (corpus or model)
+    when nuggets are added, removed or loaded, so that nuggets can
+    be enumerated and looked up without scanning the hierarchy.
+
+    Attributes
+    ----------
+    _nuggets : dict
+        Dictionary whose keys are ids of nugget graphs and whose values
+        are dictionaries with the keys "type", "desc" and "template"
+        (id of the template the nugget is related to)
+    _semantic_nuggets : dict
+        Dictionary whose keys are ids of semantic nugget graphs and
+        whose values are sets of their interaction types
+    _templates : dict
+        Dictionary whose keys are ids of template graphs
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._nuggets = dict()
+        self._semantic_nuggets = dict()
+        self._templates = dict()
+
+    def clear(self):
+        """Clear the registry."""
+        self._nuggets = dict()
+        self._semantic_nuggets = dict()
+        self._templates = dict()
+
+    def rebuild(self, hierarchy, is_nugget_graph):
+        """Rebuild the registry from the graphs of the hierarchy.
+
+        Parameters
+        ----------
+        hierarchy : regraph.Hierarchy
+        is_nugget_graph : callable
+            Function testing if a graph of the hierarchy is
+            a nugget of the knowledge base
+        """
+        self.clear()
+        for graph_id in hierarchy.graphs():
+            attrs = hierarchy.get_graph_attrs(graph_id)
+            if "type" not in attrs.keys():
+                continue
+            if is_nugget_graph(graph_id):
+                template = None
+                for r in hierarchy.adjacent_relations(graph_id):
+                    if r in ["mod_template", "bnd_template"]:
+                        template = r
+                self.add_nugget(graph_id, attrs, template)
+            elif "semantic_nugget" in attrs["type"]:
+                self.add_semantic_nugget(graph_id, attrs)
+            elif "template" in attrs["type"]:
+                self.add_template(graph_id)
+
+    def add_nugget(self, nugget_id, attrs, template=None):
+        """Register a nugget given the attributes of its graph."""
+        nugget_type = None
+        if "interaction_type" in attrs.keys():
+            nugget_type = _first_value(attrs["interaction_type"])
+        desc = ""
+        if "desc" in attrs.keys() and attrs["desc"] is not None:
+            desc = _first_value(attrs["desc"])
+        self._nuggets[nugget_id] = {
+            "type": nugget_type,
+            "desc": desc,
+            "template": template
+        }
+
+    def remove_nugget(self, nugget_id):
+        """Remove a nugget from the registry."""
+        if nugget_id in self._nuggets:
+            del self._nuggets[nugget_id]
+
+    def copy_nuggets(self, registry, nugget_ids):
+        """Copy the entries of the nuggets from another registry."""
+        for nugget_id in nugget_ids:
+            if registry.is_nugget(nugget_id):
+                self._nuggets[nugget_id] = dict(registry._nuggets[nugget_id])
+
+    def add_semantic_nugget(self, nugget_id, attrs):
+        """Register a semantic nugget given the attributes of its graph."""
+        interaction_types = set()
+        if "interaction_type" in attrs.keys():
+            interaction_types = set(attrs["interaction_type"])
+        self._semantic_nuggets[nugget_id] = interaction_types
+
+    def add_template(self, template_id):
+        """Register a template."""
+        self._templates[template_id] = None
+
+    def is_nugget(self, nugget_id):
+        """Test if the graph is a registered nugget."""
+        return nugget_id in self._nuggets
+
+    def nuggets(self):
+        """Get a list of registered nuggets."""
+        return list(self._nuggets)
+
+    def count_nuggets(self):
+        """Get the number of registered nuggets."""
+        return len(self._nuggets)
+
+    def get_nugget_type(self, nugget_id):
+        """Get the interaction type of the nugget."""
+        return self._nuggets[nugget_id]["type"]
+
+    def get_nugget_desc(self, nugget_id):
+        """Get the description of the nugget."""
+        return self._nuggets[nugget_id]["desc"]
+
+    def set_nugget_desc(self, nugget_id, desc):
+        """Set the description of the nugget."""
+        self._nuggets[nugget_id]["desc"] = desc
+
+    def get_nugget_template(self, nugget_id):
+        """Get the id of the template the nugget is related to."""
+        return self._nuggets[nugget_id]["template"]
+
+    def set_nugget_template(self, nugget_id, template_id):
+        """Set the id of the template the nugget is related to."""
+        self._nuggets[nugget_id]["template"] = template_id
+
+    def semantic_nuggets(self, interaction_type=None):
+        """Get a list of semantic nuggets (of the interaction type)."""
+        return [
+            n for n, types in self._semantic_nuggets.items()
+            if interaction_type is None or interaction_type in types
+        ]
+
+    def templates(self):
+        """Get a list of registered templates."""
+        return list(self._templates)
+
+
+class InteractionIndex(object):
+    """Index of pairwise interactions between protoforms.
+
+    Every MOD (BND) nugget with an enzyme and a substrate (a left and
+    a right partner) is indexed by the pair of protoforms of the action
+    graph typing them. The index is maintained by the knowledge base
+    owning the nuggets: nuggets are re-indexed when they are added,
+    removed or rewritten and when the nodes of the action graph typing
+    their partners are rewritten (e.g. merged).
+
+    Attributes
+    ----------
+    _interactions : dict
+        Dictionary whose keys are source protoforms and whose values are
+        dictionaries whose keys are target protoforms and whose values
+        are dictionaries with the keys of the form
+        (nugget id, interaction type, description)
+    _nuggets : dict
+        Dictionary whose keys are indexed nuggets and whose values
+        are pairs (source protoform, target protoform)
+    _node_nuggets : dict
+        Dictionary whose keys are protoforms and whose values are
+        collections of nuggets indexed by pairs containing them
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._interactions = dict()
+        self._nuggets = dict()
+        self._node_nuggets = dict()
+
+    def add_nugget(self, nugget_id, source, target, nugget_type, desc):
+        """Index the interaction of a nugget."""
+        self.remove_nugget(nugget_id)
+        if source not in self._interactions:
+            self._interactions[source] = dict()
+        _add_to_index(
+            self._interactions[source], target,
+            (nugget_id, nugget_type, desc))
+        self._nuggets[nugget_id] = (source, target, nugget_type, desc)
+        _add_to_index(self._node_nuggets, source, nugget_id)
+        _add_to_index(self._node_nuggets, target, nugget_id)
+
+    def remove_nugget(self, nugget_id):
+        """Remove the interaction of a nugget from the index."""
+        if nugget_id in self._nuggets:
+            source, target, nugget_type, desc = self._nuggets[nugget_id]
+            _remove_from_index(
+                self._interactions[source], target,
+                (nugget_id, nugget_type, desc))
+            if len(self._interactions[source]) == 0:
+                del self._interactions[source]
+            _remove_from_index(self._node_nuggets, source, nugget_id)
+            _remove_from_index(self._node_nuggets, target, nugget_id)
+            del self._nuggets[nugget_id]
+
+    def nuggets_of_nodes(self, nodes):
+        """Get nuggets whose interactions involve the protoforms."""
+        result = set()
+        for node in nodes:
+            if node in self._node_nuggets:
+                result.update(self._node_nuggets[node])
+        return result
+
+    def interactions(self):
+        """Get pairwise interactions.
+
+        Returns
+        -------
+        interactions : dict
+            Dictionary whose keys are source protoforms and whose values
+            are dictionaries whose keys are target protoforms and whose
+            values are sets of triples
+            (nugget id, interaction type, description)
+        """
+        return {
+            s: {t: set(nuggets) for t, nuggets in targets.items()}
+            for s, targets in self._interactions.items()
+        }
+
+    def pairs(self):
+        """Get unordered pairs of interacting protoforms."""
+        pairs = dict()
+        for s, targets in self._interactions.items():
+            for t in targets:
+                if (t, s) not in pairs:
+                    pairs[(s, t)] = None
+        return list(pairs)
+
+
+class TypingIndex(object):
+    """Reverse index of the typing of nuggets by the action graph.
+
+    Every nugget is indexed by the set of the action graph nodes typing
+    its nodes, so that the nuggets typed by a node can be found without
+    scanning the typings of all the nuggets. The index is maintained by
+    the knowledge base owning the nuggets: nuggets are re-indexed when
+    they are added, removed or rewritten and when the nodes of the
+    action graph typing them are rewritten (e.g. merged or cloned).
+
+    Attributes
+    ----------
+    _node_nuggets : dict
+        Dictionary whose keys are action graph nodes and whose values
+        are collections of nuggets typed by them
+    _nugget_nodes : dict
+        Dictionary whose keys are indexed nuggets and whose values
+        are sets of the action graph nodes typing them
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._node_nuggets = dict()
+        self._nugget_nodes = dict()
+
+    def add_nugget(self, nugget_id, ag_nodes):
+        """Index the nugget typed by the action graph nodes."""
+        self.remove_nugget(nugget_id)
+        ag_nodes = set(ag_nodes)
+        for node in ag_nodes:
+            _add_to_index(self._node_nuggets, node, nugget_id)
+        self._nugget_nodes[nugget_id] = ag_nodes
+
+    def remove_nugget(self, nugget_id):
+        """Remove the nugget from the index."""
+        if nugget_id in self._nugget_nodes:
+            for node in self._nugget_nodes[nugget_id]:
+                _remove_from_index(self._node_nuggets, node, nugget_id)
+            del self._nugget_nodes[nugget_id]
+
+    def nodes_of_nugget(self, nugget_id):
+        """Get the action graph nodes typing the nugget."""
+        return set(self._nugget_nodes.get(nugget_id, set()))
+
+    def nuggets_of_node(self, node):
+        """Get the nuggets typed by the action graph node."""
+        if node in self._node_nuggets:
+            return list(self._node_nuggets[node])
+        return []
+
+    def nuggets_of_nodes(self, nodes):
+        """Get the nuggets typed by any of the action graph nodes."""
+        result = set()
+        for node in nodes:
+            if node in self._node_nuggets:
+                result.update(self._node_nuggets[node])
+        return result
+
+
+class TraversalMemo(object):
+    """Memo of traversals of a graph.
+
+    Every memoized result is stored together with its footprint: the
+    set of nodes whose adjacency was examined by the traversal. The
+    result remains valid as long as none of these nodes is touched
+    (a node is touched by a rewrite if its attributes, its type or
+    its incident edges are modified). The owner of the graph is
+    responsible for invalidating the touched nodes on every update
+    of the graph, for example, the memo of the action graph index
+    is invalidated on every re-indexing of the action graph.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups of memoized results
+    misses : int
+        Number of lookups of results that were not memoized
+    invalidations : int
+        Number of results invalidated
+    _entries : dict
+        Dictionary whose keys are keys of the traversals and whose
+        values are pairs (result, footprint)
+    _node_keys : dict
+        Dictionary whose keys are nodes and whose values are
+        collections of keys of the traversals whose footprint
+        contains the node
+    """
+
+    def __init__(self):
+        """Initialize an empty memo."""
+        self._entries = dict()
+        self._node_keys = dict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        """Get the number of memoized results."""
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all the memoized results (counters are kept)."""
+        self._entries = dict()
+        self._node_keys = dict()
+
+    def lookup(self, key):
+        """Find the memoized traversal.
+
+        Returns
+        -------
+        entry : tuple or None
+            Pair (result, footprint) if the result is memoized,
+            None otherwise
+        """
+        if key in self._entries:
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, key, result, footprint):
+        """Memoize the result of the traversal with its footprint."""
+        if key in self._entries:
+            self._remove(key)
+        footprint = frozenset(footprint)
+        self._entries[key] = (result, footprint)
+        for node in footprint:
+            _add_to_index(self._node_keys, node, key)
+
+    def _remove(self, key):
+        _, footprint = self._entries[key]
+        for node in footprint:
+            _remove_from_index(self._node_keys, node, key)
+        del self._entries[key]
+
+    def invalidate(self, nodes):
+        """Remove the memoized results whose footprint contains the nodes."""
+        for node in nodes:
+            if node in self._node_keys:
+                for key in list(self._node_keys[node]):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def stats(self):
+        """Get a dictionary with the counters and the size of the memo."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self._entries)
+        }
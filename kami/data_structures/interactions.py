@@ -1,5 +1,4 @@
 """Collection of classes implementing interactions."""
-import sys
 from .entities import (Protoform, SiteActor, RegionActor,
                        Residue, State, Region, Site, actor_from_json, actor_to_json)
 
@@ -48,7 +47,10 @@ class Interaction(object):
     @classmethod
     def from_json(cls, json_data):
         """Create Interaction object from json."""
-        return getattr(sys.modules[__name__], json_data["type"]).from_json(json_data)
+        if json_data["type"] not in INTERACTION_CLASSES:
+            raise KamiError(
+                "Unknown type of interaction '{}'".format(json_data["type"]))
+        return INTERACTION_CLASSES[json_data["type"]].from_json(json_data)
 
 
 class Modification(Interaction):
@@ -755,3 +757,13 @@ class LigandModification(Interaction):
             self.enzyme.generate_desc(), state_rep, self.substrate.generate_desc(),
             " at {}".format(residue_rep) if len(residue_rep) > 0 else "")
         return desc
+
+
+INTERACTION_CLASSES = {
+    "Modification": Modification,
+    "Binding": Binding,
+    "Unbinding": Unbinding,
+    "SelfModification": SelfModification,
+    "AnonymousModification": AnonymousModification,
+    "LigandModification": LigandModification
+}
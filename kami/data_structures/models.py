@@ -2,7 +2,9 @@
 import copy
 import datetime
 import json
+import multiprocessing
 import os
+from contextlib import contextmanager
 
 from regraph import (Rule, NXGraph, NXHierarchy, Neo4jHierarchy,
                      keys_by_value)
@@ -12,10 +14,20 @@ from regraph.utils import relation_to_json, attrs_to_json
 
 from kami.aggregation.identifiers import EntityIdentifier
 from kami.data_structures.definitions import Definition
+from kami.data_structures.frozen import FrozenActionGraph
+from kami.data_structures.revisions import RevisionRecorder
+from kami.data_structures.transactions import (Transaction,
+                                               hierarchy_elements,
+                                               discard_added_elements)
+from kami.data_structures.indices import (ActionGraphIndex, NuggetRegistry,
+                                          InteractionIndex, TypingIndex,
+                                          TraversalMemo, affected_nodes)
 from kami.data_structures.annotations import (ModelAnnotation, CorpusAnnotation,
                                               ContextAnnotation)
 from kami.resources import default_components
-from kami.utils.generic import (nodes_of_type, _init_from_data)
+from kami.utils.generic import (nodes_of_type, _init_from_data,
+                                _unshare_graphs)
+from kami.utils.snapshots import write_snapshot, read_snapshot
 
 
 from kami.exceptions import KamiHierarchyError, KamiException
@@ -38,6 +50,91 @@ def _empty_aa_found(identifier, node):
     return deattach
 
 
+def _find_nugget_removals(task, copy=False):
+    """Find the nodes and the edges to remove from a binding nugget.
+
+    Removes the edges from the actors containing residues with the
+    empty aa to the BND nodes of the nugget and finds the nodes
+    disconnected from the `do` BND node together with the residues with
+    the empty aa.
+
+    Parameters
+    ----------
+    task : tuple
+        Tuple `(nugget_id, nugget_graph, meta_typing, bnd_actions)`
+    copy : bool, optional
+        If True, the nugget graph is copied before the first removal of
+        an edge, otherwise the edges are removed in place (for example,
+        from the copy of the graph sent to a worker process)
+
+    Returns
+    -------
+    (nugget_id, nodes_to_remove, edges_to_remove)
+        Set of the nodes and list of the edges (between the nodes that
+        are not removed) to remove from the nugget
+    """
+    nugget_id, nugget_graph, meta_typing, bnd_actions = task
+    identifier = EntityIdentifier(
+        nugget_graph, meta_typing, immediate=False, memo=TraversalMemo())
+    # Graph from which the edges are removed
+    edited_graph = None if copy else nugget_graph
+
+    removed_edges = []
+    already_detached = []
+
+    def _detach_edge_to_bnds(bnd_action, partner_to_ignore=None):
+        nonlocal edited_graph
+        edges_to_remove = set()
+        for p in identifier.graph.predecessors(bnd_action):
+            if p != partner_to_ignore:
+                if not _empty_aa_found(identifier, p):
+                    # Find other bonds
+                    other_bnds = [
+                        bnd
+                        for bnd in identifier.get_attached_bnd(p)
+                        if bnd != bnd_action
+                    ]
+                    for bnd in other_bnds:
+                        if bnd not in already_detached:
+                            already_detached.append(bnd)
+                            _detach_edge_to_bnds(bnd, p)
+                else:
+                    edges_to_remove.add((p, bnd_action))
+        if len(edges_to_remove) > 0 and edited_graph is None:
+            edited_graph = NXGraph.copy(nugget_graph)
+            identifier.graph = edited_graph
+        for s, t in edges_to_remove:
+            edited_graph.remove_edge(s, t)
+            identifier.memo.invalidate([s, t])
+            removed_edges.append((s, t))
+
+    # Find a BND node with type == do
+    do_bnd = None
+    for bnd_action in bnd_actions:
+        attrs = nugget_graph.get_node(bnd_action)
+        if list(attrs["type"])[0] == "do":
+            do_bnd = bnd_action
+            break
+    # Deattach preds of do_bnd if residue aa is empty
+    _detach_edge_to_bnds(do_bnd)
+    # Remove all the graph nodes disconected from the action node
+    nodes_to_remove = set(
+        identifier.graph.nodes_disconnected_from(do_bnd))
+
+    # Remove empty residue conditions
+    for protoform in identifier.get_protoforms():
+        for res in identifier.get_attached_residues(protoform):
+            residue_attrs = nugget_graph.get_node(res)
+            if "aa" not in residue_attrs or len(residue_attrs["aa"]) == 0:
+                nodes_to_remove.add(res)
+
+    edges_to_remove = [
+        (s, t) for s, t in removed_edges
+        if s not in nodes_to_remove and t not in nodes_to_remove
+    ]
+    return nugget_id, nodes_to_remove, edges_to_remove
+
+
 class KamiContext(object):
     """Class for KAMI contexts."""
 
@@ -252,8 +349,7 @@ class NewKamiModel(object):
     def _nugget_clean_up(self, nugget_id, instantiation_rule,
                          instantiation_instance):
 
-        nugget_typing = self.corpus._hierarchy.get_typing(
-            nugget_id, self.corpus._action_graph_id)
+        nugget_typing = self.corpus.get_nugget_typing(nugget_id)
         ag_typing = self.corpus.get_action_graph_typing()
         n_meta_typing = {
             k: ag_typing[v] for k, v in nugget_typing.items()
@@ -473,6 +569,9 @@ class KamiModel(object):
         of the action graph, i.e. defining whether proteins or their
         components where instantiated from the same structural
         component.
+    _shared_graphs : set
+        Set of ids of the nugget graphs shared with the corpus
+        (see `KamiCorpus.instantiate`)
 
     annotation : kami.data_structures.annotations.CorpusAnnotation
     creation_time : str
@@ -489,7 +588,8 @@ class KamiModel(object):
                  uri=None, user=None, password=None, driver=None, data=None,
                  default_bnd_rate=None,
                  default_brk_rate=None,
-                 default_mod_rate=None):
+                 default_mod_rate=None,
+                 revision_policy=None):
         """Initialize a KAMI model."""
         self._id = model_id
         self._action_graph_id = self._id + "_action_graph"
@@ -510,6 +610,7 @@ class KamiModel(object):
             else:
                 self._hierarchy = Neo4jHierarchy(uri, user, password)
         self._versioning = VersionedHierarchy(self._hierarchy)
+        self._revisions = RevisionRecorder(revision_policy)
         if creation_time is None:
             creation_time = str(datetime.datetime.now())
         self.creation_time = creation_time
@@ -543,13 +644,23 @@ class KamiModel(object):
             if (u, v) not in self._hierarchy.relations():
                 self._hierarchy.add_relation(u, v, rel, attrs)
 
+        self._init_nugget_registry()
+        self._shared_graphs = set()
+
         _init_from_data(self, data, True)
 
         self._init_shortcuts()
+        self._init_indices()
         return
 
-    def _copy_knowledge_from_corpus(self, corpus):
-        """Copy the AG and nuggets from the corpus."""
+    def _copy_knowledge_from_corpus(self, corpus, copy_on_write=False):
+        """Copy the AG and nuggets from the corpus.
+
+        If `copy_on_write` is True, the nugget graphs (and their typing
+        by the action graph) are shared with the corpus instead of being
+        copied. Shared graphs are copied by the corpus or the model
+        before being modified (see `kami.utils.generic._unshare_graphs`).
+        """
         if self._backend != "networkx":
             raise KamiHierarchyError(
                 "Method '_copy_knowledge_from_corpus' is available only " +
@@ -594,16 +705,32 @@ class KamiModel(object):
                     model_nugget_id, r, {})
 
             # Update nugget related objects
-            nugget_obj = NXGraph.copy(corpus.get_nugget(n))
-            self._hierarchy._update_graph(model_nugget_id, nugget_obj)
-            self._hierarchy._update_mapping(
-                model_nugget_id, self._action_graph_id,
-                corpus.get_nugget_typing(n))
+            if copy_on_write:
+                # The graph object is stored directly, as
+                # `_update_graph` of the hierarchy copies it
+                self._hierarchy.node[model_nugget_id]["graph"] =\
+                    corpus.get_nugget(n)
+                self._hierarchy._update_mapping(
+                    model_nugget_id, self._action_graph_id,
+                    corpus.get_nugget_typing(n))
+                self._shared_graphs.add(model_nugget_id)
+                corpus._shared_graphs.add(n)
+            else:
+                nugget_obj = NXGraph.copy(corpus.get_nugget(n))
+                self._hierarchy._update_graph(model_nugget_id, nugget_obj)
+                self._hierarchy._update_mapping(
+                    model_nugget_id, self._action_graph_id,
+                    dict(corpus.get_nugget_typing(n)))
             for r in adj_relations:
                 self._hierarchy._update_relation(
                     model_nugget_id, r,
                     corpus._hierarchy.get_relation(n, r)
                 )
+            self._nugget_registry.add_nugget(
+                model_nugget_id,
+                self._hierarchy.get_graph_attrs(model_nugget_id),
+                corpus._nugget_registry.get_nugget_template(n))
+        self._init_indices()
 
     def _init_shortcuts(self):
         """Initialize kami-specific shortcuts."""
@@ -618,18 +745,116 @@ class KamiModel(object):
         self.bnd_template = self._hierarchy.get_graph(
             "bnd_template")
 
+    def _init_nugget_registry(self):
+        """Build the registry of nuggets from the hierarchy graphs."""
+        self._nugget_registry = NuggetRegistry()
+        self._nugget_registry.rebuild(self._hierarchy, self.is_nugget_graph)
+
+    def _init_indices(self):
+        """Build the indices of the action graph from scratch."""
+        self._ag_index = ActionGraphIndex(
+            self.action_graph, self.get_action_graph_typing())
+        self._init_typing_index()
+        # Built on demand (see `_get_interaction_index`)
+        self._interaction_index = None
+
+    def _init_typing_index(self):
+        """Build the reverse index of the typing of nuggets by the AG."""
+        self._typing_index = None
+        if self._backend == "networkx":
+            self._typing_index = TypingIndex()
+            for nugget_id in self.nuggets():
+                self._index_nugget_typing(nugget_id)
+
+    def _update_indices(self, ag_nodes, graph_id=None):
+        """Re-index the specified nodes of the action graph.
+
+        If `graph_id` is specified, the nuggets affected by the rewrite
+        of this graph are re-indexed.
+        """
+        if self.action_graph is not None:
+            self._ag_index.update(
+                self.action_graph, self.get_action_graph_typing(), ag_nodes)
+        if self._typing_index is not None:
+            # Nuggets typed by the rewritten nodes are still indexed
+            # by the nodes of the action graph preceding the rewrite
+            nuggets = self._typing_index.nuggets_of_nodes(ag_nodes)
+            if graph_id is not None and\
+                    self._nugget_registry.is_nugget(graph_id):
+                nuggets.add(graph_id)
+            for nugget_id in nuggets:
+                self._index_nugget_typing(nugget_id)
+        if self._interaction_index is not None:
+            nuggets = self._interaction_index.nuggets_of_nodes(ag_nodes)
+            if graph_id is not None and\
+                    self._nugget_registry.is_nugget(graph_id):
+                nuggets.add(graph_id)
+            for nugget_id in nuggets:
+                self._index_nugget_interaction(nugget_id)
+
+    def _get_interaction_index(self):
+        """Get the index of pairwise interactions (build it if needed)."""
+        if self._interaction_index is None:
+            self._interaction_index = InteractionIndex()
+            for nugget_id in self.nuggets():
+                self._index_nugget_interaction(nugget_id)
+        return self._interaction_index
+
+    def _index_nugget_typing(self, nugget_id):
+        """Re-index the typing of the nugget by the action graph."""
+        if self._typing_index is None:
+            return
+        if not self._nugget_registry.is_nugget(nugget_id):
+            self._typing_index.remove_nugget(nugget_id)
+        else:
+            self._typing_index.add_nugget(
+                nugget_id, self._hierarchy.get_typing(
+                    nugget_id, self._action_graph_id).values())
+
+    def _get_nuggets_typed_by(self, ag_node):
+        """Get the nuggets typed by the node of the action graph."""
+        if self._typing_index is not None:
+            return self._typing_index.nuggets_of_node(ag_node)
+        return self._hierarchy.graphs_typed_by_node(
+            self._action_graph_id, ag_node)
+
+    def _index_nugget_interaction(self, nugget_id):
+        """Re-index the interaction of the nugget (if the index is built)."""
+        if self._interaction_index is None:
+            return
+        self._interaction_index.remove_nugget(nugget_id)
+        if not self._nugget_registry.is_nugget(nugget_id):
+            return
+        if self.is_mod_nugget(nugget_id):
+            source = self.get_enzyme(nugget_id)
+            target = self.get_substrate(nugget_id)
+        elif self.is_bnd_nugget(nugget_id):
+            source = self.get_left_partner(nugget_id)
+            target = self.get_right_partner(nugget_id)
+        else:
+            return
+        if source is not None and target is not None:
+            ag_typing = self.get_nugget_typing(nugget_id)
+            self._interaction_index.add_nugget(
+                nugget_id, ag_typing[source], ag_typing[target],
+                self.get_nugget_type(nugget_id),
+                self.get_nugget_desc(nugget_id))
+
     def get_nugget(self, nugget_id):
         """Get a nugget by ID."""
-        for node_id in self._hierarchy.graphs():
-            if self.is_nugget_graph(node_id):
-                return self._hierarchy.get_graph(nugget_id)
+        if self._nugget_registry.is_nugget(nugget_id):
+            return self._hierarchy.get_graph(nugget_id)
         raise KamiException("Nugget '{}' is not found".format(nugget_id))
 
     def clear(self):
         """Clear data elements of corpus."""
         for n in self.nuggets():
             self._hierarchy.remove_graph(n)
+            self._nugget_registry.remove_nugget(n)
         self._hierarchy.remove_graph(self._action_graph_id)
+        self._shared_graphs = set()
+        self._init_typing_index()
+        self._interaction_index = None
 
     def create_empty_action_graph(self):
         """Creat an empty action graph in the hierarchy."""
@@ -651,13 +876,105 @@ class KamiModel(object):
                 rhs_typing=None, strict=False,
                 message="Model update", update_type="manual"):
         """Overloading of the rewrite method."""
-        r_g_prime, _ = self._versioning.rewrite(
-            graph_id, rule=rule, instance=instance,
+        if instance is None:
+            lhs_nodes = rule.lhs.nodes()
+        else:
+            lhs_nodes = instance.values()
+        if len(self._shared_graphs) > 0:
+            if graph_id == self._action_graph_id:
+                # Only the nuggets typed by the rewritten nodes are affected
+                _unshare_graphs(
+                    self, self._typing_index.nuggets_of_nodes(lhs_nodes))
+            elif rule.is_restrictive() and\
+                    not self._nugget_registry.is_nugget(graph_id):
+                _unshare_graphs(self, list(self._shared_graphs))
+            else:
+                _unshare_graphs(self, [graph_id])
+        touched_nodes = affected_nodes(
+            self._hierarchy, graph_id, self._action_graph_id, lhs_nodes)
+        r_g_prime = self._revisions.rewrite(
+            self._versioning, graph_id, rule=rule, instance=instance,
             rhs_typing=rhs_typing, strict=strict,
             message=message, update_type=update_type)
         self._init_shortcuts()
+        touched_nodes.update(affected_nodes(
+            self._hierarchy, graph_id, self._action_graph_id,
+            r_g_prime.values()))
+        self._update_indices(touched_nodes, graph_id)
         return r_g_prime
 
+    def operation(self, message, update_type="manual"):
+        """Get the context of a logical operation on the model.
+
+        If revision coalescing is enabled by the revision policy,
+        all the rewrites performed in the context are recorded as
+        a single revision.
+        """
+        return self._revisions.operation(
+            self._versioning, message, update_type)
+
+    @contextmanager
+    def transaction(self, message, update_type="manual"):
+        """Get the context of a transaction on the action graph.
+
+        The edits collected by the transaction (see
+        `kami.data_structures.transactions.Transaction`) are applied
+        as a single rewrite of the action graph on exit, and all the
+        rewrites performed in the context are recorded as a single
+        revision. If an error occurs, the collected edits are discarded,
+        the rewrites performed in the context are reverted and the
+        graphs (for example, nuggets), typings and relations added in
+        the context are removed::
+
+            with model.transaction("Merged residues") as t:
+                t.add_edge(residue, site, {"loc": 100})
+                t.merge_nodes([residue, other_residue])
+        """
+        if self.action_graph is None:
+            self.create_empty_action_graph()
+        transaction = Transaction(self.action_graph)
+        elements = hierarchy_elements(self._hierarchy)
+        try:
+            with self._revisions.transaction(
+                    self._versioning, message, update_type):
+                yield transaction
+                transaction.commit(
+                    self, self._action_graph_id, message, update_type)
+        except BaseException:
+            removed_graphs = discard_added_elements(
+                self._hierarchy, elements)
+            self._shared_graphs.difference_update(removed_graphs)
+            self._init_nugget_registry()
+            self._init_shortcuts()
+            self._init_indices()
+            raise
+
+    def set_revision_policy(self, policy):
+        """Set the policy of recording revisions of the model."""
+        if self._revisions.in_operation():
+            raise KamiHierarchyError(
+                "Revision policy cannot be changed during an operation")
+        self._revisions = RevisionRecorder(policy)
+
+    def checkpoint(self):
+        """Mark the current revision as a checkpoint.
+
+        If the revision policy defines a retention window,
+        the revisions preceding it are pruned.
+        """
+        self._revisions.checkpoint(self._versioning)
+
+    def rollback(self, revision_id, message=None):
+        """Rollback the current branch to the (retained) revision."""
+        if self._revisions.in_operation():
+            raise KamiHierarchyError(
+                "Model cannot be rolled back during an operation")
+        _unshare_graphs(self, list(self._shared_graphs))
+        self._versioning.rollback(revision_id, message=message)
+        self._init_nugget_registry()
+        self._init_shortcuts()
+        self._init_indices()
+
     def find_matching(self, graph_id, pattern,
                       pattern_typing=None, nodes=None):
         """Overloading of the find matching method."""
@@ -681,7 +998,7 @@ class KamiModel(object):
     def get_proteins_by_uniprot(self, uniprotid):
         """Get a protein by the UniProt AC."""
         res = []
-        for protein in self.proteins():
+        for protein in self._ag_index.get_protoforms_by_uniprot(uniprotid):
             attrs = self.action_graph.get_node(protein)
             u = list(attrs["uniprotid"])[0]
             if u == uniprotid:
@@ -700,20 +1017,11 @@ class KamiModel(object):
 
     def get_nugget_desc(self, nugget_id):
         """Get nugget description string."""
-        nugget_attrs = self._hierarchy.get_graph_attrs(nugget_id)
-        if 'desc' in nugget_attrs.keys():
-            if type(nugget_attrs['desc']) == str:
-                nugget_desc = nugget_attrs['desc']
-            else:
-                nugget_desc = list(nugget_attrs['desc'])[0]
-        else:
-            nugget_desc = ""
-        return nugget_desc
+        return self._nugget_registry.get_nugget_desc(nugget_id)
 
     def get_nugget_type(self, nugget_id):
         """Get type of the nugget specified by id."""
-        return list(self._hierarchy.get_graph_attrs(
-            nugget_id)["interaction_type"])[0]
+        return self._nugget_registry.get_nugget_type(nugget_id)
 
     def get_nugget_template_rel(self, nugget_id):
         """Get relation of a nugget to a template."""
@@ -728,12 +1036,7 @@ class KamiModel(object):
 
     def nuggets(self):
         """Get a list of nuggets in the hierarchy."""
-        nuggets = []
-        for node_id in self._hierarchy.predecessors(
-                self._action_graph_id):
-            if self.is_nugget_graph(node_id):
-                nuggets.append(node_id)
-        return nuggets
+        return self._nugget_registry.nuggets()
 
     def empty(self):
         """Test if model is empty."""
@@ -743,18 +1046,37 @@ class KamiModel(object):
 
     def proteins(self):
         """Get a list of agent nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "protoform")
+        return self._ag_index.nodes_of_type("protoform")
+
+    def ag_type_counts(self):
+        """Get the number of action graph nodes of every meta-type."""
+        return self._ag_index.type_counts()
+
+    def freeze(self):
+        """Get an immutable compact view of the action graph.
+
+        The view is not updated when the model is modified. It can be
+        wrapped by `EntityIdentifier` for read-only identification::
+
+            frozen_ag = model.freeze()
+            identifier = EntityIdentifier(frozen_ag, frozen_ag.meta_typing)
+
+        Returns
+        -------
+        kami.data_structures.frozen.FrozenActionGraph
+        """
+        if self.action_graph is None:
+            raise KamiException("The model has no action graph")
+        return FrozenActionGraph(
+            self.action_graph, self.get_action_graph_typing())
 
     def bindings(self):
         """Get a list of bnd nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "bnd")
+        return self._ag_index.nodes_of_type("bnd")
 
     def modifications(self):
         """Get a list of bnd nodes in the action graph."""
-        return nodes_of_type(
-            self.action_graph, self.get_action_graph_typing(), "mod")
+        return self._ag_index.nodes_of_type("mod")
 
     @classmethod
     def from_hierarchy(cls, model_id, hierarchy, annotation=None,
@@ -766,7 +1088,9 @@ class KamiModel(object):
                     corpus_id=corpus_id, seed_genes=seed_genes,
                     definitions=definitions)
         model._hierarchy = hierarchy
+        model._init_nugget_registry()
         model._init_shortcuts()
+        model._init_indices()
         return model
 
     @classmethod
@@ -807,6 +1131,67 @@ class KamiModel(object):
         else:
             raise KamiHierarchyError("File '%s' does not exist!" % filename)
 
+    def save_snapshot(self, filename, compress=False):
+        """Save the model to a binary snapshot.
+
+        The snapshot contains the graph hierarchy (graphs, typings and
+        relations), the revision graph and the indices of the model.
+        It can be restored with `KamiModel.load_snapshot`.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the snapshot file
+        compress : bool, optional
+            If True, the snapshot is compressed
+        """
+        if self._backend != "networkx":
+            raise KamiHierarchyError(
+                "Snapshots are available only for networkx-based models")
+        state = {
+            "model_id": self._id,
+            "corpus_id": self._corpus_id,
+            "seed_genes": self._seed_genes,
+            "definitions": self._definitions,
+            "component_equivalence": self._component_equivalence,
+            "default_bnd_rate": self.default_bnd_rate,
+            "default_brk_rate": self.default_brk_rate,
+            "default_mod_rate": self.default_mod_rate,
+            "annotation": self.annotation,
+            "creation_time": self.creation_time,
+            "last_modified": self.last_modified,
+            "hierarchy": self._hierarchy,
+            "versioning": self._versioning,
+            "nugget_registry": self._nugget_registry,
+            "ag_index": self._ag_index
+        }
+        write_snapshot(filename, "model", state, compress=compress)
+
+    @classmethod
+    def load_snapshot(cls, filename):
+        """Load a KamiModel from a binary snapshot."""
+        if not os.path.isfile(filename):
+            raise KamiHierarchyError("File '%s' does not exist!" % filename)
+        state = read_snapshot(filename, "model")
+        model = cls(
+            state["model_id"], annotation=state["annotation"],
+            creation_time=state["creation_time"],
+            last_modified=state["last_modified"],
+            corpus_id=state["corpus_id"],
+            seed_genes=state["seed_genes"],
+            definitions=state["definitions"],
+            component_equivalence=state["component_equivalence"],
+            default_bnd_rate=state["default_bnd_rate"],
+            default_brk_rate=state["default_brk_rate"],
+            default_mod_rate=state["default_mod_rate"])
+        model._hierarchy = state["hierarchy"]
+        model._versioning = state["versioning"]
+        model._nugget_registry = state["nugget_registry"]
+        model._ag_index = state["ag_index"]
+        model._init_shortcuts()
+        model._init_typing_index()
+        return model
+
     def export_json(self, filename):
         """Export model to json."""
         with open(filename, 'w') as f:
@@ -859,8 +1244,7 @@ class KamiModel(object):
         hgnc_symbol = None
         if "hgnc_symbol" in attrs.keys():
             hgnc_symbol = list(attrs["hgnc_symbol"])[0]
-        nuggets = self._hierarchy.graphs_typed_by_node(
-            self._action_graph_id, gene_id)
+        nuggets = self._get_nuggets_typed_by(gene_id)
         return (uniprotid, hgnc_symbol, nuggets)
 
     def get_modification_data(self, mod_id):
@@ -872,8 +1256,7 @@ class KamiModel(object):
 
         enzyme_genes = identifier.ancestors_of_type(mod_id, "protoform")
         substrate_genes = identifier.descendants_of_type(mod_id, "protoform")
-        nuggets = self._hierarchy.graphs_typed_by_node(
-            self._action_graph_id, mod_id)
+        nuggets = self._get_nuggets_typed_by(mod_id)
         return (nuggets, enzyme_genes, substrate_genes)
 
     def get_binding_data(self, bnd_id):
@@ -884,8 +1267,7 @@ class KamiModel(object):
             self, self._action_graph_id)
 
         all_genes = identifier.ancestors_of_type(bnd_id, "protoform")
-        nuggets = self._hierarchy.graphs_typed_by_node(
-            self._action_graph_id, bnd_id)
+        nuggets = self._get_nuggets_typed_by(bnd_id)
         return (nuggets, all_genes)
 
     def get_uniprot(self, gene_id):
@@ -912,6 +1294,8 @@ class KamiModel(object):
         """Get nugget description string."""
         self._hierarchy.set_graph_attrs(
             nugget_id, {"desc": new_desc})
+        self._nugget_registry.set_nugget_desc(nugget_id, new_desc)
+        self._index_nugget_interaction(nugget_id)
 
     # def merge_ag_nodes(self, nodes):
     #     ag_typing = self.get_action_graph_typing()
@@ -926,51 +1310,35 @@ class KamiModel(object):
     #             "Cannot merge action graph nodes of different type!")
 
     def get_protein_pairwise_interactions(self):
-        """Get pairwise interactions between protoforms."""
-        interactions = {}
-
-        def _add_to_interactions(s, t, n, n_type, n_desc):
-            if s in interactions:
-                if t in interactions[s]:
-                    interactions[s][t].add((n, n_type, n_desc))
-                else:
-                    interactions[s][t] = {(n, n_type, n_desc)}
-            else:
-                interactions[s] = {
-                    t: {(n, n_type, n_desc)}
-                }
-
-        for n in self.nuggets():
-            ag_typing = self._hierarchy.get_typing(n, self._action_graph_id)
-            if self.is_mod_nugget(n):
-                enzyme = self.get_enzyme(n)
-                substrate = self.get_substrate(n)
-                if enzyme is not None and substrate is not None:
-                    _add_to_interactions(
-                        ag_typing[enzyme], ag_typing[substrate],
-                        n, "mod", self.get_nugget_desc(n))
-            elif self.is_bnd_nugget(n):
-                left = self.get_left_partner(n)
-                right = self.get_right_partner(n)
-                if left is not None and right is not None:
-                    _add_to_interactions(
-                        ag_typing[left], ag_typing[right],
-                        n, "bnd", self.get_nugget_desc(n))
-        return interactions
+        """Get pairwise interactions between protoforms.
+
+        Returns
+        -------
+        interactions : dict
+            Dictionary whose keys are source protoforms (enzymes or left
+            partners) and whose values are dictionaries whose keys are
+            target protoforms (substrates or right partners) and whose
+            values are sets of triples (nugget id, type, description)
+        """
+        return self._get_interaction_index().interactions()
 
     def interaction_edges(self):
-        interactions = self.get_protein_pairwise_interactions()
-        edges = []
-        for protoform, (partners, nuggets) in interactions.items():
-            for i, partner in enumerate(partners):
-                if (protoform, partner) not in edges and (partner, protoform) not in edges:
-                    edges.append({"source": protoform, "target": partner})
-        return edges
+        """Get edges between interacting protoforms."""
+        return [
+            {"source": s, "target": t}
+            for s, t in self._get_interaction_index().pairs()
+        ]
 
     def remove_nugget(self, nugget_id):
         """Remove nugget from a model."""
-        if nugget_id in self.nuggets():
+        if self._nugget_registry.is_nugget(nugget_id):
             self._hierarchy.remove_graph(nugget_id)
+            self._nugget_registry.remove_nugget(nugget_id)
+            self._shared_graphs.discard(nugget_id)
+            if self._typing_index is not None:
+                self._typing_index.remove_nugget(nugget_id)
+            if self._interaction_index is not None:
+                self._interaction_index.remove_nugget(nugget_id)
 
     def is_mod_nugget(self, nugget_id):
         t = self.get_nugget_type(nugget_id)
@@ -1035,37 +1403,17 @@ class KamiModel(object):
                 nugget_id))
 
     def get_gene_pairwise_interactions(self):
-        """Get pairwise interactions between genes."""
-        interactions = {}
-
-        def _add_to_interactions(s, t, n, n_type, n_desc):
-            if s in interactions:
-                if t in interactions[s]:
-                    interactions[s][t].add((n, n_type, n_desc))
-                else:
-                    interactions[s][t] = {(n, n_type, n_desc)}
-            else:
-                interactions[s] = {
-                    t: {(n, n_type, n_desc)}
-                }
-
-        for n in self.nuggets():
-            ag_typing = self._hierarchy.get_typing(n, self._action_graph_id)
-            if self.is_mod_nugget(n):
-                enzyme = self.get_enzyme(n)
-                substrate = self.get_substrate(n)
-                if enzyme is not None and substrate is not None:
-                    _add_to_interactions(
-                        ag_typing[enzyme], ag_typing[substrate],
-                        n, "mod", self.get_nugget_desc(n))
-            elif self.is_bnd_nugget(n):
-                left = self.get_left_partner(n)
-                right = self.get_right_partner(n)
-                if left is not None and right is not None:
-                    _add_to_interactions(
-                        ag_typing[left], ag_typing[right],
-                        n, "bnd", self.get_nugget_desc(n))
-        return interactions
+        """Get pairwise interactions between genes (protoforms).
+
+        Returns
+        -------
+        interactions : dict
+            Dictionary whose keys are source protoforms (enzymes or left
+            partners) and whose values are dictionaries whose keys are
+            target protoforms (substrates or right partners) and whose
+            values are sets of triples (nugget id, type, description)
+        """
+        return self._get_interaction_index().interactions()
 
     def get_mechanism_nuggets(self, mechanism_id):
         """."""
@@ -1078,114 +1426,80 @@ class KamiModel(object):
             result = self._hierarchy.execute(cypher)
             return result.single()["nuggets"]
         else:
-            raise KamiException(
-                "This method is not implemented for NetworkX-based hierarchies!")
-
-    def _clean_up_nuggets(self):
-        for nugget in self.nuggets():
+            return self._typing_index.nuggets_of_node(mechanism_id)
+
+    def _clean_up_nuggets(self, nuggets=None, processes=None):
+        """Clean-up the nuggets invalidated by instantiation.
+
+        The clean-up is performed in two phases: first, the nodes and
+        the edges to remove from every nugget (detached components and
+        residues with empty aa) are found independently for every nugget
+        (optionally, by a pool of worker processes), then the removals
+        of every nugget are applied by a single rewrite.
+
+        Parameters
+        ----------
+        nuggets : iterable, optional
+            Nuggets to clean-up (by default, all the nuggets)
+        processes : int, optional
+            Number of worker processes. By default (or if 1), the
+            nuggets are analysed in the current process
+        """
+        if nuggets is None:
+            nuggets = self.nuggets()
+        ag_typing = self.get_action_graph_typing()
+        tasks = []
+        for nugget in nuggets:
+            if "bnd_template" not in self._hierarchy.adjacent_relations(
+                    nugget):
+                continue
             nugget_typing = self._hierarchy.get_typing(
                 nugget, self._action_graph_id)
-            ag_typing = self.get_action_graph_typing()
             n_meta_typing = {
                 k: ag_typing[v] for k, v in nugget_typing.items()
             }
-            nugget_graph = self.get_nugget(nugget)
-
-            nugget_identifier = EntityIdentifier(
-                nugget_graph,
+            bnd_template = self._hierarchy.get_relation(
+                "bnd_template", nugget)
+            tasks.append((
+                nugget,
+                self.get_nugget(nugget),
                 n_meta_typing,
-                immediate=False)
-
-            def _empty_aa_found(node):
-                protoform = nugget_identifier.get_protoform_of(node)
-                residues = nugget_identifier.get_attached_residues(
-                    protoform)
-                deattach = False
-                for residue in residues:
-                    residue_attrs = nugget_graph.get_node(residue)
-                    if "aa" not in residue_attrs or\
-                            len(residue_attrs["aa"]) == 0:
-                        test = list(residue_attrs["test"])[0]
-                        if test is True:
-                            deattach = True
-                            break
-                return deattach
-
-            already_detached = []
-
-            def _detach_edge_to_bnds(bnd_action,
-                                     partner_to_ignore=None):
-                preds = nugget_graph.predecessors(bnd_action)
-
-                edges_to_remove = set()
-                for p in preds:
-                    if p != partner_to_ignore:
-                        deattach = _empty_aa_found(p)
-                        if not deattach:
-                            # Find other bonds
-                            other_bnds = [
-                                bnd
-                                for bnd in nugget_identifier.get_attached_bnd(
-                                    p)
-                                if bnd != bnd_action
-                            ]
-                            for bnd in other_bnds:
-                                if bnd not in already_detached:
-                                    already_detached.append(bnd)
-                                    _detach_edge_to_bnds(bnd, p)
-                        else:
-                            edges_to_remove.add((p, bnd_action))
-                            # already_detached.append(bnd_action)
-                for s, t in edges_to_remove:
-                    nugget_graph.remove_edge(s, t)
-
-            if "mod_template" in self._hierarchy.adjacent_relations(nugget):
-                pass
-            elif "bnd_template" in self._hierarchy.adjacent_relations(nugget):
-                # Remove edge to a mod/bnd from/to the actor that contains
-                # a residue with the empty aa
-                bnd_template = self._hierarchy.get_relation(
-                    "bnd_template", nugget)
-                bnd_actions = bnd_template["bnd"]
-                # Find a BND node with type == do
-                do_bnd = None
-                for bnd_action in bnd_actions:
-                    attrs = nugget_graph.get_node(bnd_action)
-                    if list(attrs["type"])[0] == "do":
-                        do_bnd = bnd_action
-                        break
-                # Deattach preds of do_bnd if residue aa is empty
-                _detach_edge_to_bnds(do_bnd)
-                # Remove all the graph nodes disconected from
-                # the action node
-                nodes_to_remove = nugget_graph.nodes_disconnected_from(
-                    do_bnd)
-
-                for n in nodes_to_remove:
-                    pattern = NXGraph()
-                    pattern.add_node(n)
-                    rule = Rule.from_transform(pattern)
-                    rule.inject_remove_node(n)
-                    self.rewrite(
-                        nugget, rule,
-                        message="Nugget clean-up: removed detached components",
-                        update_type="auto")
-
-                # Remove empty residue conditions
-                for protoform in nugget_identifier.get_protoforms():
-                    residues = nugget_identifier.get_attached_residues(protoform)
-                    for res in residues:
-                        residues_attrs = nugget_graph.get_node(res)
-                        if "aa" not in residues_attrs or\
-                                len(residues_attrs["aa"]) == 0:
-                            pattern = NXGraph()
-                            pattern.add_node(res)
-                            rule = Rule.from_transform(pattern)
-                            rule.inject_remove_node(res)
-                            self.rewrite(
-                                nugget, rule,
-                                message="Nugget clean-up: removed residues with empty aa",
-                                update_type="auto")
+                bnd_template["bnd"]
+            ))
+
+        if processes is None or processes <= 1 or len(tasks) < 2:
+            # Nugget graphs (possibly shared with the corpus) are only
+            # modified by the clean-up rewrites
+            removals = [
+                _find_nugget_removals(task, copy=True) for task in tasks
+            ]
+        else:
+            # Worker processes receive copies of the nugget graphs
+            pool = multiprocessing.Pool(min(processes, len(tasks)))
+            try:
+                removals = pool.map(_find_nugget_removals, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        for nugget, nodes_to_remove, edges_to_remove in removals:
+            if len(nodes_to_remove) + len(edges_to_remove) == 0:
+                continue
+            pattern = NXGraph()
+            pattern.add_nodes_from(
+                nodes_to_remove.union(*edges_to_remove))
+            pattern.add_edges_from(edges_to_remove)
+            rule = Rule.from_transform(pattern)
+            for s, t in edges_to_remove:
+                rule.inject_remove_edge(s, t)
+            for n in nodes_to_remove:
+                rule.inject_remove_node(n)
+            self.rewrite(
+                nugget, rule,
+                message=(
+                    "Nugget clean-up: removed detached components "
+                    "and residues with empty aa"),
+                update_type="auto")
 
     def _add_component_equivalence(self, rule, lhs_instance, rhs_instance):
         """Add instantiation rule."""
@@ -0,0 +1,271 @@
+"""Recording of revisions of KAMI knowledge bases.
+
+`RevisionPolicy`
+`RevisionRecorder`
+"""
+from contextlib import contextmanager
+
+import networkx as nx
+
+from regraph.exceptions import RewritingError
+
+from kami.exceptions import KamiHierarchyError
+
+
+class RevisionPolicy(object):
+    """Policy of recording revisions of a knowledge base.
+
+    Attributes
+    ----------
+    coalesce : bool
+        If True, all the rewrites performed by a logical operation (for
+        example, addition of a nugget together with its bookkeeping and
+        semantic updates) are recorded as a single composed revision
+    checkpoint_interval : int
+        Number of revisions after which the current revision is marked
+        as a checkpoint. If None, no checkpoints are made
+    retention : int
+        Minimal number of the most recent revisions whose deltas are
+        retained. On every checkpoint, the revisions preceding the newest
+        checkpoint outside of the retention window are pruned (the
+        checkpoint becomes the initial revision of the history). If
+        None, all the revisions are retained
+    """
+
+    def __init__(self, coalesce=True, checkpoint_interval=None,
+                 retention=None):
+        """Initialize a revision policy."""
+        if retention is not None and checkpoint_interval is None:
+            raise KamiHierarchyError(
+                "Pruning of revisions requires a checkpoint interval")
+        self.coalesce = coalesce
+        self.checkpoint_interval = checkpoint_interval
+        self.retention = retention
+
+
+class _VersioningAdapter(object):
+    """Adapter of the internals of `regraph.audit.VersionedHierarchy`.
+
+    All the accesses to the private API of the versioned hierarchy
+    (composition, inversion and application of deltas, heads of the
+    branches and the revision graph) made by the recorder are
+    isolated in this class.
+    """
+
+    def __init__(self, versioning):
+        """Initialize an adapter of the versioned hierarchy."""
+        self._versioning = versioning
+
+    def compose(self, deltas):
+        """Compose the sequence of deltas into a single delta."""
+        delta = deltas[0]
+        for next_delta in deltas[1:]:
+            delta = self._versioning._compose_deltas(delta, next_delta)
+        return delta
+
+    def revert(self, deltas):
+        """Revert the rewrites of the sequence of deltas."""
+        for delta in reversed(deltas):
+            self._versioning._apply_delta(
+                self._versioning._invert_delta(delta))
+
+    def head(self):
+        """Get the head of the current branch."""
+        return self._versioning._heads[self._versioning._current_branch]
+
+    def heads(self):
+        """Get the heads of all the branches."""
+        return list(self._versioning._heads.values())
+
+    def revision_graph(self):
+        """Get the graph of revisions."""
+        return self._versioning._revision_graph
+
+
+class RevisionRecorder(object):
+    """Recorder of rewrites of a versioned hierarchy.
+
+    The recorder performs the rewrites of the hierarchy wrapped by a
+    `regraph.audit.VersionedHierarchy` object and commits them according
+    to the revision policy: inside of an operation (see
+    `RevisionRecorder.operation`) the deltas of the rewrites are
+    accumulated, and are composed and committed as a single revision
+    when the operation is finished.
+
+    Attributes
+    ----------
+    policy : RevisionPolicy
+    _depth : int
+        Depth of the nested operations in progress
+    _pending : list
+        Deltas of the rewrites of the operation in progress
+    _transactions : int
+        Depth of the nested transactions in progress
+    _commits_since_checkpoint : int
+    """
+
+    def __init__(self, policy=None):
+        """Initialize a revision recorder."""
+        if policy is None:
+            policy = RevisionPolicy()
+        self.policy = policy
+        self._depth = 0
+        self._pending = []
+        self._transactions = 0
+        self._commits_since_checkpoint = 0
+
+    def in_operation(self):
+        """Test if an operation is in progress."""
+        return self._depth > 0
+
+    def rewrite(self, versioning, graph_id, rule, instance=None,
+                rhs_typing=None, strict=False,
+                message="", update_type="manual"):
+        """Rewrite the versioned hierarchy and record the revision.
+
+        Inside of an operation, the rule hierarchy of the rewrite is
+        applied without committing it. In the strict mode, the rewrite
+        is rejected if it requires propagation of additions or merges
+        to the graphs typing the rewritten graph.
+
+        Returns
+        -------
+        rhs_instance : dict
+            Instance of the right-hand side of the rule in the graph
+        """
+        coalesce = self.policy.coalesce or self._transactions > 0
+        if not self.in_operation() or not coalesce:
+            rhs_instance, _ = versioning.rewrite(
+                graph_id, rule=rule, instance=instance,
+                rhs_typing=rhs_typing, strict=strict,
+                message=message, update_type=update_type)
+            self._after_commit(versioning)
+            return rhs_instance
+
+        hierarchy = versioning.hierarchy
+        rule_hierarchy, lhs_instances = hierarchy.get_rule_hierarchy(
+            graph_id, rule, instance, rhs_typing=rhs_typing)
+        lhs_instances = hierarchy.refine_rule_hierarchy(
+            rule_hierarchy, lhs_instances)
+        if strict:
+            for g, propagated_rule in rule_hierarchy["rules"].items():
+                if g != graph_id and propagated_rule.is_relaxing():
+                    raise RewritingError(
+                        "Rewriting of '{}' requires propagation ".format(
+                            graph_id) +
+                        "of additions or merges to '{}' ".format(g) +
+                        "(not allowed in the strict mode)")
+        rhs_instances = hierarchy.apply_rule_hierarchy(
+            rule_hierarchy, lhs_instances)
+        self._pending.append({
+            "rule_hierarchy": rule_hierarchy,
+            "lhs_instances": lhs_instances,
+            "rhs_instances": rhs_instances
+        })
+        return rhs_instances[graph_id]
+
+    @contextmanager
+    def operation(self, versioning, message, update_type="manual"):
+        """Context of a logical operation recorded as a single revision.
+
+        Nested operations are recorded as a part of the outermost one.
+        If an error occurs, the rewrites performed before the error are
+        committed (so that the revision history remains consistent with
+        the hierarchy) and the error is re-raised.
+        """
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._commit_pending(versioning, message, update_type)
+
+    @contextmanager
+    def transaction(self, versioning, message, update_type="manual"):
+        """Context of an atomic logical operation.
+
+        The rewrites performed in the context are always coalesced.
+        If an error occurs, they are reverted (and no revision is
+        recorded) and the error is re-raised.
+        """
+        outer_pending = self._pending
+        self._pending = []
+        self._depth += 1
+        self._transactions += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            self._transactions -= 1
+            self._revert_pending(versioning)
+            self._pending = outer_pending
+            raise
+        self._depth -= 1
+        self._transactions -= 1
+        self._pending = outer_pending + self._pending
+        if self._depth == 0:
+            self._commit_pending(versioning, message, update_type)
+
+    def _commit_pending(self, versioning, message, update_type):
+        """Commit the composed deltas of the finished operation."""
+        if len(self._pending) > 0:
+            deltas = self._pending
+            self._pending = []
+            versioning.commit(
+                _VersioningAdapter(versioning).compose(deltas),
+                message=message, update_type=update_type)
+            self._after_commit(versioning)
+
+    def _revert_pending(self, versioning):
+        """Revert the rewrites of the pending deltas."""
+        if len(self._pending) > 0:
+            deltas = self._pending
+            self._pending = []
+            _VersioningAdapter(versioning).revert(deltas)
+
+    def _after_commit(self, versioning):
+        """Make a checkpoint if the checkpoint interval is reached."""
+        if self.policy.checkpoint_interval is None:
+            return
+        self._commits_since_checkpoint += 1
+        if self._commits_since_checkpoint >= self.policy.checkpoint_interval:
+            self.checkpoint(versioning)
+
+    def checkpoint(self, versioning):
+        """Mark the current revision as a checkpoint and prune revisions."""
+        adapter = _VersioningAdapter(versioning)
+        adapter.revision_graph().nodes[adapter.head()]["checkpoint"] = True
+        self._commits_since_checkpoint = 0
+        if self.policy.retention is not None:
+            self.prune(versioning, self.policy.retention)
+
+    @staticmethod
+    def prune(versioning, retention):
+        """Prune revisions preceding the retention window.
+
+        The newest checkpoint preceding the current revision by at least
+        `retention` revisions becomes the initial revision of the
+        history, if all the heads of the branches descend from it.
+
+        Returns
+        -------
+        pruned : set
+            Set of the pruned revisions
+        """
+        adapter = _VersioningAdapter(versioning)
+        revision_graph = adapter.revision_graph()
+        head = adapter.head()
+        distances = nx.single_source_shortest_path_length(
+            revision_graph.reverse(copy=False), head)
+        candidates = sorted(
+            (d, c) for c, d in distances.items()
+            if d >= retention and
+            revision_graph.nodes[c].get("checkpoint", False))
+        for _, checkpoint in candidates:
+            if all(nx.has_path(revision_graph, checkpoint, h)
+                   for h in adapter.heads()):
+                pruned = nx.ancestors(revision_graph, checkpoint)
+                revision_graph.remove_nodes_from(pruned)
+                return pruned
+        return set()
@@ -0,0 +1,438 @@
+"""Transactional updates of the action graphs of KAMI knowledge bases.
+
+`Transaction`
+`hierarchy_elements`
+`discard_added_elements`
+"""
+from regraph import NXGraph, Rule
+from regraph.rules import compose_rules
+from regraph.utils import keys_by_value
+
+from kami.exceptions import KamiHierarchyError
+from kami.utils.id_generators import generate_new_element_id
+
+
+def hierarchy_elements(hierarchy):
+    """Get the sets of graphs, typings and relations of the hierarchy."""
+    return (
+        set(hierarchy.graphs()),
+        set(hierarchy.typings()),
+        set(hierarchy.relations())
+    )
+
+
+def discard_added_elements(hierarchy, elements, keep=None):
+    """Remove the graphs, typings and relations added to the hierarchy.
+
+    Used to restore the hierarchy after a failed transaction (the
+    additions of graphs, typings and relations are not rewrites
+    and are not reverted with them).
+
+    Parameters
+    ----------
+    hierarchy : regraph.Hierarchy
+    elements : tuple
+        Graphs, typings and relations of the hierarchy before the
+        additions (see `hierarchy_elements`)
+    keep : iterable, optional
+        Added graphs to keep together with their typings and relations
+
+    Returns
+    -------
+    removed_graphs : set
+        Set of the removed graphs
+    """
+    graphs, typings, relations = elements
+    keep = set(keep) if keep is not None else set()
+    for left, right in hierarchy.relations():
+        if (left, right) not in relations and\
+                left not in keep and right not in keep and\
+                (left, right) in hierarchy.relations():
+            hierarchy.remove_relation(left, right)
+    for s, t in hierarchy.typings():
+        if (s, t) not in typings and s not in keep and t not in keep:
+            hierarchy.remove_typing(s, t)
+    removed_graphs = set()
+    for graph_id in hierarchy.graphs():
+        if graph_id not in graphs and graph_id not in keep:
+            hierarchy.remove_graph(graph_id)
+            removed_graphs.add(graph_id)
+    return removed_graphs
+
+
+class Transaction(object):
+    """Collection of edits of an action graph applied as a single rewrite.
+
+    A transaction accumulates primitive edits (additions, removals and
+    merges of nodes, additions and removals of edges and attributes) and
+    arbitrary rules into a single rule, which is applied (and propagated
+    in the hierarchy) once, when the transaction is committed. Edits
+    refer to the nodes of the action graph by their ids, nodes added or
+    merged by the transaction are referred to by the ids returned by
+    the respective methods. Note that the action graph is not modified
+    until the transaction is committed: the edits are applied to the
+    action graph as it is at the beginning of the transaction.
+
+    Attributes
+    ----------
+    rule : regraph.Rule
+        Rule composed from the edits of the transaction
+    instance : dict
+        Instance of the left-hand side of the rule in the graph
+    _graph_nodes : set
+        Nodes of the graph at the beginning of the transaction
+    _lhs_nodes : dict
+        Dictionary whose keys are the nodes of the graph matched by
+        the rule and whose values are the respective nodes of
+        the left-hand side
+    _p_nodes : dict
+        Dictionary whose keys are the nodes of the left-hand side and
+        whose values are lists of the respective nodes of the preserved
+        part of the rule
+    _rhs_nodes : dict
+        Dictionary whose keys are node ids used by the edits of the
+        transaction and whose values are the respective nodes of the
+        right-hand side (None for the nodes removed by the transaction)
+    _rhs_typing : dict
+        Typing of the nodes added by the transaction by the meta-model
+    _node_ids : dict
+        Dictionary whose keys are node ids used by the edits of the
+        transaction and whose values are the ids of the respective
+        nodes of the graph after the commit (None before the commit)
+    """
+
+    def __init__(self, graph, meta_model_id="meta_model"):
+        """Initialize an empty transaction on the graph."""
+        self._graph = graph
+        self._meta_model_id = meta_model_id
+        self._graph_nodes = set(graph.nodes())
+        self.rule = Rule.from_transform(NXGraph())
+        self.instance = dict()
+        self._lhs_nodes = dict()
+        self._p_nodes = dict()
+        self._rhs_nodes = dict()
+        self._rhs_typing = dict()
+        self._node_ids = None
+
+    def _check_open(self):
+        if self._node_ids is not None:
+            raise KamiHierarchyError("Transaction is already committed")
+
+    def _fresh_id(self, base_name):
+        """Generate an id unused in the graph and in the rule."""
+        new_id = base_name
+        i = 1
+        while new_id in self._graph_nodes or new_id in self._rhs_nodes:
+            new_id = "{}_{}".format(base_name, i)
+            i += 1
+        return new_id
+
+    def _pattern_node(self, node_id):
+        """Get the rhs node corresponding to the node id.
+
+        Nodes of the graph are added to the pattern of the rule
+        if necessary.
+        """
+        if node_id in self._rhs_nodes:
+            rhs_node = self._rhs_nodes[node_id]
+            if rhs_node is None:
+                raise KamiHierarchyError(
+                    "Node '{}' is removed by the transaction".format(
+                        node_id))
+            return rhs_node
+        if node_id not in self._graph_nodes:
+            raise KamiHierarchyError(
+                "Node '{}' does not exist in the graph".format(node_id))
+        # Nodes of the lhs and p of a composed rule may have
+        # arbitrary ids
+        lhs_node = generate_new_element_id(self.instance, node_id)
+        p_node = generate_new_element_id(self.rule.p_lhs, node_id)
+        self.rule.lhs.add_node(lhs_node)
+        self.rule.p.add_node(p_node)
+        self.rule.rhs.add_node(node_id)
+        self.rule.p_lhs[p_node] = lhs_node
+        self.rule.p_rhs[p_node] = node_id
+        self.instance[lhs_node] = node_id
+        self._lhs_nodes[node_id] = lhs_node
+        self._p_nodes[lhs_node] = [p_node]
+        self._rhs_nodes[node_id] = node_id
+        return node_id
+
+    def _pattern_edge(self, s, t):
+        """Add the edge of the graph to the pattern of the rule."""
+        lhs_s = self._lhs_nodes[s]
+        lhs_t = self._lhs_nodes[t]
+        if self.rule.lhs.exists_edge(lhs_s, lhs_t):
+            return
+        self.rule.lhs.add_edge(lhs_s, lhs_t)
+        for p_s in self._p_nodes[lhs_s]:
+            for p_t in self._p_nodes[lhs_t]:
+                self.rule.p.add_edge(p_s, p_t)
+                rhs_s = self.rule.p_rhs[p_s]
+                rhs_t = self.rule.p_rhs[p_t]
+                if not self.rule.rhs.exists_edge(rhs_s, rhs_t):
+                    self.rule.rhs.add_edge(rhs_s, rhs_t)
+
+    def _is_graph_edge(self, s, t):
+        return (
+            s in self._lhs_nodes and t in self._lhs_nodes and
+            self._graph.exists_edge(s, t)
+        )
+
+    def add_node(self, node_id, attrs=None, meta_type=None):
+        """Add a node.
+
+        Returns
+        -------
+        node_id : hashable
+            Id of the new node in the transaction (a new id is generated
+            if the specified id is already used)
+        """
+        self._check_open()
+        node_id = self._fresh_id(node_id)
+        self.rule.rhs.add_node(node_id, attrs)
+        self._rhs_nodes[node_id] = node_id
+        if meta_type is not None:
+            self._rhs_typing[node_id] = meta_type
+        return node_id
+
+    def remove_node(self, node_id):
+        """Remove a node (together with the nodes merged with it)."""
+        self._check_open()
+        rhs_node = self._pattern_node(node_id)
+        for p_node in keys_by_value(self.rule.p_rhs, rhs_node):
+            lhs_node = self.rule.p_lhs[p_node]
+            self.rule.p.remove_node(p_node)
+            del self.rule.p_lhs[p_node]
+            del self.rule.p_rhs[p_node]
+            self._p_nodes[lhs_node].remove(p_node)
+        self.rule.rhs.remove_node(rhs_node)
+        for k, v in self._rhs_nodes.items():
+            if v == rhs_node:
+                self._rhs_nodes[k] = None
+        if rhs_node in self._rhs_typing:
+            del self._rhs_typing[rhs_node]
+
+    def merge_nodes(self, node_ids, node_id=None):
+        """Merge nodes.
+
+        Returns
+        -------
+        node_id : hashable
+            Id of the merged node in the transaction
+        """
+        self._check_open()
+        rhs_nodes = []
+        for n in node_ids:
+            rhs_node = self._pattern_node(n)
+            if rhs_node not in rhs_nodes:
+                rhs_nodes.append(rhs_node)
+        if len(rhs_nodes) < 2:
+            return rhs_nodes[0]
+        if node_id is None:
+            node_id = "_".join(str(n) for n in rhs_nodes)
+        node_id = self._fresh_id(node_id)
+        new_node = self.rule.rhs.merge_nodes(rhs_nodes, node_id=node_id)
+        for p_node, rhs_node in self.rule.p_rhs.items():
+            if rhs_node in rhs_nodes:
+                self.rule.p_rhs[p_node] = new_node
+        for k, v in self._rhs_nodes.items():
+            if v in rhs_nodes:
+                self._rhs_nodes[k] = new_node
+        self._rhs_nodes[new_node] = new_node
+        for rhs_node in rhs_nodes:
+            if rhs_node in self._rhs_typing:
+                self._rhs_typing[new_node] = self._rhs_typing.pop(rhs_node)
+        return new_node
+
+    def add_edge(self, s, t, attrs=None):
+        """Add an edge (or its attributes if the edge exists)."""
+        self._check_open()
+        rhs_s = self._pattern_node(s)
+        rhs_t = self._pattern_node(t)
+        if self._is_graph_edge(s, t):
+            self._pattern_edge(s, t)
+        if self.rule.rhs.exists_edge(rhs_s, rhs_t):
+            if attrs is not None:
+                self.rule.rhs.add_edge_attrs(rhs_s, rhs_t, attrs)
+        else:
+            self.rule.rhs.add_edge(rhs_s, rhs_t, attrs)
+
+    def remove_edge(self, s, t):
+        """Remove an edge."""
+        self._check_open()
+        rhs_s = self._pattern_node(s)
+        rhs_t = self._pattern_node(t)
+        if self._is_graph_edge(s, t):
+            self._pattern_edge(s, t)
+            for p_s in self._p_nodes[self._lhs_nodes[s]]:
+                for p_t in self._p_nodes[self._lhs_nodes[t]]:
+                    if self.rule.p.exists_edge(p_s, p_t):
+                        self.rule.p.remove_edge(p_s, p_t)
+        if not self.rule.rhs.exists_edge(rhs_s, rhs_t):
+            raise KamiHierarchyError(
+                "Edge '{}'->'{}' does not exist".format(s, t))
+        self.rule.rhs.remove_edge(rhs_s, rhs_t)
+
+    def add_node_attrs(self, node_id, attrs):
+        """Add attributes to a node."""
+        self._check_open()
+        self.rule.rhs.add_node_attrs(self._pattern_node(node_id), attrs)
+
+    def remove_node_attrs(self, node_id, attrs):
+        """Remove attributes of a node."""
+        self._check_open()
+        rhs_node = self._pattern_node(node_id)
+        if node_id in self._lhs_nodes:
+            lhs_node = self._lhs_nodes[node_id]
+            self.rule.lhs.add_node_attrs(lhs_node, attrs)
+            for p_node in self._p_nodes[lhs_node]:
+                self.rule.p.remove_node_attrs(p_node, attrs)
+        self.rule.rhs.remove_node_attrs(rhs_node, attrs)
+
+    def add_edge_attrs(self, s, t, attrs):
+        """Add attributes to an edge."""
+        self._check_open()
+        rhs_s = self._pattern_node(s)
+        rhs_t = self._pattern_node(t)
+        if self._is_graph_edge(s, t):
+            self._pattern_edge(s, t)
+        if not self.rule.rhs.exists_edge(rhs_s, rhs_t):
+            raise KamiHierarchyError(
+                "Edge '{}'->'{}' does not exist".format(s, t))
+        self.rule.rhs.add_edge_attrs(rhs_s, rhs_t, attrs)
+
+    def rewrite(self, rule, instance=None, rhs_typing=None):
+        """Compose the rule with the edits of the transaction.
+
+        Parameters
+        ----------
+        rule : regraph.Rule
+        instance : dict, optional
+            Instance of the left-hand side of the rule given by the
+            node ids used in the transaction (by default, the identity)
+        rhs_typing : dict, optional
+            Typing of the right-hand side of the rule by the meta-model
+
+        Returns
+        -------
+        rhs_instance : dict
+            Dictionary whose keys are the nodes of the right-hand side
+            of the rule and whose values are the respective node ids
+            in the transaction
+        """
+        self._check_open()
+        if instance is None:
+            instance = {n: n for n in rule.lhs.nodes()}
+        if rhs_typing is None:
+            rhs_typing = dict()
+        rhs_typing = rhs_typing.get(self._meta_model_id, rhs_typing)
+
+        lhs_instance = {
+            n: self._pattern_node(v) for n, v in instance.items()
+        }
+
+        # Nodes preserved without being cloned or merged keep their ids
+        rhs_instance = dict()
+        for rhs_node in rule.rhs.nodes():
+            p_nodes = keys_by_value(rule.p_rhs, rhs_node)
+            if len(p_nodes) == 1:
+                lhs_node = rule.p_lhs[p_nodes[0]]
+                if len(keys_by_value(rule.p_lhs, lhs_node)) == 1:
+                    rhs_instance[rhs_node] = lhs_instance[lhs_node]
+                    continue
+            rhs_instance[rhs_node] = None
+        used_ids = set(v for v in rhs_instance.values() if v is not None)
+        for rhs_node, v in rhs_instance.items():
+            if v is None:
+                new_id = self._fresh_id(rhs_node)
+                i = 1
+                while new_id in used_ids:
+                    new_id = self._fresh_id("{}_{}".format(rhs_node, i))
+                    i += 1
+                rhs_instance[rhs_node] = new_id
+                used_ids.add(new_id)
+
+        composed_rule, composed_lhs_instance, composed_rhs_instance =\
+            compose_rules(
+                self.rule, self.instance,
+                {n: n for n in self.rule.rhs.nodes()},
+                rule, lhs_instance, rhs_instance)
+
+        # Name the nodes of the composed rhs by their ids in the transaction
+        rhs = NXGraph.copy(composed_rule.rhs)
+        rhs.relabel_nodes(composed_rhs_instance)
+        self.rule = Rule(
+            composed_rule.p, composed_rule.lhs, rhs,
+            composed_rule.p_lhs,
+            {
+                p: composed_rhs_instance[r]
+                for p, r in composed_rule.p_rhs.items()
+            })
+        self.instance = composed_lhs_instance
+        self._lhs_nodes = {v: k for k, v in self.instance.items()}
+        self._p_nodes = {n: [] for n in self.rule.lhs.nodes()}
+        for p_node, lhs_node in self.rule.p_lhs.items():
+            self._p_nodes[lhs_node].append(p_node)
+
+        # Update the ids of the nodes matched by the rule
+        matched = dict()
+        for lhs_node, rhs_node in lhs_instance.items():
+            matched[rhs_node] = None
+            for p_node in keys_by_value(rule.p_lhs, lhs_node):
+                matched[rhs_node] = rhs_instance[rule.p_rhs[p_node]]
+                break
+        for k, v in self._rhs_nodes.items():
+            if v in matched:
+                self._rhs_nodes[k] = matched[v]
+        for v in rhs_instance.values():
+            self._rhs_nodes[v] = v
+
+        new_typing = dict()
+        for rhs_node, meta_type in self._rhs_typing.items():
+            if rhs_node in matched:
+                rhs_node = matched[rhs_node]
+            if rhs_node is not None:
+                new_typing[rhs_node] = meta_type
+        for rhs_node, meta_type in rhs_typing.items():
+            new_typing[rhs_instance[rhs_node]] = meta_type
+        self._rhs_typing = new_typing
+
+        return rhs_instance
+
+    def is_empty(self):
+        """Test if the transaction does not change the graph."""
+        return self.rule.is_identity()
+
+    def commit(self, kb, graph_id, message="", update_type="manual"):
+        """Apply the transaction to the graph of the knowledge base.
+
+        Returns
+        -------
+        node_ids : dict
+            Dictionary whose keys are node ids used in the transaction
+            and whose values are the ids of the respective nodes of the
+            graph (None for the removed nodes)
+        """
+        self._check_open()
+        if self.is_empty():
+            rhs_g = {n: n for n in self.rule.rhs.nodes()}
+        else:
+            rhs_typing = {self._meta_model_id: dict(self._rhs_typing)}
+            rhs_g = kb.rewrite(
+                graph_id, self.rule, self.instance,
+                rhs_typing=rhs_typing, message=message,
+                update_type=update_type)
+        self._node_ids = {
+            k: rhs_g[v] if v is not None else None
+            for k, v in self._rhs_nodes.items()
+        }
+        return self._node_ids
+
+    def get_node_id(self, node_id):
+        """Get the id of the node of the graph after the commit."""
+        if self._node_ids is None:
+            raise KamiHierarchyError("Transaction is not committed")
+        if node_id in self._node_ids:
+            return self._node_ids[node_id]
+        return node_id
@@ -7,6 +7,7 @@ import warnings
 from regraph.utils import keys_by_value
 
 from kami.aggregation.identifiers import EntityIdentifier
+from kami.data_structures.indices import TraversalMemo
 from kami.data_structures.entities import (State, Residue, Region, Site,
                                            Protein, RegionActor, SiteActor)
 from kami.utils.id_generators import generate_new_element_id
@@ -781,7 +782,7 @@ class KappaGenerator(ABC):
                 {
                     k: self.kb.get_action_graph_typing()[v]
                     for k, v in ag_typing.items()},
-                immediate=False)
+                immediate=False, memo=TraversalMemo())
             nugget_desc = ""
             if (self.kb.get_nugget_desc(n)):
                 nugget_desc = self.kb.get_nugget_desc(
@@ -1564,7 +1565,8 @@ class ModelKappaGenerator(KappaGenerator):
         self.identifier = EntityIdentifier(
             model.action_graph,
             model.get_action_graph_typing(),
-            immediate=False)
+            immediate=False, index=model._ag_index,
+            memo=model._ag_index.traversal_memo)
 
 
 class CorpusKappaGenerator(KappaGenerator):
@@ -1787,7 +1789,8 @@ class CorpusKappaGenerator(KappaGenerator):
         self.identifier = EntityIdentifier(
             corpus.action_graph,
             corpus.get_action_graph_typing(),
-            immediate=False)
+            immediate=False, index=corpus._ag_index,
+            memo=corpus._ag_index.traversal_memo)
 
         # Generate instantiation rules from definitions
         self.instantiation_rules = dict()
@@ -100,6 +100,7 @@
 
 from lxml import etree
 import anatomizer.new_anatomizer as anatomizer
+from anatomizer import prefetch_gene_data, discard_prefetched
 from kami.entities import *
 from kami.interactions import *
 
@@ -893,10 +894,45 @@ class IntActImporter(object):
             interactions += self.get_binding(bnd)
         return interactions
 
-    def import_model(self, file_list):
-        """Collect the data from IntAct and generate KAMI interactions."""
+    def import_model(self, file_list, prefetch=False, corpus=None,
+                     **kwargs):
+        """Collect the data from IntAct and generate KAMI interactions.
+
+        If `corpus` is specified, the generated interactions are added
+        to it (`kwargs` are passed to `KamiCorpus.add_interactions`).
+        If `prefetch` is True, the meta-data and the domains of all the
+        protoforms of the generated interactions are fetched concurrently
+        to be consumed by the anatomization of the protoforms added to
+        the corpus, the data that was not consumed is discarded.
+        """
         self.read_interactions(file_list)
         self.prefilter_interactions()
         interactions = self.generate_interactions()
+        uniprot_acs = set()
+        if prefetch is True:
+            uniprot_acs = _collect_uniprot_acs(
+                [i.to_json() for i in interactions])
+        try:
+            if len(uniprot_acs) > 0:
+                prefetch_gene_data(uniprot_acs)
+            if corpus is not None:
+                corpus.add_interactions(interactions, **kwargs)
+        finally:
+            discard_prefetched(uniprot_acs)
         return interactions
 
+
+def _collect_uniprot_acs(json_data, uniprot_acs=None):
+    """Collect UniProt ACs of the protoforms in JSON data."""
+    if uniprot_acs is None:
+        uniprot_acs = set()
+    if isinstance(json_data, dict):
+        if "uniprotid" in json_data:
+            uniprot_acs.add(json_data["uniprotid"])
+        for v in json_data.values():
+            _collect_uniprot_acs(v, uniprot_acs)
+    elif isinstance(json_data, list):
+        for v in json_data:
+            _collect_uniprot_acs(v, uniprot_acs)
+    return uniprot_acs
+
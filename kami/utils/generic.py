@@ -3,6 +3,7 @@ import collections
 import copy
 import time
 
+from regraph import NXGraph
 from regraph.audit import VersionedHierarchy
 from regraph.utils import attrs_from_json
 from kami.exceptions import KamiException
@@ -102,52 +103,95 @@ def _init_from_data(kb, data, instantiated=False):
         start = time.time()
         if "nuggets" in data.keys():
             for nugget_data in data["nuggets"]:
-                nugget_graph_id = kb._id + "_" + nugget_data["id"]
-                if "graph" not in nugget_data.keys() or\
-                   "typing" not in nugget_data.keys() or\
-                   "template_rel" not in nugget_data.keys():
-                    raise KamiException(
-                        "Error loading knowledge base from json: "
-                        "nugget data shoud contain typing by"
-                        " action graph and template relation!")
-
-                attrs = {}
-                if "attrs" in nugget_data.keys():
-                    attrs = attrs_from_json(nugget_data["attrs"])
-                attrs["type"] = "nugget"
-                attrs["nugget_id"] = nugget_data["id"]
-                if not instantiated:
-                    attrs["corpus_id"] = kb._id
-                else:
-                    attrs["model_id"] = kb._id
-                    attrs["corpus_id"] = kb._corpus_id
-
-                kb._hierarchy.add_graph_from_json(
-                    nugget_graph_id,
-                    nugget_data["graph"],
-                    attrs)
-
-                kb._hierarchy.add_typing(
-                    nugget_graph_id,
-                    kb._action_graph_id, nugget_data["typing"])
-
-                kb._hierarchy.add_relation(
-                    nugget_graph_id,
-                    nugget_data["template_rel"][0],
-                    nugget_data["template_rel"][1])
-
-                if not instantiated:
-                    if "semantic_rels" in nugget_data.keys():
-                        for s_nugget_id, rel in nugget_data[
-                                "semantic_rels"].items():
-                            kb._hierarchy.add_relation(
-                                nugget_graph_id, s_nugget_id, rel)
+                _add_nugget_from_json(kb, nugget_data, instantiated)
         # print("Finished after: ", time.time() - start)
     else:
         if kb._action_graph_id not in kb._hierarchy.graphs():
             kb.create_empty_action_graph()
 
 
+def _check_nugget_json(nugget_data):
+    """Check that json data of the nugget contains required fields."""
+    if "graph" not in nugget_data.keys() or\
+       "typing" not in nugget_data.keys() or\
+       "template_rel" not in nugget_data.keys():
+        raise KamiException(
+            "Error loading knowledge base from json: "
+            "nugget data shoud contain typing by"
+            " action graph and template relation!")
+
+
+def _nugget_attrs_from_json(kb, nugget_data, instantiated=False):
+    """Get attributes of the nugget graph from its json data."""
+    attrs = {}
+    if "attrs" in nugget_data.keys():
+        attrs = attrs_from_json(nugget_data["attrs"])
+    attrs["type"] = "nugget"
+    attrs["nugget_id"] = nugget_data["id"]
+    if not instantiated:
+        attrs["corpus_id"] = kb._id
+    else:
+        attrs["model_id"] = kb._id
+        attrs["corpus_id"] = kb._corpus_id
+    return attrs
+
+
+def _add_nugget_graph_from_json(kb, nugget_data, instantiated=False):
+    """Add the graph of the nugget and its relations from json data."""
+    _check_nugget_json(nugget_data)
+    nugget_graph_id = kb._id + "_" + nugget_data["id"]
+    attrs = _nugget_attrs_from_json(kb, nugget_data, instantiated)
+
+    kb._hierarchy.add_graph_from_json(
+        nugget_graph_id,
+        nugget_data["graph"],
+        attrs)
+
+    kb._hierarchy.add_typing(
+        nugget_graph_id,
+        kb._action_graph_id, nugget_data["typing"])
+
+    kb._hierarchy.add_relation(
+        nugget_graph_id,
+        nugget_data["template_rel"][0],
+        nugget_data["template_rel"][1])
+
+    if not instantiated:
+        if "semantic_rels" in nugget_data.keys():
+            for s_nugget_id, rel in nugget_data[
+                    "semantic_rels"].items():
+                kb._hierarchy.add_relation(
+                    nugget_graph_id, s_nugget_id, rel)
+    return nugget_graph_id, attrs
+
+
+def _add_nugget_from_json(kb, nugget_data, instantiated=False):
+    """Add and register a nugget from its json data."""
+    nugget_graph_id, attrs = _add_nugget_graph_from_json(
+        kb, nugget_data, instantiated)
+    kb._nugget_registry.add_nugget(
+        nugget_graph_id, attrs, nugget_data["template_rel"][0])
+    return nugget_graph_id
+
+
+def _unshare_graphs(kb, graph_ids):
+    """Copy the nugget graphs shared between a corpus and a model.
+
+    Shared graphs are copied before being modified: the copies of the
+    graphs and of their typing by the action graph replace the shared
+    objects in the hierarchy of the knowledge base.
+    """
+    for graph_id in graph_ids:
+        if graph_id in kb._shared_graphs:
+            graph = NXGraph.copy(kb._hierarchy.get_graph(graph_id))
+            kb._hierarchy._update_graph(graph_id, graph)
+            kb._hierarchy._update_mapping(
+                graph_id, kb._action_graph_id,
+                dict(kb._hierarchy.get_typing(
+                    graph_id, kb._action_graph_id)))
+            kb._shared_graphs.remove(graph_id)
+
+
 def _generate_fragment_repr(corpus, protoform_node,
                             fragment_node, fragment_type="region"):
     region_attrs = corpus.action_graph.get_node(fragment_node)
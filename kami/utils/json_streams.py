@@ -0,0 +1,420 @@
+"""Collection of utils for streaming JSON data.
+
+Records are read one by one from files containing either JSON Lines
+(one JSON value per line) or a top-level JSON array, so that the memory
+used does not depend on the size of the file.
+"""
+import codecs
+import gzip
+import json
+import re
+
+from kami.exceptions import KamiException
+
+
+BUFFER_SIZE = 1 << 16
+
+
+def open_json_file(filename):
+    """Open a (possibly gzip-compressed) JSON file for reading."""
+    with open(filename, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(filename, "rt")
+    return open(filename, "r")
+
+
+def _first_char(f):
+    """Get the first non-whitespace character of a binary file."""
+    f.seek(0)
+    while True:
+        block = f.read(BUFFER_SIZE)
+        if not block:
+            return None
+        stripped = block.lstrip()
+        if stripped:
+            return chr(stripped[0])
+
+
+def _iter_json_lines(f, offset):
+    f.seek(offset)
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        offset += len(line)
+        line = line.strip()
+        if line:
+            yield json.loads(line.decode("utf-8")), offset
+
+
+class _JSONReader(object):
+    """Incremental reader of JSON values from a binary file.
+
+    Attributes
+    ----------
+    offset : int
+        Byte offset of the beginning of the buffer in the file
+    """
+
+    def __init__(self, f, offset=0):
+        """Initialize the reader at the byte offset of the file."""
+        self._f = f
+        self._f.seek(offset)
+        self._decoder = json.JSONDecoder()
+        self._utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._eof = False
+        self.offset = offset
+
+    def _read(self):
+        """Read the next block of the file, return False at EOF."""
+        if self._eof:
+            return False
+        # Blocks grow with the buffer, so that large values
+        # are decoded a logarithmic number of times
+        block = self._f.read(max(BUFFER_SIZE, len(self._buf)))
+        if not block:
+            self._eof = True
+            self._buf += self._utf8_decoder.decode(b"", final=True)
+        else:
+            self._buf += self._utf8_decoder.decode(block)
+        return True
+
+    def _consume(self, n):
+        self.offset += len(self._buf[:n].encode("utf-8"))
+        self._buf = self._buf[n:]
+
+    def skip(self, chars=""):
+        """Skip whitespaces and the specified characters."""
+        while True:
+            stripped = self._buf.lstrip()
+            while len(stripped) > 0 and stripped[0] in chars:
+                stripped = stripped[1:].lstrip()
+            self._consume(len(self._buf) - len(stripped))
+            if len(self._buf) > 0 or not self._read():
+                return
+
+    def peek(self):
+        """Get the next character (None at the end of the file)."""
+        while len(self._buf) == 0:
+            if not self._read():
+                return None
+        return self._buf[0]
+
+    def expect(self, char):
+        """Consume the expected character."""
+        self.skip()
+        if self.peek() != char:
+            raise KamiException(
+                "Error reading JSON: expected '{}' at the byte {}".format(
+                    char, self.offset))
+        self._consume(1)
+
+    def read_value(self):
+        """Read the next JSON value.
+
+        Returns
+        -------
+        (value, start, end)
+            Value and its start and end byte offsets in the file
+        """
+        self.skip()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf)
+            except ValueError:
+                end = None
+            # A value ending exactly at the end of the buffer
+            # may be incomplete (e.g. a number)
+            if end is not None and (end < len(self._buf) or self._eof):
+                start = self.offset
+                self._consume(end)
+                return value, start, self.offset
+            if not self._read():
+                raise KamiException(
+                    "Error reading JSON: unexpected end of file")
+
+
+_STRING_DELIMITERS = re.compile(rb'["\\]')
+_CONTAINER_DELIMITERS = re.compile(rb'["{}\[\]]')
+_SCALAR_DELIMITERS = re.compile(rb'[\s,\]}]')
+
+
+class _JSONScanner(object):
+    """Scanner of the byte spans of JSON values in a binary file.
+
+    Values are delimited without being decoded, except for the
+    requested members of the scanned objects.
+
+    Attributes
+    ----------
+    offset : int
+        Byte offset of the scanner in the file
+    """
+
+    def __init__(self, f, offset=0):
+        """Initialize the scanner at the byte offset of the file."""
+        self._f = f
+        self._f.seek(offset)
+        self._buf = b""
+        self._base = offset
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def offset(self):
+        return self._base + self._pos
+
+    def _read(self):
+        """Read the next block of the file, return False at EOF."""
+        if self._eof:
+            return False
+        block = self._f.read(max(BUFFER_SIZE, len(self._buf)))
+        if not block:
+            self._eof = True
+            return False
+        self._buf += block
+        return True
+
+    def _compact(self):
+        """Drop the scanned part of the buffer."""
+        self._base += self._pos
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+
+    def _char(self, pos):
+        """Get the byte at the position of the buffer (None at EOF)."""
+        while pos >= len(self._buf):
+            if not self._read():
+                return None
+        return self._buf[pos:pos + 1]
+
+    def _search(self, pattern, pos):
+        """Get the position of the next match of the delimiter pattern."""
+        while True:
+            match = pattern.search(self._buf, pos)
+            if match is not None:
+                return match.start()
+            pos = max(pos, len(self._buf))
+            if not self._read():
+                raise KamiException(
+                    "Error reading JSON: unexpected end of file")
+
+    def _skip(self, pos, chars=b""):
+        """Skip whitespaces and the specified characters."""
+        while True:
+            char = self._char(pos)
+            if char is None or not (char.isspace() or char in chars):
+                return pos
+            pos += 1
+
+    def _expect(self, pos, char):
+        """Get the position after the expected character."""
+        pos = self._skip(pos)
+        if self._char(pos) != char:
+            raise KamiException(
+                "Error reading JSON: expected '{}' at the byte {}".format(
+                    char.decode("utf-8"), self._base + pos))
+        return pos + 1
+
+    def _scan_string(self, pos):
+        """Get the end position of the string starting at the position."""
+        pos += 1
+        while True:
+            pos = self._search(_STRING_DELIMITERS, pos)
+            if self._buf[pos:pos + 1] == b'"':
+                return pos + 1
+            # Skip the escaped character
+            pos += 2
+
+    def _scan_value(self, pos):
+        """Get the end position of the value starting at the position."""
+        char = self._char(pos)
+        if char is None:
+            raise KamiException(
+                "Error reading JSON: unexpected end of file")
+        if char == b'"':
+            return self._scan_string(pos)
+        if char not in b"{[":
+            return self._search(_SCALAR_DELIMITERS, pos)
+        depth = 0
+        while True:
+            pos = self._search(_CONTAINER_DELIMITERS, pos)
+            char = self._buf[pos:pos + 1]
+            if char == b'"':
+                pos = self._scan_string(pos)
+                continue
+            depth += 1 if char in b"{[" else -1
+            pos += 1
+            if depth == 0:
+                return pos
+
+    def _decode(self, start, end):
+        return json.loads(self._buf[start:end].decode("utf-8"))
+
+    def scan_object(self, members):
+        """Scan the next JSON object decoding only the specified members.
+
+        Returns
+        -------
+        (values, start, end)
+            Dictionary with the values of the specified members found
+            in the object and its start and end byte offsets in the file
+        """
+        self._compact()
+        start = self._expect(self._pos, b"{") - 1
+        pos = start + 1
+        values = dict()
+        while True:
+            pos = self._skip(pos, b",")
+            if self._char(pos) == b"}":
+                break
+            key_start = self._expect(pos, b'"') - 1
+            key_end = self._scan_string(key_start)
+            key = self._decode(key_start, key_end)
+            pos = self._skip(self._expect(key_end, b":"))
+            value_end = self._scan_value(pos)
+            if key in members:
+                values[key] = self._decode(pos, value_end)
+            pos = value_end
+        self._pos = pos + 1
+        return values, self._base + start, self.offset
+
+    def iter_array_objects(self, members):
+        """Iterate over the objects of the next JSON array.
+
+        Yields
+        ------
+        (values, start, end)
+            See `scan_object`
+        """
+        self._pos = self._expect(self._pos, b"[")
+        while True:
+            self._pos = self._skip(self._pos, b",")
+            char = self._char(self._pos)
+            if char == b"]":
+                self._pos += 1
+                return
+            if char is None:
+                raise KamiException(
+                    "Error reading JSON array: unexpected end of file")
+            yield self.scan_object(members)
+
+
+def _iter_json_array(reader, array_opened):
+    if not array_opened:
+        reader.expect("[")
+    while True:
+        reader.skip(",")
+        char = reader.peek()
+        if char == "]":
+            return
+        if char is None:
+            raise KamiException(
+                "Error reading JSON array: unexpected end of file")
+        yield reader.read_value()
+
+
+def _iter_json_array_records(f, offset):
+    reader = _JSONReader(f, offset)
+    for record, _, end in _iter_json_array(reader, offset > 0):
+        yield record, end
+
+
+def iter_json_records(filename, offset=0):
+    """Iterate over the records of a JSON file.
+
+    Parameters
+    ----------
+    filename : str
+        Path to a file containing either JSON Lines or
+        a top-level JSON array
+    offset : int, optional
+        Byte offset from which the records are read, typically
+        an offset previously produced by this function
+
+    Yields
+    ------
+    (record, offset)
+        JSON record and the byte offset right after it, from
+        which the reading can be resumed
+    """
+    with open(filename, "rb") as f:
+        first_char = _first_char(f)
+        if first_char is None:
+            return
+        if first_char == "[":
+            records = _iter_json_array_records(f, offset)
+        else:
+            records = _iter_json_lines(f, offset)
+        for record, record_offset in records:
+            yield record, record_offset
+
+
+def iter_json_object(filename, array_keys=None, members=None):
+    """Iterate over the items of a top-level JSON object.
+
+    Parameters
+    ----------
+    filename : str
+        Path to a file containing a JSON object
+    array_keys : iterable, optional
+        Keys whose values are arrays to iterate over element
+        by element (instead of reading them as a whole)
+    members : iterable, optional
+        If specified, the elements of the arrays from `array_keys`
+        are objects whose byte spans are only scanned: just the
+        values of these members are decoded (and yielded as
+        a dictionary instead of the whole element)
+
+    Yields
+    ------
+    (key, value, start, end)
+        Key and value of an item of the object (for the keys from
+        `array_keys`, one of the elements of the array) with the start
+        and the end byte offsets of the value in the file
+    """
+    if array_keys is None:
+        array_keys = []
+    with open(filename, "rb") as f:
+        reader = _JSONReader(f)
+        reader.expect("{")
+        while True:
+            reader.skip(",")
+            if reader.peek() == "}":
+                return
+            key, _, _ = reader.read_value()
+            reader.expect(":")
+            if key in array_keys and members is not None:
+                scanner = _JSONScanner(f, reader.offset)
+                for values, start, end in scanner.iter_array_objects(
+                        set(members)):
+                    yield key, values, start, end
+                reader = _JSONReader(f, scanner.offset)
+            elif key in array_keys:
+                for value, start, end in _iter_json_array(reader, False):
+                    yield key, value, start, end
+                reader.expect("]")
+            else:
+                value, start, end = reader.read_value()
+                yield key, value, start, end
+
+
+def read_json_value(filename, start, end):
+    """Read a JSON value located between the byte offsets of the file."""
+    with open(filename, "rb") as f:
+        f.seek(start)
+        return json.loads(f.read(end - start).decode("utf-8"))
+
+
+def iter_chunks(records, chunk_size):
+    """Group the elements of an iterable into lists of bounded size."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
@@ -0,0 +1,108 @@
+"""Collection of utils for binary snapshots of KAMI knowledge bases.
+
+A snapshot file consists of a fixed-size header followed by a payload
+containing the pickled state of a corpus (model). The header contains
+a magic string, the version of the snapshot format, the kind of the
+knowledge base stored in the snapshot, the size of the payload and its
+SHA-256 digest, which is verified on loading.
+
+Note that snapshots are intended for caching knowledge bases between
+runs of trusted pipelines: as any pickled data, they should not be
+loaded from untrusted sources.
+"""
+import hashlib
+import pickle
+import struct
+import zlib
+
+from kami.exceptions import KamiException
+
+
+SNAPSHOT_MAGIC = b"KAMISNAP"
+SNAPSHOT_FORMAT_VERSION = 1
+
+_FLAG_COMPRESSED = 1
+
+# magic, format version, kind, flags, payload size, payload digest
+_HEADER = struct.Struct(">8sH16sBQ32s")
+
+
+def write_snapshot(filename, kind, state, compress=False):
+    """Write a binary snapshot to the file.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the output file
+    kind : str
+        Kind of the knowledge base ("corpus" or "model")
+    state : dict
+        Dictionary with the state of the knowledge base
+    compress : bool, optional
+        If True, the payload is zlib-compressed (the snapshot is
+        more compact but slower to load)
+    """
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= _FLAG_COMPRESSED
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, kind.encode("ascii"),
+        flags, len(payload), hashlib.sha256(payload).digest())
+    with open(filename, "wb") as f:
+        f.write(header)
+        f.write(payload)
+
+
+def read_snapshot(filename, kind):
+    """Read a binary snapshot from the file.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the snapshot file
+    kind : str
+        Expected kind of the knowledge base ("corpus" or "model")
+
+    Returns
+    -------
+    state : dict
+        Dictionary with the state of the knowledge base
+
+    Raises
+    ------
+    KamiException
+        If the file is not a valid snapshot of the expected kind, if its
+        format version is not supported or if it is corrupted
+    """
+    with open(filename, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise KamiException(
+                "File '{}' is not a KAMI snapshot".format(filename))
+        (
+            magic, version, snapshot_kind, flags, size, digest
+        ) = _HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise KamiException(
+                "File '{}' is not a KAMI snapshot".format(filename))
+        if version > SNAPSHOT_FORMAT_VERSION:
+            raise KamiException(
+                "Snapshot format version {} is not supported ".format(
+                    version) +
+                "(the latest supported version is {})".format(
+                    SNAPSHOT_FORMAT_VERSION))
+        snapshot_kind = snapshot_kind.rstrip(b"\x00").decode("ascii")
+        if snapshot_kind != kind:
+            raise KamiException(
+                "File '{}' contains a snapshot of a {}, ".format(
+                    filename, snapshot_kind) +
+                "a snapshot of a {} is expected".format(kind))
+        payload = f.read(size)
+    if len(payload) != size or hashlib.sha256(payload).digest() != digest:
+        raise KamiException(
+            "Snapshot '{}' is corrupted: checksum mismatch".format(filename))
+    if flags & _FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload)
@@ -21,7 +21,13 @@ setup(name='kami',
       },
       include_package_data=True,
       zip_safe=False,
+      python_requires=">=3.6",
       install_requires=[
+          "regraph",
+          "networkx>=2.3,<2.4",
+          "decorator",
+          "numpy",
+          "requests",
           "indra",
           "flask",
           "flex",
@@ -1,7 +1,10 @@
 """Unit testing of black box functionality."""
 
+from regraph import NXGraph
 from regraph.primitives import (print_graph)
 
+from kami.aggregation.bookkeeping import apply_bookkeeping
+from kami.aggregation.identifiers import EntityIdentifier
 from kami.exporters.old_kami import ag_to_edge_list
 from kami import (Modification, Binding, LigandModification)
 from kami import (Protoform, Region, RegionActor, Residue,
@@ -449,3 +452,33 @@ class TestBlackBox(object):
 
         corpus = KamiCorpus("test")
         corpus.add_interactions(interactions)
+
+    def test_transitive_bookkeeping(self):
+        graph = NXGraph()
+        graph.add_nodes_from(["A", "kinase", "loop", "Y100", "S10"])
+        graph.add_edges_from([
+            ("kinase", "A", {"start": {50}, "end": {300}}),
+            ("loop", "A", {"start": {90}, "end": {110}}),
+            ("Y100", "loop", {"loc": {100}}),
+            ("S10", "A", {"loc": {10}})
+        ])
+        meta_typing = {
+            "A": "protoform",
+            "kinase": "region",
+            "loop": "site",
+            "Y100": "residue",
+            "S10": "residue"
+        }
+        identifier = EntityIdentifier(graph, meta_typing)
+        apply_bookkeeping(identifier, graph.nodes(), ["A"])
+        # The nested site is connected to the region, then the
+        # residue of the site is connected to the region and
+        # to the protoform
+        assert(graph.get_edge("loop", "kinase") == {
+            "start": {90}, "end": {110}})
+        assert("transitive" in graph.get_edge("loop", "A")["type"])
+        assert(graph.get_edge("Y100", "kinase") == {
+            "loc": {100}, "type": {"transitive"}})
+        assert(graph.get_edge("Y100", "A") == {
+            "loc": {100}, "type": {"transitive"}})
+        assert(not graph.exists_edge("S10", "kinase"))
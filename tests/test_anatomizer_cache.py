@@ -0,0 +1,81 @@
+"""Unit testing of the persistent cache of the anatomizer."""
+import os
+import tempfile
+import time
+
+from anatomizer import (AnatomizerCache, CacheMissError, get_uniprot_record,
+                        set_cache)
+
+
+class TestAnatomizerCache(object):
+    """Test caching of the data fetched by the anatomizer."""
+
+    def __init__(self):
+        """Initialize with a counter of fetches."""
+        self.fetched = []
+
+    def _fetcher(self, value):
+        def _fetch():
+            self.fetched.append(value)
+            return value
+        return _fetch
+
+    def test_persistence(self):
+        fd, path = tempfile.mkstemp(suffix=".sqlite")
+        os.close(fd)
+        cache = AnatomizerCache(path)
+        cache.fetch("uniprot", "P00533", self._fetcher("EGFR"))
+        cache.close()
+
+        cache = AnatomizerCache(path)
+        assert(cache.fetch("uniprot", "P00533", self._fetcher("-")) == "EGFR")
+        assert(self.fetched == ["EGFR"])
+        cache.close()
+
+        cache = AnatomizerCache(path, versions={"uniprot": "2020_01"})
+        assert(cache.get("uniprot", "P00533") is None)
+        cache.close()
+        os.remove(path)
+
+    def test_ttl_and_offline(self):
+        cache = AnatomizerCache(":memory:", ttl=0.01)
+        cache.put("interpro", "P00533", [{"accession": "IPR000719"}])
+        time.sleep(0.05)
+        assert(("interpro", "P00533") not in cache)
+
+        cache.offline = True
+        assert(("interpro", "P00533") in cache)
+        try:
+            cache.fetch("interpro", "P00519", self._fetcher([]))
+            raise ValueError("Offline cache should not fetch")
+        except CacheMissError:
+            pass
+        assert(len(self.fetched) == 0)
+
+    def test_lru_eviction(self):
+        cache = AnatomizerCache(":memory:", max_size=30)
+        cache.put("uniprot", "A", "a" * 10)
+        time.sleep(0.01)
+        cache.put("uniprot", "B", "b" * 10)
+        time.sleep(0.01)
+        cache.get("uniprot", "A")
+        cache.put("uniprot", "C", "c" * 10)
+        assert(len(cache) == 2)
+        assert(("uniprot", "B") not in cache)
+        assert(("uniprot", "A") in cache)
+
+    def test_fetchers(self):
+        cache = AnatomizerCache(":memory:", offline=True)
+        cache.put("uniprot", "P00533:sequence", "Sequence\nMRPSGTAGAA")
+        set_cache(cache)
+        try:
+            assert(
+                get_uniprot_record("P00533", ["sequence"]) ==
+                "Sequence\nMRPSGTAGAA")
+            try:
+                get_uniprot_record("P00533")
+                raise ValueError("Offline cache should not fetch")
+            except CacheMissError:
+                pass
+        finally:
+            set_cache(None)
@@ -0,0 +1,144 @@
+"""Unit testing of merging and nesting of domains in the anatomizer."""
+import copy
+import random
+
+from anatomizer.anatomizer_light import merge_raw_domains, overlap
+from anatomizer.utils import (_merge_fragments, _nest_domains,
+                              _merge_overlap, _nest_overlap, are_parents,
+                              _overlapping_pairs)
+
+
+IPR_PARENTS = {
+    "IPR1": [],
+    "IPR2": ["IPR1"],
+    "IPR3": ["IPR2", "IPR1"],
+    "IPR4": [],
+    "IPR5": ["IPR4"]
+}
+
+
+def _generate_fragments(n, length, seed):
+    rng = random.Random(seed)
+    fragments = []
+    for i in range(n):
+        start = rng.randint(1, length)
+        end = start + rng.randint(0, length // 10)
+        ipr_id = rng.choice(sorted(IPR_PARENTS))
+        fragments.append({
+            "id": i,
+            "start": start,
+            "end": end,
+            "length": end - start,
+            "ipr_id": ipr_id,
+            "ipr_parents": IPR_PARENTS[ipr_id],
+            "ipr_name": ipr_id,
+            "short_name": ipr_id,
+            "feature_type": "Domain",
+            "interproid": ipr_id,
+            "name": ipr_id
+        })
+    return fragments
+
+
+def _reference_groups(fragments):
+    """Grouping of fragments by the exhaustive scan."""
+    visited = set()
+    groups = []
+    for i in range(len(fragments)):
+        if i not in visited:
+            group = [fragments[i]]
+            visited.add(i)
+            j = 0
+            while j < len(fragments):
+                if j not in visited:
+                    for member in group:
+                        if are_parents(member, fragments[j]) and\
+                                _merge_overlap(member, fragments[j]) >= 0.0001:
+                            group.append(fragments[j])
+                            visited.add(j)
+                            j = -1
+                            break
+                j += 1
+            groups.append([f["id"] for f in group])
+    return groups
+
+
+def _reference_nests(domains, nest_threshold, max_level, level=0):
+    """Nesting of domains by the exhaustive scan."""
+    if level == max_level:
+        return [(d["start"], d["end"], []) for d in domains]
+    domains = sorted(domains, key=lambda x: x["length"], reverse=True)
+    visited = set()
+    result = []
+    for i in range(len(domains)):
+        if i not in visited:
+            visited.add(i)
+            nested = []
+            for j in range(len(domains)):
+                if j not in visited and _nest_overlap(
+                        domains[i], domains[j]) >= nest_threshold:
+                    nested.append(domains[j])
+                    visited.add(j)
+            result.append((
+                domains[i]["start"], domains[i]["end"],
+                _reference_nests(nested, nest_threshold, max_level,
+                                 level + 1)))
+    return result
+
+
+def _nests(domains):
+    return [
+        (d["start"], d["end"], _nests(d["subdomains"])) for d in domains
+    ]
+
+
+class TestDomainMerging(object):
+    """Test merging and nesting on sorted intervals."""
+
+    def test_overlapping_pairs(self):
+        intervals = [(1, 5), (5, 8), (4, 6), (7, 7), (0, 10)]
+        assert(_overlapping_pairs(intervals) == [
+            [2, 4], [2, 4], [0, 1, 4], [], [0, 1, 2]])
+
+    def test_merge_fragments(self):
+        for seed in range(5):
+            fragments = _generate_fragments(150, 2000, seed)
+            domains = _merge_fragments(copy.deepcopy(fragments))
+            assert(
+                [[f["id"] for f in d["fragments"]] for d in domains] ==
+                _reference_groups(fragments))
+
+    def test_nest_domains(self):
+        for seed in range(5):
+            domains = _generate_fragments(150, 2000, seed)
+            for d in domains:
+                d["subdomains"] = []
+            for threshold, level in [(0.7, 1), (0.5, 2), (0, 1)]:
+                result = _nest_domains(
+                    copy.deepcopy(domains), threshold, level)
+                assert(_nests(result) == _reference_nests(
+                    domains, threshold, level))
+
+    def test_merge_raw_domains(self):
+        for seed in range(5):
+            raw_domains = _generate_fragments(150, 2000, seed)
+            for d in raw_domains:
+                d["interproid"] = d["id"]
+            for threshold in [0.8, 0.1, 0]:
+                visited = set()
+                expected = []
+                for i, d1 in enumerate(raw_domains):
+                    if i not in visited:
+                        visited.add(i)
+                        group = set()
+                        for j, d2 in enumerate(raw_domains):
+                            if j not in visited and overlap(
+                                    d1["start"], d1["end"],
+                                    d2["start"], d2["end"]) >= threshold:
+                                group.add(j)
+                                visited.add(j)
+                        expected.append((i, group))
+                domains = merge_raw_domains(raw_domains, threshold)
+                assert(
+                    [(d["interproids"][0], set(d["interproids"][1:]))
+                     for d in domains] == expected)
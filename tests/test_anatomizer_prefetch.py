@@ -0,0 +1,126 @@
+"""Unit testing of the concurrent prefetch of the anatomizer data."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import anatomizer.anatomizer_light as anatomizer_light
+from anatomizer import (fetch_gene_meta_data, fetch_gene_domains,
+                        prefetch_gene_data, discard_prefetched)
+from anatomizer.anatomizer_light import RateLimiter
+
+
+UNIPROT_RECORDS = {
+    "P00533": "P00533\tEGFR_HUMAN\treviewed\tEGFR\tEGFR ERBB ERBB1",
+    "P00519": "P00519\tABL1_HUMAN\treviewed\tABL1\tABL1 ABL JTK7"
+}
+
+INTERPRO_DOMAINS = {
+    "P00533": ("IPR000719", "Protein kinase domain", 712, 979),
+    "P00519": ("IPR000980", "SH2 domain", 127, 217)
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Handler of requests to the stub UniProt and InterPro services."""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        resource, uniprot_ac = self.path.split("/")[1:3]
+        if uniprot_ac.split(".")[0] not in UNIPROT_RECORDS:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if resource == "uniprot":
+            body = "Entry\tEntry name\tStatus\tProtein names\tGene names\n" +\
+                UNIPROT_RECORDS[uniprot_ac.split(".")[0]]
+        else:
+            accession, name, start, end = INTERPRO_DOMAINS[uniprot_ac]
+            body = json.dumps({
+                "next": None,
+                "results": [{
+                    "metadata": {
+                        "type": "domain",
+                        "accession": accession,
+                        "name": name
+                    },
+                    "proteins": [{
+                        "accession": uniprot_ac.lower(),
+                        "entry_protein_locations": [{
+                            "fragments": [{"start": start, "end": end}]
+                        }]
+                    }]
+                }]
+            })
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAnatomizerPrefetch(object):
+    """Test prefetch of the anatomizer data from a stub server."""
+
+    def _start_server(self):
+        server = HTTPServer(("127.0.0.1", 0), _StubHandler)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_prefetch(self):
+        server = self._start_server()
+        url = "http://127.0.0.1:{}".format(server.server_port)
+        original_urls = (
+            anatomizer_light.UNIPROT_BASE_URL,
+            anatomizer_light.INTERPRO_BASE_URL
+        )
+        (
+            anatomizer_light.UNIPROT_BASE_URL,
+            anatomizer_light.INTERPRO_BASE_URL
+        ) = (
+            url + "/uniprot/{}.tab",
+            url + "/interpro/{}/?page_size=100"
+        )
+        try:
+            prefetched = prefetch_gene_data(["P00533", "P00519", None])
+            assert(prefetched == {"P00533", "P00519"})
+            assert(len(server.requests) == 4)
+
+            assert(
+                fetch_gene_meta_data("P00533") == ("EGFR", ["ERBB", "ERBB1"]))
+            domains = fetch_gene_domains("P00519")
+            assert(domains[0]["interproids"] == ["IPR000980"])
+            assert(len(server.requests) == 4)
+
+            # Prefetched data is consumed
+            fetch_gene_meta_data("P00533")
+            assert(len(server.requests) == 5)
+
+            # Failures are not stored, the remaining data is discarded
+            prefetched = prefetch_gene_data(["P00533", "P04049"])
+            assert(prefetched == {"P00533"})
+            assert(len(server.requests) == 8)
+            discard_prefetched(["P00533", "P00519"])
+            assert(len(anatomizer_light._prefetched) == 0)
+            prefetch_gene_data(["P04049"])
+            assert(len(server.requests) == 10)
+        finally:
+            (
+                anatomizer_light.UNIPROT_BASE_URL,
+                anatomizer_light.INTERPRO_BASE_URL
+            ) = original_urls
+            anatomizer_light.clear_prefetched()
+            server.shutdown()
+            server.server_close()
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=100)
+        start = time.monotonic()
+        threads = [threading.Thread(target=limiter.wait) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert(time.monotonic() - start >= 0.05)
@@ -1,5 +1,10 @@
 """Unit testing of entity identification used in aggregation."""
-from kami.aggregation.identifiers import EntityIdentifier
+import random
+
+import numpy as np
+
+from kami.aggregation.identifiers import (EntityIdentifier, FragmentIndex,
+                                          ResidueIndex, find_fragment)
 from kami import (Protoform, Region, Residue,
                   Site, State)
 from kami import KamiCorpus
@@ -7,6 +12,75 @@ from kami import KamiCorpus
 # from regraph.primitives import print_graph
 
 
+def _scan_fragments(a_meta_data, a_location, dict_of_b):
+    """Find a fragment by the exhaustive scan."""
+    def _interval(location):
+        start = int(min(location["start"])) if "start" in location else None
+        end = int(max(location["end"])) if "end" in location else None
+        return start, end
+
+    def _name(meta_data):
+        if "name" in meta_data:
+            return list(meta_data["name"])[0].lower()
+
+    a_start, a_end = _interval(a_location)
+    a_name = _name(a_meta_data)
+    a_interpro = a_meta_data.get("interproid")
+    satisfying = []
+    for b_id, (b_meta_data, b_location) in dict_of_b.items():
+        b_start, b_end = _interval(b_location)
+        b_name = _name(b_meta_data)
+        b_interpro = b_meta_data.get("interproid")
+        if None not in [a_start, a_end, b_start, b_end]:
+            if (a_start >= b_start and a_end <= b_end) or\
+               (a_start <= b_start and a_end >= b_end):
+                return b_id
+        elif a_name is not None and b_name is not None:
+            if a_name in b_name or b_name in a_name:
+                satisfying.append(b_id)
+        elif a_interpro is not None and b_interpro is not None:
+            if len(a_interpro.intersection(b_interpro)) > 0:
+                satisfying.append(b_id)
+    if len(satisfying) == 1:
+        return satisfying[0]
+    elif len(satisfying) > 1 and "order" in a_location:
+        a_order = list(a_location["order"])[0]
+        same_order = [
+            b_id for b_id in satisfying
+            if a_order in dict_of_b[b_id][1].get("order", set())
+        ]
+        if len(same_order) == 0:
+            try:
+                start_orders = np.argsort([
+                    int(min(dict_of_b[b_id][1]["start"]))
+                    for b_id in satisfying
+                    if "start" in dict_of_b[b_id][1]
+                ])
+                return satisfying[start_orders[a_order - 1]]
+            except:
+                return None
+        elif len(same_order) == 1:
+            return same_order[0]
+    return None
+
+
+def _random_fragment(rng):
+    meta_data = {}
+    location = {}
+    if rng.random() < 0.5:
+        meta_data["name"] = {rng.choice(["SH2", "sh2 domain", "Kinase"])}
+    if rng.random() < 0.5:
+        meta_data["interproid"] = set(
+            rng.sample(["IPR1", "IPR2", "IPR3", "IPR4"], rng.randint(1, 2)))
+    if rng.random() < 0.7:
+        start = rng.randint(1, 1000)
+        location["start"] = {start}
+        location["end"] = {start + rng.randint(-10, 200)}
+    if rng.random() < 0.3:
+        location["order"] = {rng.randint(1, 3)}
+    return meta_data, location
+
+
 class TestIdentifiers(object):
     """Test identifiers of entities in the action graph."""
 
@@ -126,6 +200,63 @@ class TestIdentifiers(object):
             self.gene_id)
         assert(res == self.interval_site)
 
+    def test_fragment_index(self):
+        """Test the index of fragments against the exhaustive scan."""
+        rng = random.Random(0)
+        for _ in range(20):
+            dict_of_b = {
+                i: _random_fragment(rng) for i in range(rng.randint(0, 60))
+            }
+            fragment_index = FragmentIndex(dict_of_b)
+            for _ in range(50):
+                a_meta_data, a_location = _random_fragment(rng)
+                expected = _scan_fragments(a_meta_data, a_location, dict_of_b)
+                assert(
+                    fragment_index.find(a_meta_data, a_location) == expected)
+                assert(
+                    find_fragment(a_meta_data, a_location, dict_of_b) ==
+                    expected)
+
+    def test_cached_fragment_index(self):
+        """Test invalidation of the cached index of fragments."""
+        identifier = self.hierarchy.get_entity_identifier()
+        res = identifier.identify_region(
+            Region(start=310, end=320), self.gene_id)
+        assert(res is None)
+        new_region = self.hierarchy.add_region(
+            Region("PH", start=300, end=400), self.gene_id)
+        identifier = self.hierarchy.get_entity_identifier()
+        res = identifier.identify_region(
+            Region(start=310, end=320), self.gene_id)
+        assert(res == new_region)
+
+    def test_cached_ancestor_fragment_index(self):
+        """Test invalidation of the cached index of ancestor fragments."""
+        def _identifier():
+            return EntityIdentifier(
+                self.hierarchy.action_graph,
+                self.hierarchy.get_action_graph_typing(),
+                immediate=False,
+                index=self.hierarchy._ag_index,
+                memo=self.hierarchy._ag_index.traversal_memo)
+
+        identifier = _identifier()
+        fragment_index = identifier.get_ancestor_fragment_index(
+            self.gene_id, "site")
+        res = identifier.identify_site(Site("ATP bind"), self.gene_id)
+        assert(res == self.named_site)
+        assert(identifier.get_ancestor_fragment_index(
+            self.gene_id, "site") is fragment_index)
+        res = identifier.identify_site(
+            Site(start=310, end=320), self.gene_id)
+        assert(res is None)
+        new_site = self.hierarchy.add_site(
+            Site("pS", start=300, end=400), self.named_region)
+        identifier = _identifier()
+        res = identifier.identify_site(
+            Site(start=310, end=320), self.gene_id)
+        assert(res == new_site)
+
     def test_identify_residue(self):
         """Test residue identification."""
         identifier = EntityIdentifier(
@@ -141,6 +272,44 @@ class TestIdentifiers(object):
             Residue("S"), self.gene_id)
         assert(res is None)
 
+    def test_residue_index(self):
+        """Test the index of residues by location and amino acid."""
+        residue_index = ResidueIndex({
+            "r1": ({"aa": {"S", "T"}}, {"loc": {15}}),
+            "r2": ({"aa": {"Y"}}, {}),
+            "r3": ({"aa": {"S"}}, {"loc": {15}}),
+            "r4": ({"aa": {"S", "T"}}, {}),
+            "r5": ({"aa": {"T"}}, {"loc": {20}})
+        })
+        assert(residue_index.residues_at(15) == ["r1", "r3"])
+        assert(residue_index.residues_at(30) == [])
+        assert(residue_index.location_groups() == [(15, ["r1", "r3"])])
+        assert(residue_index.unlocated_residues() == ["r2", "r4"])
+        assert(residue_index.unlocated_residues_with_aa({"S", "T"}) == ["r4"])
+        assert(residue_index.unlocated_residues_with_aa({"Y", "T"}) == [])
+
+    def test_cached_residue_index(self):
+        """Test identification of residues with the cached index."""
+        identifier = self.hierarchy.get_entity_identifier()
+        res = identifier.identify_residue(
+            Residue("S", 300), self.gene_id)
+        assert(res is None)
+        new_residue = self.hierarchy.add_residue(
+            Residue("S", 300), self.gene_id)
+        identifier = self.hierarchy.get_entity_identifier()
+        res = identifier.identify_residue(
+            Residue("S", 300), self.gene_id)
+        assert(res == new_residue)
+        res = identifier.identify_residue(
+            Residue("S"), self.gene_id)
+        assert(res is None)
+        res = identifier.identify_residue(
+            Residue("S"), self.gene_id, add_aa=True)
+        assert(res == self.residue_no_loc)
+        res = identifier.identify_residue(
+            Residue("S"), self.gene_id)
+        assert(res == self.residue_no_loc)
+
     def test_identify_state(self):
         """Test state identification."""
         identifier = EntityIdentifier(
@@ -158,3 +327,76 @@ class TestIdentifiers(object):
         res = identifier.identify_state(
             State("activity", False), self.gene_id)
         assert(res == self.gene_state)
+
+    def test_frozen_traversals(self):
+        """Test traversals of the frozen action graph."""
+        identifier = EntityIdentifier(
+            self.hierarchy.action_graph,
+            self.hierarchy.get_action_graph_typing())
+        frozen_ag = self.hierarchy.freeze()
+        frozen_identifier = EntityIdentifier(
+            frozen_ag, frozen_ag.meta_typing)
+        assert(
+            set(frozen_identifier.get_protoforms()) ==
+            set(identifier.get_protoforms()))
+        for node in self.hierarchy.action_graph.nodes():
+            assert(
+                frozen_identifier.subcomponents(node) ==
+                identifier.subcomponents(node))
+            assert(
+                frozen_identifier.get_protoform_of(node) ==
+                identifier.get_protoform_of(node))
+            for meta_type in ["region", "site", "residue", "state"]:
+                assert(
+                    sorted(frozen_identifier.ancestors_of_type(
+                        node, meta_type)) ==
+                    sorted(identifier.ancestors_of_type(node, meta_type)))
+                assert(
+                    sorted(frozen_identifier.descendants_of_type(
+                        node, meta_type)) ==
+                    sorted(identifier.descendants_of_type(node, meta_type)))
+        assert(
+            frozen_ag.get_node(self.residue) ==
+            self.hierarchy.action_graph.get_node(self.residue))
+
+    def test_memoized_traversals(self):
+        """Test memoized traversals of the action graph."""
+        identifier = EntityIdentifier(
+            self.hierarchy.action_graph,
+            self.hierarchy.get_action_graph_typing())
+        memo_identifier = self.hierarchy.get_entity_identifier()
+        memo = memo_identifier.memo
+        for _ in range(2):
+            for node in self.hierarchy.action_graph.nodes():
+                assert(
+                    memo_identifier.subcomponents(node) ==
+                    identifier.subcomponents(node))
+                assert(
+                    memo_identifier.get_protoform_of(node) ==
+                    identifier.get_protoform_of(node))
+                for meta_type in ["region", "site", "residue", "state"]:
+                    assert(
+                        sorted(memo_identifier.ancestors_of_type(
+                            node, meta_type)) ==
+                        sorted(identifier.ancestors_of_type(
+                            node, meta_type)))
+                    assert(
+                        sorted(memo_identifier.descendants_of_type(
+                            node, meta_type)) ==
+                        sorted(identifier.descendants_of_type(
+                            node, meta_type)))
+        assert(memo.hits == memo.misses)
+
+        # Memoized results are copies
+        memo_identifier.subcomponents(self.gene_id).add("foo")
+        assert("foo" not in memo_identifier.subcomponents(self.gene_id))
+
+        # Only the traversals touching the rewritten nodes are invalidated
+        size = len(memo)
+        new_region = self.hierarchy.add_region(
+            Region("Kinase", 500, 600), self.gene_id)
+        assert(0 < len(memo) < size)
+        memo_identifier = self.hierarchy.get_entity_identifier()
+        assert(new_region in memo_identifier.subcomponents(self.gene_id))
+        assert(
+            memo_identifier.get_protoform_of(new_region) == self.gene_id)
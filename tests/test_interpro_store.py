@@ -0,0 +1,124 @@
+"""Unit testing of the indexed offline InterPro store."""
+import gzip
+import os
+import shutil
+import tempfile
+
+import anatomizer.new_anatomizer as new_anatomizer
+from anatomizer.ipr_store import InterProStore
+
+
+IPR_MATCHES = """<?xml version="1.0"?>
+<interpromatch>
+  <protein id="P00533" name="EGFR_HUMAN">
+    <match id="PF07714" name="Pkinase_Tyr" dbname="PFAM">
+      <ipr id="IPR001245" name="Ser-Thr/Tyr kinase" type="Domain"
+           parent_id="IPR000719"/>
+      <lcn start="712" end="968"/>
+    </match>
+    <match id="SSF56112" name="Kinase-like" dbname="SSF">
+      <lcn start="700" end="990"/>
+    </match>
+    <match id="PS50011" name="PROTEIN_KINASE_DOM" dbname="PROSITE">
+      <ipr id="IPR000719" name="Protein kinase domain" type="Domain"/>
+    </match>
+  </protein>
+  <protein id="P00533-2" name="EGFR_HUMAN"/>
+</interpromatch>
+"""
+
+IPR_SIGNATURES = """<?xml version="1.0"?>
+<interprodb>
+  <interpro id="IPR000719" short_name="Prot_kinase_dom"
+            name="Protein kinase domain"/>
+  <interpro id="IPR001245" short_name="Ser-Thr/Tyr_kinase_cat_dom"
+            name="Serine-threonine/tyrosine-protein kinase, catalytic domain"
+            parent="IPR000719"/>
+</interprodb>
+"""
+
+HGNC_MAPPINGS = """<?xml version="1.0"?>
+<mapping>
+  <entry uniprot_ac="P00533" hgnc_symbol="EGFR" hgnc_id="HGNC:3236">
+    <synonym>ERBB</synonym>
+    <synonym>ERBB1</synonym>
+    <isoform><id>P00533-1</id><length>1210</length><type>canonical</type>
+    </isoform>
+    <isoform><id>P00533-2</id><length>405</length><type>secondary</type>
+    </isoform>
+  </entry>
+</mapping>
+"""
+
+
+class TestInterProStore(object):
+    """Test the import of InterPro files and lookups in the store."""
+
+    def __init__(self):
+        """Write the InterPro files of version 66."""
+        self.local_dir = tempfile.mkdtemp()
+        for name, content in [
+                ("ipr_reviewed_human_match-66.xml.gz", IPR_MATCHES),
+                ("ipr_shortnames-66.xml.gz", IPR_SIGNATURES),
+                ("refs_mapping-66.xml.gz", HGNC_MAPPINGS)]:
+            with gzip.open(os.path.join(self.local_dir, name), "wt") as f:
+                f.write(content)
+
+    def test_store(self):
+        try:
+            path = os.path.join(self.local_dir, "store.sqlite")
+            store = InterProStore.build(
+                path,
+                os.path.join(
+                    self.local_dir, "ipr_reviewed_human_match-66.xml.gz"),
+                os.path.join(self.local_dir, "ipr_shortnames-66.xml.gz"),
+                os.path.join(self.local_dir, "refs_mapping-66.xml.gz"))
+            assert(store.has_protein("P00533-2"))
+            assert(not store.has_protein("P00519"))
+            assert(store.get_protein_by_name("EGFR_HUMAN") == "P00533")
+            matches = store.get_matches("P00533")
+            assert(
+                [m["ipr_id"] for m in matches] ==
+                ["IPR001245", None, "IPR000719"])
+            assert(matches[0]["start"] == 712)
+            assert(matches[2]["start"] is None)
+            assert(store.get_signature("IPR001245")["parent"] == "IPR000719")
+            mapping = store.get_mapping_by_hgnc_symbol("EGFR")
+            assert(mapping["synonyms"] == ["ERBB", "ERBB1"])
+            assert(mapping["isoforms"][0] == {
+                "id": "P00533-1", "length": 1210, "type": "canonical"})
+            assert(store.get_mapping_by_uniprot("P00519") is None)
+            store.close()
+        finally:
+            shutil.rmtree(self.local_dir)
+
+    def test_interpro_load(self):
+        try:
+            new_anatomizer.interpro_load(self.local_dir)
+            assert(os.path.isfile(
+                os.path.join(self.local_dir, "ipr_store-66.sqlite")))
+            assert(new_anatomizer.find_shortname("IPR000719") ==
+                   "Prot_kinase_dom")
+            assert(new_anatomizer.parent_chain("IPR001245") ==
+                   ["IPR001245", "IPR000719"])
+            # Matches without location are ignored
+            features = new_anatomizer.get_ipr_features(
+                "P00533-1", "P00533-1")
+            assert(len(features) == 1)
+            assert(features[0]["ipr_parents"] == ["IPR000719"])
+            assert(features[0]["short_name"] == "Ser-Thr/Tyr_kinase_cat_dom")
+
+            # The store is reused by the subsequent loads
+            os.remove(os.path.join(
+                self.local_dir, "ipr_reviewed_human_match-66.xml.gz"))
+            open(os.path.join(
+                self.local_dir,
+                "ipr_reviewed_human_match-66.xml.gz"), "w").close()
+            new_anatomizer.interpro_load(self.local_dir)
+            assert(new_anatomizer.ipr_store.has_protein("P00533"))
+        finally:
+            if new_anatomizer.ipr_store is not None:
+                new_anatomizer.ipr_store.close()
+            new_anatomizer.ipr_store = None
+            new_anatomizer.ipr_loaded = False
+            shutil.rmtree(self.local_dir)
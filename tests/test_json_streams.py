@@ -0,0 +1,75 @@
+"""Unit testing of streaming of JSON records."""
+import json
+import os
+import tempfile
+
+from kami import Binding, Protoform
+from kami.data_structures.interactions import Interaction
+from kami.utils.json_streams import (iter_json_records, iter_chunks,
+                                     iter_json_object, read_json_value)
+
+
+class TestJSONStreams(object):
+    """Test streaming of JSON lines and JSON arrays."""
+
+    def __init__(self):
+        """Initialize with a list of interaction records."""
+        self.records = [
+            Binding(Protoform("P00533"), Protoform(uniprotid)).to_json()
+            for uniprotid in ["P00519", "P11362", "P19174"]
+        ]
+
+    def _write(self, content):
+        fd, filename = tempfile.mkstemp()
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        return filename
+
+    def test_json_array(self):
+        filename = self._write(json.dumps(self.records, indent=2))
+        result = list(iter_json_records(filename))
+        assert([r for r, _ in result] == self.records)
+
+        # Resume reading after the first record
+        rest = list(iter_json_records(filename, result[0][1]))
+        assert([r for r, _ in rest] == self.records[1:])
+        os.remove(filename)
+
+    def test_json_lines(self):
+        filename = self._write(
+            "\n".join(json.dumps(r) for r in self.records) + "\n")
+        result = list(iter_json_records(filename))
+        assert([r for r, _ in result] == self.records)
+
+        rest = list(iter_json_records(filename, result[1][1]))
+        assert([r for r, _ in rest] == self.records[2:])
+
+        for r, _ in result:
+            assert(isinstance(Interaction.from_json(r), Binding))
+        os.remove(filename)
+
+    def test_object_members(self):
+        records = [
+            {"id": "a",
+             "graph": {"nodes": [{"id": "{[\\\"x"}], "edges": []},
+             "attrs": {"name": "\u00e9 ]}"}},
+            {"graph": [1, -2.5e3, True, None], "id": "b"}
+        ]
+        data = {"meta": {"n": 2}, "records": records, "tail": "x"}
+        filename = self._write(
+            json.dumps(data, indent=1, ensure_ascii=False))
+        items = list(iter_json_object(
+            filename, array_keys=["records"], members=["id", "attrs"]))
+        assert(items[0][:2] == ("meta", {"n": 2}))
+        assert(items[-1][:2] == ("tail", "x"))
+        values = [v for k, v, _, _ in items if k == "records"]
+        assert(values == [
+            {"id": "a", "attrs": records[0]["attrs"]}, {"id": "b"}])
+        spans = [(s, e) for k, _, s, e in items if k == "records"]
+        assert(
+            [read_json_value(filename, s, e) for s, e in spans] == records)
+        os.remove(filename)
+
+    def test_chunks(self):
+        chunks = list(iter_chunks(range(5), 2))
+        assert(chunks == [[0, 1], [2, 3], [4]])
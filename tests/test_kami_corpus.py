@@ -1,11 +1,14 @@
 """Tests related to KamiCorpus data structure."""
-from regraph import (print_graph, get_edge)
+from regraph import (print_graph, get_edge, Rule, NXGraph)
 
 from kami import KamiCorpus
 from kami import (Protoform, Region, Site, Residue,
                   State, RegionActor, SiteActor)
 from kami import Binding, Modification
+from kami import Definition, Product
 from kami.aggregation.identifiers import EntityIdentifier
+from kami.data_structures.definitions import compose_instantiation_rules
+from kami.exceptions import KamiException
 
 
 class TestKamiCorpus(object):
@@ -153,3 +156,360 @@ class TestKamiCorpus(object):
                max(edge["end"]) < 500:
                 assert(
                     (site, region_id) in self.model.action_graph.edges())
+
+    def test_uniprot_index(self):
+        """Test the UniProt AC index of the action graph protoforms."""
+        for protoform in self.model.protoforms():
+            uniprotid = self.model.get_uniprot(protoform)
+            assert(
+                protoform in
+                self.model._ag_index.get_protoforms_by_uniprot(uniprotid))
+            assert(self.model.get_protoform_by_uniprot(uniprotid) == protoform)
+
+        identifier = self.model.get_entity_identifier()
+        assert(identifier.identify_protoform(Protoform("P00533")) is not None)
+        assert(identifier.identify_protoform(Protoform("Q00000")) is None)
+        assert(len(self.model._ag_index.get_protoforms_by_uniprot(
+            "Q00000")) == 0)
+
+        protoform_id = self.model.add_protoform(
+            Protoform("Q00000"), anatomize=False)
+        assert(self.model.get_protoform_by_uniprot("Q00000") == protoform_id)
+
+    def test_type_index(self):
+        """Test the meta-type index of the action graph."""
+        ag_typing = self.model.get_action_graph_typing()
+        counts = self.model.ag_type_counts()
+        for meta_type in ["protoform", "region", "site", "bnd", "mod"]:
+            nodes = set(
+                n for n in self.model.action_graph.nodes()
+                if ag_typing[n] == meta_type)
+            assert(
+                set(self.model._ag_index.nodes_of_type(meta_type)) == nodes)
+            assert(counts.get(meta_type, 0) == len(nodes))
+        assert(
+            set(self.model.protoforms()) ==
+            set(self.model.get_entity_identifier().get_protoforms()))
+
+    def test_nugget_registry(self):
+        """Test the registry of nuggets."""
+        nuggets = [
+            g for g in self.model._hierarchy.graphs()
+            if self.model.is_nugget_graph(g)
+        ]
+        assert(set(self.model.nuggets()) == set(nuggets))
+        for n in nuggets:
+            assert(self.model.get_nugget(n) is
+                   self.model._hierarchy.get_graph(n))
+            assert(self.model.get_nugget_type(n) in ["mod", "bnd"])
+        assert(set(self.model.templates()) == {"mod_template", "bnd_template"})
+
+        model = KamiCorpus.from_json("test", self.model.to_json())
+        assert(set(model.nuggets()) == set(nuggets))
+        for n in nuggets:
+            assert(model.get_nugget_desc(n) == self.model.get_nugget_desc(n))
+
+        n = nuggets[0]
+        self.model.remove_nugget(n)
+        assert(n not in self.model.nuggets())
+        assert(n not in self.model._hierarchy.graphs())
+
+    def test_bulk_ingestion(self):
+        """Test that bulk ingestion matches sequential ingestion."""
+        interactions = [
+            Modification(
+                enzyme=Protoform("P00533"),
+                substrate=Protoform("P11362"),
+                target=Residue("Y", 463, State("phosphorylation", False))),
+            Binding(
+                RegionActor(Protoform("P00519"), Region("SH2")),
+                SiteActor(
+                    Protoform("P11362"),
+                    Site("pY", residues=[
+                        Residue(
+                            "Y", 463, State("phosphorylation", True))]))),
+            Binding(Protoform("P00533"), Protoform("P00519"))
+        ]
+        def _graph_repr(graph):
+            return (
+                {n: graph.get_node(n) for n in graph.nodes()},
+                {(s, t): graph.get_edge(s, t) for s, t in graph.edges()})
+
+        # Both corpora have the same id to compare the nugget ids
+        sequential = KamiCorpus("test")
+        sequential_nuggets = sequential.add_interactions(
+            interactions, anatomize=True)
+
+        report = dict()
+        bulk = KamiCorpus("test")
+        bulk_nuggets = bulk.add_interactions(
+            interactions, anatomize=True, bulk=True, report=report)
+
+        assert(bulk_nuggets == sequential_nuggets)
+        assert(
+            _graph_repr(bulk.action_graph) ==
+            _graph_repr(sequential.action_graph))
+        assert(
+            bulk.get_action_graph_typing() ==
+            sequential.get_action_graph_typing())
+        for nugget_id in bulk_nuggets:
+            assert(
+                _graph_repr(bulk.get_nugget(nugget_id)) ==
+                _graph_repr(sequential.get_nugget(nugget_id)))
+            assert(
+                bulk.get_nugget_typing(nugget_id) ==
+                sequential.get_nugget_typing(nugget_id))
+        for phase in ["nuggets", "protoforms", "bookkeeping", "semantics"]:
+            assert(phase in report)
+        assert(report["nuggets"]["items"] == len(interactions))
+
+    def test_parallel_ingestion(self):
+        """Test parallel generation of nuggets."""
+        interactions = [
+            Modification(
+                enzyme=Protoform("P00533"),
+                substrate=Protoform("P11362"),
+                target=Residue("Y", 463, State("phosphorylation", False))),
+            Binding(
+                RegionActor(Protoform("P00519"), Region("SH2")),
+                Protoform("P11362")),
+            Binding(Protoform("P00533"), Protoform("P00519")),
+            Modification(
+                enzyme=Protoform("P00519"),
+                substrate=Protoform("P00533"),
+                target=Residue("Y", 1173, State("phosphorylation", False)))
+        ]
+        sequential = KamiCorpus("sequential")
+        sequential.add_interactions(interactions, anatomize=False)
+
+        parallel = KamiCorpus("parallel")
+        report = dict()
+        nuggets = parallel.add_interactions(
+            interactions, anatomize=False, processes=2, chunk_size=2,
+            report=report)
+        assert(len(nuggets) == len(interactions))
+        # Only the nugget of the protoform added in the same chunk
+        # is regenerated
+        assert(report == {
+            "generated": 3, "regenerated": 1, "failed": 0, "snapshots": 2})
+        assert(parallel.ag_type_counts() == sequential.ag_type_counts())
+        for protoform in parallel.protoforms():
+            uniprotid = parallel.get_uniprot(protoform)
+            assert(
+                len(parallel._ag_index.get_protoforms_by_uniprot(
+                    uniprotid)) == 1)
+
+        # Known interactions only add action nodes, the snapshot
+        # of the action graph is not refreshed
+        parallel.add_interactions(
+            interactions, anatomize=False, processes=2, chunk_size=2,
+            report=report)
+        assert(report == {
+            "generated": 4, "regenerated": 0, "failed": 0, "snapshots": 1})
+
+    def test_streaming_export(self):
+        """Test streaming export of the corpus."""
+        for filename, compress in [("test_export.json", False),
+                                   ("test_export.json.gz", True)]:
+            self.model.export_json(filename, compress=compress)
+            new_model = KamiCorpus.load_json("test", filename)
+            assert(len(new_model.nuggets()) == len(self.model.nuggets()))
+            assert(new_model.ag_type_counts() == self.model.ag_type_counts())
+
+    def test_lazy_loading(self):
+        """Test lazy loading of nuggets from json."""
+        self.model.export_json("test_export.json")
+        eager_model = KamiCorpus.load_json("test", "test_export.json")
+        lazy_model = KamiCorpus.load_json(
+            "test", "test_export.json", lazy=True)
+        assert(set(lazy_model.nuggets()) == set(eager_model.nuggets()))
+        assert(len(lazy_model._lazy_nuggets) == len(lazy_model.nuggets()))
+        assert(lazy_model.ag_type_counts() == eager_model.ag_type_counts())
+
+        assert(
+            lazy_model.get_protoform_pairwise_interactions() ==
+            eager_model.get_protoform_pairwise_interactions())
+        lazy_model.export_json("test_lazy_export.json")
+        assert(len(lazy_model._lazy_nuggets) == len(lazy_model.nuggets()))
+        eager_model.export_json("test_eager_export.json")
+        assert(
+            KamiCorpus.load_json(
+                "test", "test_lazy_export.json").to_json()["nuggets"] ==
+            KamiCorpus.load_json(
+                "test", "test_eager_export.json").to_json()["nuggets"])
+
+        nugget_id = lazy_model.nuggets()[0]
+        assert(
+            lazy_model.get_nugget_desc(nugget_id) ==
+            eager_model.get_nugget_desc(nugget_id))
+        lazy_nugget = lazy_model.get_nugget(nugget_id)
+        assert(nugget_id not in lazy_model._lazy_nuggets)
+        assert(
+            set(lazy_nugget.nodes()) ==
+            set(eager_model.get_nugget(nugget_id).nodes()))
+        assert(
+            lazy_model.get_nugget_typing(nugget_id) ==
+            eager_model.get_nugget_typing(nugget_id))
+
+        lazy_model.remove_nugget(lazy_model.nuggets()[-1])
+        lazy_model._materialize_nuggets()
+        assert(len(lazy_model._lazy_nuggets) == 0)
+        assert(len(lazy_model.nuggets()) == len(eager_model.nuggets()) - 1)
+
+    def test_snapshot(self):
+        """Test saving and loading binary snapshots of the corpus."""
+        self.model.save_snapshot("test_snapshot.kami")
+        new_model = KamiCorpus.load_snapshot("test_snapshot.kami")
+        assert(new_model._id == self.model._id)
+        assert(set(new_model.nuggets()) == set(self.model.nuggets()))
+        assert(new_model.ag_type_counts() == self.model.ag_type_counts())
+        assert(
+            set(new_model._versioning._revision_graph.nodes()) ==
+            set(self.model._versioning._revision_graph.nodes()))
+        for n in self.model.nuggets():
+            assert(
+                new_model.get_nugget_typing(n) ==
+                self.model.get_nugget_typing(n))
+
+        with open("test_snapshot.kami", "r+b") as f:
+            f.seek(-1, 2)
+            last_byte = f.read(1)
+            f.seek(-1, 2)
+            f.write(bytes([last_byte[0] ^ 0xff]))
+        try:
+            KamiCorpus.load_snapshot("test_snapshot.kami")
+            raise ValueError("Corrupted snapshot was loaded")
+        except KamiException:
+            pass
+
+    def test_interaction_index(self):
+        """Test the index of pairwise interactions between protoforms."""
+        def _pairs(interactions):
+            return set(
+                (s, t, nugget_id, nugget_type)
+                for s, targets in interactions.items()
+                for t, nuggets in targets.items()
+                for nugget_id, nugget_type, _ in nuggets)
+
+        egfr = self.model.get_protoform_by_uniprot("P00533")
+        fgfr1 = self.model.get_protoform_by_uniprot("P11362")
+        abl1 = self.model.get_protoform_by_uniprot("P00519")
+        interactions = self.model.get_protoform_pairwise_interactions()
+        assert(
+            set((s, t, k) for s, t, _, k in _pairs(interactions)) ==
+            {(egfr, fgfr1, "mod"), (abl1, fgfr1, "bnd")})
+        assert(len(self.model.interaction_edges()) == 2)
+
+        nugget_id = self.model.add_interaction(
+            Binding(Protoform("P00519"), Protoform("P00533")),
+            anatomize=False)
+        interactions = self.model.get_protoform_pairwise_interactions()
+        assert((abl1, egfr, nugget_id, "bnd") in _pairs(interactions))
+        assert(len(self.model.interaction_edges()) == 3)
+
+        self.model.remove_nugget(nugget_id)
+        interactions = self.model.get_protoform_pairwise_interactions()
+        assert(nugget_id not in [n for _, _, n, _ in _pairs(interactions)])
+        assert(len(self.model.interaction_edges()) == 2)
+
+    def test_typing_index(self):
+        """Test the reverse index of the typing of nuggets by the AG."""
+        def _check_index(model):
+            for node in model.action_graph.nodes():
+                assert(
+                    set(model.get_mechanism_nuggets(node)) ==
+                    set(model._hierarchy.graphs_typed_by_node(
+                        model._action_graph_id, node)))
+
+        _check_index(self.model)
+        fgfr1 = self.model.get_protoform_by_uniprot("P11362")
+        assert(
+            set(self.model.get_protoform_data(fgfr1)[3]) ==
+            set(self.model.nuggets()))
+
+        self.model.export_json("test_export.json")
+        lazy_model = KamiCorpus.load_json(
+            "test", "test_export.json", lazy=True)
+        fgfr1 = lazy_model.get_protoform_by_uniprot("P11362")
+        assert(
+            set(lazy_model.get_protoform_data(fgfr1)[3]) ==
+            set(lazy_model.nuggets()))
+        assert(len(lazy_model._lazy_nuggets) == len(lazy_model.nuggets()))
+
+        nugget_id = self.model.nuggets()[0]
+        self.model.remove_nugget(nugget_id)
+        _check_index(self.model)
+
+    def test_copy_on_write_instantiation(self):
+        """Test instantiation sharing nugget graphs with the corpus."""
+        model = self.model.instantiate("model", copy_on_write=True)
+        nugget_id = self.model.nuggets()[0]
+        model_nugget_id = "model_" + nugget_id
+        assert(
+            model.get_nugget(model_nugget_id) is
+            self.model.get_nugget(nugget_id))
+        assert(len(model._shared_graphs) == len(self.model.nuggets()))
+
+        nugget_nodes = set(self.model.get_nugget(nugget_id).nodes())
+        node = list(nugget_nodes)[0]
+        pattern = NXGraph()
+        pattern.add_node(node)
+        rule = Rule.from_transform(pattern)
+        rule.inject_remove_node(node)
+        model.rewrite(model_nugget_id, rule)
+        assert(model_nugget_id not in model._shared_graphs)
+        assert(len(model._shared_graphs) == len(self.model.nuggets()) - 1)
+        assert(set(self.model.get_nugget(nugget_id).nodes()) == nugget_nodes)
+        assert(node not in model.get_nugget(model_nugget_id).nodes())
+
+        copied_model = self.model.instantiate("copied_model")
+        assert(len(copied_model._shared_graphs) == 0)
+        assert(
+            copied_model.get_nugget("copied_model_" + nugget_id) is not
+            self.model.get_nugget(nugget_id))
+
+    def test_parallel_clean_up(self):
+        """Test the clean-up of nuggets analysed by worker processes."""
+        # The binding nugget of the product without SH2 is cleaned-up
+        definition = Definition(
+            Protoform("P00519"),
+            [Product("A"),
+             Product("B", removed_components={"regions": [Region("SH2")]})])
+        shared_nugget = [
+            n for n in self.model.nuggets() if self.model.is_bnd_nugget(n)][0]
+        shared_nodes = set(self.model.get_nugget(shared_nugget).nodes())
+        results = []
+        for processes in [None, 2]:
+            model = self.model.instantiate(
+                "model", [definition], copy_on_write=True,
+                processes=processes)
+            results.append({
+                nugget_id: (
+                    set(model.get_nugget(nugget_id).nodes()),
+                    set(model.get_nugget(nugget_id).edges()),
+                    model.get_nugget_typing(nugget_id))
+                for nugget_id in model.nuggets()
+            })
+        assert(results[0] == results[1])
+        # Nugget graphs shared with the corpus are not modified
+        assert(
+            set(self.model.get_nugget(shared_nugget).nodes()) ==
+            shared_nodes)
+
+    def test_compose_instantiation_rules(self):
+        """Test composition of rules with (non-)disjoint instances."""
+        def _clone_rule(node):
+            pattern = NXGraph()
+            pattern.add_node("x")
+            rule = Rule.from_transform(pattern)
+            rule.inject_clone_node("x")
+            return (rule, {"x": node})
+
+        rules = [_clone_rule("a"), _clone_rule("b"), _clone_rule("a")]
+        composed = compose_instantiation_rules(rules)
+        assert(len(composed) == 2)
+        rule, instance = composed[0]
+        assert(set(instance.values()) == {"a", "b"})
+        assert(len(rule.lhs.nodes()) == 2)
+        assert(len(rule.rhs.nodes()) == 4)
+        assert(composed[1] == rules[2])
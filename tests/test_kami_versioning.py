@@ -1,5 +1,7 @@
 """."""
-from kami import KamiCorpus, Protoform, Region, Site, Residue, State
+from kami import (KamiCorpus, Protoform, Region, Site, Residue, State,
+                  Binding)
+from kami.data_structures.revisions import RevisionPolicy
 
 from tests.resources import (TEST_CORPUS, TEST_MODEL,
                              TEST_DEFINITIONS,
@@ -36,3 +38,111 @@ class TestKamiVersioning(object):
         self.corpus.add_state(State("phosphorylation", True), residue_node)
 
         # self.corpus._versioning.print_history()
+
+    def test_coalesced_revisions(self):
+        corpus = KamiCorpus("test")
+        n_revisions = len(corpus._versioning._revision_graph.nodes())
+        with corpus.operation("Added the protoforms"):
+            corpus.add_protoform(Protoform("P00533"), anatomize=False)
+            corpus.add_protoform(Protoform("P00519"), anatomize=False)
+        assert(
+            len(corpus._versioning._revision_graph.nodes()) ==
+            n_revisions + 1)
+        assert(len(corpus.protoforms()) == 2)
+
+        head = corpus._versioning._heads["master"]
+        corpus.add_protoform(Protoform("P04049"), anatomize=False)
+        corpus.rollback(head)
+        assert(len(corpus.protoforms()) == 2)
+
+    def test_revision_checkpoints(self):
+        corpus = KamiCorpus(
+            "test",
+            revision_policy=RevisionPolicy(
+                checkpoint_interval=2, retention=2))
+        uniprotids = ["P00533", "P00519", "P04049", "P31749", "Q9Y243"]
+        states = dict()
+        for i, uniprotid in enumerate(uniprotids):
+            corpus.add_protoform(Protoform(uniprotid), anatomize=False)
+            states[corpus._versioning._heads["master"]] = (
+                set(corpus.action_graph.nodes()), set(uniprotids[:i + 1]))
+        revision_graph = corpus._versioning._revision_graph
+        assert(len(revision_graph.nodes()) < 6)
+        initial = corpus._versioning.initial_commit()
+        assert(revision_graph.nodes[initial]["checkpoint"])
+
+        # Rollback to the oldest retained revision
+        head = corpus._versioning._heads["master"]
+        revision = [
+            r for r in states
+            if r in revision_graph.nodes() and r != head][0]
+        corpus.rollback(revision)
+        nodes, rollback_uniprotids = states[revision]
+        assert(set(corpus.action_graph.nodes()) == nodes)
+        assert(
+            set(corpus.get_uniprot(p) for p in corpus.protoforms()) ==
+            rollback_uniprotids)
+        for uniprotid in uniprotids:
+            assert(
+                (corpus.get_protoform_by_uniprot(uniprotid) is not None) ==
+                (uniprotid in rollback_uniprotids))
+
+    def test_prune_with_branches(self):
+        corpus = KamiCorpus(
+            "test",
+            revision_policy=RevisionPolicy(
+                checkpoint_interval=100, retention=1))
+        corpus.add_protoform(Protoform("P00533"), anatomize=False)
+        corpus.new_branch("side")
+        corpus.switch_branch("master")
+        corpus.add_protoform(Protoform("P00519"), anatomize=False)
+        corpus.checkpoint()
+        corpus.add_protoform(Protoform("P04049"), anatomize=False)
+
+        # The head of the branch 'side' does not descend from
+        # the checkpoint, the revisions are not pruned
+        revision_graph = corpus._versioning._revision_graph
+        revisions = set(revision_graph.nodes())
+        corpus.checkpoint()
+        assert(set(revision_graph.nodes()) == revisions)
+        assert("side" in corpus._versioning.branches())
+
+    def test_transaction(self):
+        corpus = KamiCorpus("test")
+        protoform = corpus.add_protoform(Protoform("P00533"), anatomize=False)
+        n_revisions = len(corpus._versioning._revision_graph.nodes())
+
+        with corpus.transaction("Added the regions") as transaction:
+            region1 = transaction.add_node(
+                "region", {"name": {"Protein kinase"}}, "region")
+            region2 = transaction.add_node(
+                "region", {"name": {"Kinase"}}, "region")
+            transaction.add_edge(region1, protoform, {"start": 100})
+            transaction.add_edge(region2, protoform, {"end": 200})
+            region = transaction.merge_nodes([region1, region2])
+        region = transaction.get_node_id(region)
+        assert(
+            len(corpus._versioning._revision_graph.nodes()) ==
+            n_revisions + 1)
+        assert(corpus.get_attached_regions(protoform) == [region])
+        edge_attrs = corpus.action_graph.get_edge(region, protoform)
+        assert("start" in edge_attrs and "end" in edge_attrs)
+
+        graphs = set(corpus._hierarchy.graphs())
+        try:
+            with corpus.transaction("Failed update") as transaction:
+                transaction.remove_node(region)
+                corpus.add_site(Site("Lala"), protoform)
+                corpus.add_interaction(
+                    Binding(Protoform("P00533"), Protoform("P00519")),
+                    anatomize=False)
+                raise ValueError()
+        except ValueError:
+            pass
+        assert(
+            len(corpus._versioning._revision_graph.nodes()) ==
+            n_revisions + 1)
+        assert(corpus.get_attached_regions(protoform) == [region])
+        assert(len(corpus.get_attached_sites(protoform)) == 0)
+        assert(set(corpus._hierarchy.graphs()) == graphs)
+        assert(len(corpus.nuggets()) == 0)